@@ -0,0 +1,3 @@
+"""
+Performance benchmarks, run them from the repository root, e.g. python -m benchmarks.normalizer
+"""
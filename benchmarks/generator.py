@@ -0,0 +1,215 @@
+"""
+Seeded generator of synthetic MediaWiki, backend and Pandora log entries and raw SQL files
+
+The number of distinct query kinds (cardinality) and how unevenly entries are spread
+across them (Zipf-like skew, 0 means uniform) are configurable.
+"""
+from __future__ import unicode_literals
+
+import random
+
+from bisect import bisect
+from datetime import datetime, timedelta
+
+TEMPLATES = (
+    "SELECT /* {method} 10.8.{num}.{num} */ {table}_id,{table}_title FROM `{table}` "
+    "WHERE {table}_namespace = '{num}' AND {table}_title = '{word}' LIMIT 1",
+    "SELECT /* {method} 10.8.{num}.{num} */ * FROM `{table}` "
+    "WHERE user_id = {num} AND wiki_id IN ({num}, {num}, {num}) ORDER BY id DESC",
+    "INSERT /* {method} */ INTO `{table}` (wiki_id, page_id, state) "
+    "VALUES ({num}, {num}, '{word}'),({num}, {num}, 'new')",
+    "UPDATE /* {method} 10.8.{num}.{num} */ `{table}` SET {table}_touched = '{num}' "
+    "WHERE {table}_id = {num}",
+    "DELETE /* {method} */ FROM `{table}` WHERE {table}_id = {num} AND {table}_name = '{word}'",
+    "SELECT /* {method} */ count(*) FROM `{table}` WHERE {table}_page = {num}",
+)
+
+TABLES = (
+    'page', 'revision', 'user', 'wall_notification', 'image_review', 'comments_index',
+    'page_wikia_props', 'events_local_users', 'city_list', 'wikia_tasks',
+)
+
+WORDS = ('Main_Page', 'Foo', 'Bar_test', 'Special:Search', 'new', 'Lorem ipsum')
+HOSTS = ('ap-s10', 'ap-s21', 'cron-s1', 'task-s3', 'job-s5')
+DATABASES = ('wikicities', 'specials', 'dataware', 'muppet', 'statsdb')
+
+# timestamps of generated entries are spread over one hour before this date
+NOW = datetime(2018, 11, 20, 12, 0, 0)
+
+
+class SyntheticLog(object):
+    """
+    Generates log entries for a fixed set of query kinds picked with a Zipf-like distribution
+    """
+    def __init__(self, kinds=100, skew=1.0, seed=42):
+        """
+        :type kinds int
+        :type skew float
+        :type seed int
+        """
+        self._random = random.Random(seed)
+        self.kinds = [self._make_kind(index) for index in range(kinds)]
+
+        # cumulative weights of query kinds, the first ones are the most frequent
+        self._weights = []
+        total = 0.
+
+        for rank in range(1, kinds + 1):
+            total += 1. / rank ** skew
+            self._weights.append(total)
+
+    def _make_kind(self, index):
+        """
+        :type index int
+        :rtype: dict
+        """
+        return {
+            'template': TEMPLATES[index % len(TEMPLATES)],
+            'table': TABLES[index % len(TABLES)] if index < len(TABLES)
+                     else '{}_{}'.format(TABLES[index % len(TABLES)], index),
+            'method': 'Class{}::method{}'.format(index // 3, index % 3),
+            'database': DATABASES[index % len(DATABASES)],
+            'host': HOSTS[index % len(HOSTS)],
+            'time': self._random.uniform(0.1, 50.),  # typical query time [ms]
+        }
+
+    def _pick(self):
+        """
+        :rtype: dict
+        """
+        return self.kinds[bisect(self._weights, self._random.random() * self._weights[-1])]
+
+    def _sql(self, kind):
+        """
+        :type kind dict
+        :rtype: str
+        """
+        rand = self._random
+
+        # every {num} gets a different value
+        parts = kind['template'].split('{num}')
+        sql = ''.join(
+            part + (str(rand.randint(0, 100000)) if index < len(parts) - 1 else '')
+            for (index, part) in enumerate(parts)
+        )
+
+        return sql.format(method=kind['method'], table=kind['table'], word=rand.choice(WORDS))
+
+    def _timestamp(self):
+        """
+        :rtype: str
+        """
+        value = NOW - timedelta(seconds=self._random.uniform(0, 3600))
+        return value.strftime('%Y-%m-%dT%H:%M:%S.') + '{:03d}Z'.format(value.microsecond // 1000)
+
+    def _context(self, kind, method):
+        """
+        :type kind dict
+        :type method str
+        :rtype: dict
+        """
+        return {
+            'method': method,
+            'db_name': kind['database'],
+            'server_role': 'master' if self._random.random() < 0.1 else 'slave',
+            'num_rows': self._random.randint(0, 50),
+            'elapsed': self._random.expovariate(1. / kind['time']) / 1000.,  # [sec]
+        }
+
+    def mediawiki_entry(self):
+        """
+        :rtype: dict
+        """
+        kind = self._pick()
+
+        return {
+            '@message': self._sql(kind),
+            '@context': self._context(kind, '{} (from Foo::bar)'.format(kind['method'])),
+            '@fields': {'wiki_dbname': self._random.choice(DATABASES)},
+            '@source_host': kind['host'],
+            '@timestamp': self._timestamp(),
+        }
+
+    def backend_entry(self):
+        """
+        :rtype: dict
+        """
+        kind = self._pick()
+        method = 'DB.pm line 171 via {}.pl line {}'.format(
+            kind['table'], len(kind['method']))
+
+        return {
+            '@message': self._sql(kind),
+            '@context': self._context(kind, method),
+            '@source_host': kind['host'],
+            '@timestamp': self._timestamp(),
+        }
+
+    def pandora_entry(self):
+        """
+        :rtype: dict
+        """
+        kind = self._pick()
+
+        return {
+            'raw_query': self._sql(kind),
+            'container_name': kind['database'],
+            'kubernetes': {'host': 'k8s-worker-s{}'.format(self._random.randint(1, 9))},
+            'rows_number': self._random.randint(0, 50),
+            'execution_time': self._random.expovariate(1. / kind['time']),
+            '@timestamp': self._timestamp(),
+        }
+
+    def sql_line(self):
+        """
+        :rtype: str
+        """
+        return self._sql(self._pick())
+
+    def slow_log_entry(self):
+        """
+        Returns lines of a single MySQL slow query log entry
+
+        :rtype: str
+        """
+        kind = self._pick()
+        context = self._context(kind, kind['method'])
+        timestamp = NOW - timedelta(seconds=self._random.uniform(0, 3600))
+
+        return (
+            '# Time: {time}Z\n'
+            '# User@Host: wikia[wikia] @ {host} [10.8.1.{ip}]  Id: {id}\n'
+            '# Query_time: {elapsed:.6f}  Lock_time: 0.000100 Rows_sent: {rows}  '
+            'Rows_examined: {examined}\n'
+            'use {database};\n'
+            'SET timestamp={timestamp};\n'
+            '{sql};\n'
+        ).format(
+            time=timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f'), host=kind['host'],
+            ip=self._random.randint(1, 254), id=self._random.randint(1, 100000),
+            elapsed=context['elapsed'], rows=context['num_rows'],
+            examined=context['num_rows'] * 10, database=kind['database'],
+            timestamp=(timestamp - datetime(1970, 1, 1)).total_seconds(),
+            sql=self._sql(kind).replace(' WHERE ', '\nWHERE '),  # multi-line statements
+        )
+
+    def entries(self, source, count):
+        """
+        :type source str
+        :arg source: mediawiki, backend or pandora
+        :type count int
+        :rtype: list[dict]
+        """
+        factory = getattr(self, '{}_entry'.format(source))
+        return [factory() for _ in range(count)]
+
+    def write_sql_file(self, path, count):
+        """
+        Writes a raw SQL log file (a single query per line)
+
+        :type path str
+        :type count int
+        """
+        with open(path, 'wt') as handler:
+            for _ in range(count):
+                handler.write(self.sql_line() + '\n')
@@ -0,0 +1,151 @@
+"""
+Measures cold-start latency of the command line tool
+
+Each run starts a fresh interpreter with "python -X importtime", so the cumulative import time
+of scripts.query_digest (and modules it pulls in) is reported, together with the wall time
+of the whole process digesting a tiny SQL file.
+
+Usage:
+  import_time [ --runs=<runs> ] [ --modules=<modules> ] [ --json=<json> ] [ --compare=<compare> ]
+
+Options:
+  --runs=<runs>          Number of interpreter runs, the median is reported [default: 10]
+  --modules=<modules>    Number of the slowest imported modules to list [default: 10]
+  --json=<json>          Save results to given JSON file
+  --compare=<compare>    Compare the results with the ones saved in given JSON file
+
+Example:
+  python -m benchmarks.import_time --json=before.json
+  python -m benchmarks.import_time --json=after.json --compare=before.json
+"""
+from __future__ import print_function
+
+import platform
+import subprocess
+import sys
+
+from collections import OrderedDict, defaultdict
+from os.path import abspath, dirname, join
+from timeit import default_timer
+
+import docopt
+
+from .suite import get_commit, save_results
+
+ROOT_DIR = dirname(dirname(abspath(__file__)))
+
+MODULE = 'scripts.query_digest'
+
+# the smallest possible --file run
+RUN_CODE = (
+    'from io import StringIO; from scripts.query_digest import main; '
+    'main(arguments={{"--file": "{}", "--csv": True}}, output=StringIO())'
+).format(join(ROOT_DIR, 'test', 'fixtures', 'queries.sql'))
+
+
+def parse_importtime(stderr):
+    """
+    Returns cumulative import time of every module [us] from "python -X importtime" output
+
+    :type stderr str
+    :rtype: dict
+    """
+    times = dict()
+
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+
+        (_, cumulative, name) = line[12:].split('|')
+
+        try:
+            times[name.strip()] = int(cumulative)
+        except ValueError:  # the header line
+            continue
+
+    return times
+
+
+def median(values):
+    """
+    :type values list
+    :rtype: float
+    """
+    values = sorted(values)
+    middle = len(values) // 2
+
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.
+
+
+def measure(runs):
+    """
+    Returns median import time of the tool [ms], cumulative import times of modules [ms]
+    and median wall time of a full run [ms]
+
+    :type runs int
+    :rtype: tuple
+    """
+    modules = defaultdict(list)
+    wall_times = []
+
+    for _ in range(runs):
+        process = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(MODULE)],
+            cwd=ROOT_DIR, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        (_, stderr) = process.communicate()
+
+        for (name, value) in parse_importtime(stderr.decode('utf8')).items():
+            modules[name].append(value / 1000.)
+
+        start = default_timer()
+        subprocess.check_call([sys.executable, '-c', RUN_CODE], cwd=ROOT_DIR,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        wall_times.append(1000. * (default_timer() - start))
+
+    modules = dict((name, median(values)) for (name, values) in modules.items())
+
+    return modules.get(MODULE), modules, median(wall_times)
+
+
+def main():
+    """
+    Runs the import time benchmark
+    """
+    arguments = docopt.docopt(__doc__)
+    runs = int(arguments['--runs'])
+
+    (import_time, modules, wall_time) = measure(runs)
+
+    print('{} import: {:.1f} ms, --file run: {:.1f} ms (median of {} runs)'.format(
+        MODULE, import_time, wall_time, runs))
+
+    # top-level packages only, their cumulative times include submodules
+    slowest = sorted(
+        (name for name in modules if name != MODULE and '.' not in name),
+        key=modules.get, reverse=True)[:int(arguments['--modules'])]
+
+    print('\nThe slowest top-level imports:')
+
+    for name in slowest:
+        print('  {:<30} {:>8.1f} ms'.format(name, modules[name]))
+
+    results = OrderedDict([
+        ('commit', get_commit()),
+        ('python', platform.python_version()),
+        ('import_ms', import_time),
+        ('run_ms', wall_time),
+        ('modules_ms', OrderedDict((name, modules[name]) for name in slowest)),
+    ])
+
+    previous = save_results(results, arguments)
+
+    if previous is not None:
+        for key in ('import_ms', 'run_ms'):
+            print('  {:<10} {:>8.1f} ms -> {:>8.1f} ms ({:+.1f}%)'.format(
+                key, previous[key], results[key],
+                100. * (results[key] - previous[key]) / previous[key]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Compares lines/sec of SQL normalizers (sql_metadata's generalize_sql vs the fast fingerprinter)
+
+Usage: python -m benchmarks.normalizer [ <lines> ]
+"""
+from __future__ import print_function
+
+import sys
+
+from timeit import default_timer
+
+from digest.queries import NORMALIZERS
+
+from .generator import SyntheticLog
+
+
+def generate_queries(lines, seed=42):
+    """
+    :type lines int
+    :type seed int
+    :rtype: list[str]
+    """
+    log = SyntheticLog(seed=seed)
+    return [log.sql_line() for _ in range(lines)]
+
+
+def measure(func, queries):
+    """
+    :type func (str) -> str
+    :type queries list[str]
+    :rtype: float
+    """
+    start = default_timer()
+
+    for query in queries:
+        func(query)
+
+    return len(queries) / (default_timer() - start)
+
+
+def main():
+    """
+    Runs the benchmark
+    """
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    queries = generate_queries(lines)
+
+    rates = dict((name, measure(func, queries)) for (name, func) in sorted(NORMALIZERS.items()))
+
+    for name, rate in sorted(rates.items()):
+        print('{:<8} {:>12,.0f} lines/sec'.format(name, rate))
+
+    print('speedup  {:>12.2f}x'.format(rates['fast'] / rates['compat']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""
+Times every stage of the digest pipeline on synthetic logs
+
+Stages are run one after another on materialized data, so that their costs can be told apart:
+reading a raw SQL file, parsing a MySQL slow query log, normalization of each kind of log entries,
+filtering, aggregation, calculating the results, sorting and each output formatter.
+
+Usage:
+  suite [ --lines=<lines> ] [ --kinds=<kinds> ] [ --skew=<skew> ]
+    [ --seed=<seed> ] [ --normalizer=<normalizer> ] [ --json=<json> ] [ --compare=<compare> ]
+
+Options:
+  --lines=<lines>             Number of entries generated for each source [default: 100000]
+  --kinds=<kinds>             Number of distinct query kinds [default: 1000]
+  --skew=<skew>               Zipf exponent of query kinds distribution, 0 is uniform [default: 1.0]
+  --seed=<seed>               Random generator seed [default: 42]
+  --normalizer=<normalizer>   SQL normalizer to use: compat or fast [default: compat]
+  --json=<json>               Save results to given JSON file
+  --compare=<compare>         Compare the results with the ones saved in given JSON file
+
+Example:
+  python -m benchmarks.suite --json=before.json
+  python -m benchmarks.suite --json=after.json --compare=before.json
+"""
+from __future__ import print_function
+
+import json
+import platform
+import subprocess
+
+from collections import OrderedDict
+from functools import partial
+from io import StringIO
+from operator import itemgetter
+from os import close, unlink
+from tempfile import mkstemp
+from timeit import default_timer
+
+import docopt
+from tabulate import tabulate
+
+from digest.aggregate import QueryAggregator
+from digest.columnar import ColumnarAggregator, is_available as numpy_available
+from digest.profile import peak_rss
+from digest.output import write_csv, write_data_flow, write_simple, write_sql_log, write_table
+from digest.queries import filter_query, iter_file_queries, normalize_backend_entry, \
+    normalize_file_entry, normalize_mediawiki_entry, normalize_pandora_entry, set_normalizer, \
+    iter_slow_log_queries, normalize_slow_log_entry
+
+from .generator import SyntheticLog
+
+OUTPUTS = (
+    ('table', write_table),
+    ('csv', write_csv),
+    ('simple', write_simple),
+    ('data_flow', write_data_flow),
+    ('sql_log', write_sql_log),
+)
+
+
+def normalize_all(normalize_func, entries):
+    """
+    :type normalize_func (object) -> dict
+    :type entries list
+    :rtype: list[dict]
+    """
+    return [normalize_func(entry) for entry in entries]
+
+
+def get_commit():
+    """
+    :rtype: str|None
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Suite(object):  # pylint: disable=too-few-public-methods
+    """
+    Runs stages and collects their timings
+    """
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    def run(self, name, func, items):
+        """
+        Runs given stage and returns its result
+
+        :type name str
+        :type func () -> object
+        :type items int
+        :arg items: number of items processed by the stage
+        :rtype: object
+        """
+        start = default_timer()
+        result = func()
+        elapsed = default_timer() - start
+
+        self.stages[name] = OrderedDict([
+            ('seconds', round(elapsed, 6)),
+            ('items', items),
+            ('items_per_sec', round(items / elapsed) if elapsed > 0 else None),
+            ('peak_rss_kb', peak_rss()),
+        ])
+
+        print('{:<24} {:>10.3f} s {:>12} items/sec'.format(
+            name, elapsed, self.stages[name]['items_per_sec']))
+
+        return result
+
+
+def run_suite(lines, kinds, skew, seed):  # pylint: disable=too-many-locals
+    """
+    :type lines int
+    :type kinds int
+    :type skew float
+    :type seed int
+    :rtype: Suite
+    """
+    log = SyntheticLog(kinds=kinds, skew=skew, seed=seed)
+    suite = Suite()
+
+    (handle, sql_file) = mkstemp(suffix='.sql')
+    close(handle)
+
+    try:
+        log.write_sql_file(sql_file, lines)
+
+        raw = suite.run('read', lambda: list(iter_file_queries(sql_file)), lines)
+
+        with open(sql_file, 'wt') as handler:
+            handler.writelines(log.slow_log_entry() for _ in range(lines))
+
+        slow_log = suite.run(
+            'parse_slow_log', lambda: list(iter_slow_log_queries(sql_file)), lines)
+    finally:
+        unlink(sql_file)
+
+    sources = [
+        ('file', raw, normalize_file_entry),
+        ('slow_log', slow_log, normalize_slow_log_entry),
+        ('mediawiki', log.entries('mediawiki', lines), normalize_mediawiki_entry),
+        ('backend', log.entries('backend', lines), normalize_backend_entry),
+        ('pandora', log.entries('pandora', lines), normalize_pandora_entry),
+    ]
+
+    entries = []
+
+    for (name, raw, normalize) in sources:
+        normalized = suite.run(
+            'normalize_{}'.format(name), partial(normalize_all, normalize, raw), len(raw))
+
+        # file and Elasticsearch sources are never digested together
+        if name not in ('file', 'slow_log'):
+            entries += normalized
+
+    entries = suite.run('filter', lambda: list(filter(filter_query, entries)), len(entries))
+
+    aggregator = suite.run(
+        'aggregate', lambda: QueryAggregator(with_metadata=True).update(entries), len(entries))
+
+    if numpy_available():
+        suite.run('aggregate_numpy', lambda: ColumnarAggregator().update(entries), len(entries))
+
+    data = suite.run(
+        'results', lambda: [entry for (_, entry) in aggregator.results()], len(aggregator))
+
+    data = suite.run(
+        'sort', lambda: sorted(data, key=itemgetter('time_sum'), reverse=True), len(data))
+
+    # --top: partial sort, stats are calculated for the top query kinds only
+    suite.run('results_top_100', lambda: list(aggregator.results(top=100)), len(aggregator))
+
+    for (name, writer) in OUTPUTS:
+        suite.run(
+            'output_{}'.format(name), partial(writer, StringIO(), data, 'Benchmark'), len(data))
+
+    return suite
+
+
+def compare(stages, previous):
+    """
+    Prints items/sec change of each stage compared to the previous results
+
+    :type stages dict
+    :type previous dict
+    """
+    rows = []
+
+    for (name, stage) in stages.items():
+        before = previous.get(name, {}).get('items_per_sec')
+        after = stage['items_per_sec']
+
+        rows.append(OrderedDict([
+            ('stage', name),
+            ('before', before),
+            ('after', after),
+            ('change', '{:+.1f}%'.format(100. * (after - before) / before)
+                       if before and after else ''),
+        ]))
+
+    print(tabulate(rows, headers='keys'))
+
+
+def save_results(results, arguments):
+    """
+    Saves results to --json file and returns the ones loaded from --compare file (if given)
+
+    :type results dict
+    :type arguments dict
+    :rtype: dict|None
+    """
+    if arguments['--json']:
+        with open(arguments['--json'], 'wt') as handler:
+            json.dump(results, handler, indent=2)
+
+    if not arguments['--compare']:
+        return None
+
+    with open(arguments['--compare'], 'rt') as handler:
+        previous = json.load(handler)
+
+    print('\nCompared to {} ({}):'.format(arguments['--compare'], previous.get('commit')))
+    return previous
+
+
+def main():
+    """
+    Runs the benchmark suite
+    """
+    arguments = docopt.docopt(__doc__)
+
+    params = OrderedDict([
+        ('lines', int(arguments['--lines'])),
+        ('kinds', int(arguments['--kinds'])),
+        ('skew', float(arguments['--skew'])),
+        ('seed', int(arguments['--seed'])),
+        ('normalizer', arguments['--normalizer']),
+    ])
+
+    print('Running benchmark suite: {}'.format(json.dumps(params)))
+
+    set_normalizer(params['normalizer'])
+    suite = run_suite(params['lines'], params['kinds'], params['skew'], params['seed'])
+
+    results = OrderedDict([
+        ('commit', get_commit()),
+        ('python', platform.python_version()),
+        ('params', params),
+        ('peak_rss_kb', peak_rss()),
+        ('stages', suite.stages),
+    ])
+
+    print('Peak RSS: {} kB'.format(results['peak_rss_kb']))
+
+    previous = save_results(results, arguments)
+
+    if previous is not None:
+        compare(suite.stages, previous.get('stages', {}))
+
+
+if __name__ == '__main__':
+    main()
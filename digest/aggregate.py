@@ -0,0 +1,258 @@
+"""
+Streaming, single-pass aggregation of normalized log entries
+"""
+from collections import OrderedDict
+from heapq import nlargest
+
+from .math import QuantileSketch
+from .query_metadata import get_query_metadata
+
+# entry fields that are specific to a single log line and are not reported
+ENTRY_SPECIFIC_FIELDS = ('time', 'rows', 'from_master', 'timestamp')
+
+
+def entry_key(entry):
+    """
+    Returns the key normalized entries are grouped by (method + source host)
+
+    :type entry dict
+    :rtype: str
+    """
+    return '{}-{}'.format(entry.get('method'), entry.get('source_host'))
+
+
+class QueryStats(object):
+    """
+    Running statistics for a single kind of query
+    """
+    __slots__ = ('entry', 'count', 'time_sum', 'rows_sum', 'times', 'rows', 'metadata')
+
+    def __init__(self, entry):
+        """
+        :type entry dict
+        """
+        # keep the first entry only as a template for the reported row
+        self.entry = OrderedDict(
+            (key, value) for (key, value) in entry.items()
+            if key not in ENTRY_SPECIFIC_FIELDS
+        )
+
+        self.count = 0
+        self.time_sum = 0
+        self.rows_sum = 0
+
+        # bounded-size quantile sketches used to calculate medians and percentiles
+        self.times = QuantileSketch()
+        self.rows = QuantileSketch()
+
+        # (kind, tables) tuple, see QueryAggregator's with_metadata
+        self.metadata = None
+
+    def add(self, entry):
+        """
+        :type entry dict
+        """
+        time = entry.get('time', 0)
+        rows = entry.get('rows', 0)
+
+        self.count += 1
+        self.time_sum += time
+        self.rows_sum += rows
+
+        self.times.add(time)
+        self.rows.add(rows)
+
+    def merge(self, other):
+        """
+        :type other QueryStats
+        """
+        self.count += other.count
+        self.time_sum += other.time_sum
+        self.rows_sum += other.rows_sum
+
+        self.times.merge(other.times)
+        self.rows.merge(other.rows)
+
+        if self.metadata is None:
+            self.metadata = other.metadata
+
+    def to_state(self):
+        """
+        Returns JSON-serializable state of query stats
+
+        :rtype: dict
+        """
+        return {
+            'entry': list(self.entry.items()),
+            'count': self.count,
+            'time_sum': self.time_sum,
+            'rows_sum': self.rows_sum,
+            'times': self.times.to_state(),
+            'rows': self.rows.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Restores query stats from the state returned by to_state()
+
+        :type state dict
+        :rtype: QueryStats
+        """
+        stats = cls(OrderedDict(state['entry']))
+        stats.count = state['count']
+        stats.time_sum = state['time_sum']
+        stats.rows_sum = state['rows_sum']
+        stats.times = QuantileSketch.from_state(state['times'])
+        stats.rows = QuantileSketch.from_state(state['rows'])
+
+        return stats
+
+    def as_dict(self, total):
+        """
+        :type total int
+        :rtype: OrderedDict
+        """
+        ret = self.entry.copy()
+
+        ret['count'] = self.count
+        ret['percentage'] = '{:.2f}%'.format(100. * self.count / total)
+
+        ret['time_sum'] = self.time_sum
+        ret['time_median'] = self.times.quantile(0.5)
+        ret['time_p95'] = self.times.quantile(0.95)
+        ret['time_p99'] = self.times.quantile(0.99)
+
+        ret['rows_sum'] = self.rows_sum
+        ret['rows_median'] = self.rows.quantile(0.5)
+        ret['rows_p95'] = self.rows.quantile(0.95)
+
+        return ret
+
+
+class QueryAggregator(object):
+    """
+    Consumes normalized entries one by one and keeps running stats per query kind only.
+
+    Memory usage grows with the number of distinct query kinds, not with the number of entries.
+
+    With with_metadata set, query kind and tables are extracted once per query kind
+    during the aggregation (i.e. in worker processes when they are used).
+    """
+    def __init__(self, key_func=entry_key, with_metadata=False):
+        """
+        :type key_func (dict) -> str
+        :type with_metadata bool
+        """
+        self._key_func = key_func
+        self._with_metadata = with_metadata
+        self._stats = OrderedDict()
+        self.total = 0
+
+    def __len__(self):
+        return len(self._stats)
+
+    def add(self, entry):
+        """
+        :type entry dict
+        """
+        key = self._key_func(entry)
+        stats = self._stats.get(key)
+
+        if stats is None:
+            stats = self._stats[key] = QueryStats(entry)
+
+            if self._with_metadata:
+                try:
+                    stats.metadata = get_query_metadata(entry.get('query'))
+                except ValueError:
+                    # it will be reported when the output is generated
+                    pass
+
+        stats.add(entry)
+        self.total += 1
+
+    def update(self, entries):
+        """
+        :type entries collections.Iterable[dict]
+        :rtype: QueryAggregator
+        """
+        for entry in entries:
+            self.add(entry)
+
+        return self
+
+    def merge(self, other):
+        """
+        Fold the state of another aggregator into this one
+
+        :type other QueryAggregator
+        :rtype: QueryAggregator
+        """
+        for key, stats in other._stats.items():  # pylint: disable=protected-access
+            own = self._stats.get(key)
+
+            if own is None:
+                self._stats[key] = stats
+            else:
+                own.merge(stats)
+
+        self.total += other.total
+        return self
+
+    def to_state(self):
+        """
+        Returns JSON-serializable state of the aggregator
+
+        :rtype: dict
+        """
+        return {
+            'total': self.total,
+            'stats': [(key, stats.to_state()) for (key, stats) in self._stats.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Restores the aggregator from the state returned by to_state()
+
+        :type state dict
+        :rtype: QueryAggregator
+        """
+        # pylint: disable=protected-access
+        aggregator = cls()
+        aggregator.total = state['total']
+
+        for key, stats in state['stats']:
+            aggregator._stats[key] = QueryStats.from_state(stats)
+
+        return aggregator
+
+    def query_metadata(self):
+        """
+        Returns (kind, tables) tuples extracted during the aggregation keyed by normalized query
+
+        :rtype: dict
+        """
+        return dict(
+            (stats.entry.get('query'), stats.metadata)
+            for stats in self._stats.values() if stats.metadata is not None
+        )
+
+    def results(self, top=None):
+        """
+        Yields (key, entry) pairs with reported stats for every query kind
+
+        Query kinds are reported in the order of their total time, the highest first. When top
+        is set, only that many of them are reported and stats are calculated for them only.
+
+        :type top int|None
+        :rtype: collections.Iterable[tuple]
+        """
+        if top is None:
+            items = sorted(self._stats.items(), key=lambda item: item[1].time_sum, reverse=True)
+        else:
+            items = nlargest(top, self._stats.items(), key=lambda item: item[1].time_sum)
+
+        for key, stats in items:
+            yield key, stats.as_dict(self.total)
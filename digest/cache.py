@@ -0,0 +1,206 @@
+"""
+Bounded memoization of SQL normalization results with an optional on-disk store
+"""
+import logging
+import sqlite3
+
+from collections import OrderedDict
+from hashlib import md5
+
+DEFAULT_CACHE_SIZE = 50000
+
+# how many new entries are written to the on-disk store at once
+FLUSH_SIZE = 1000
+
+
+def query_hash(sql):
+    """
+    Returns a cheap, stable hash of raw query text used as a cache key
+
+    :type sql str
+    :rtype: bytes
+    """
+    return md5(sql.encode('utf8')).digest()
+
+
+class LRUCache(object):
+    """
+    Bounded least recently used cache
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        """
+        :type max_size int
+        """
+        self._max_size = max_size
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """
+        :type key object
+        :type default object
+        :rtype: object
+        """
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+
+        # mark as the most recently used one
+        self._items[key] = value
+        return value
+
+    def set(self, key, value):
+        """
+        :type key object
+        :type value object
+        """
+        self._items.pop(key, None)
+        self._items[key] = value
+
+        if len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+
+
+class DiskCacheStore(object):
+    """
+    Persistent SQLite-backed store that can be reused across runs
+
+    New entries are written in batches of flush_size (and the rest of them on close).
+    """
+    def __init__(self, path, flush_size=FLUSH_SIZE):
+        """
+        :type path str
+        :type flush_size int
+        """
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS normalization_cache '
+            '(name TEXT, key BLOB, value TEXT, PRIMARY KEY (name, key))'
+        )
+        self._pending = []
+        self._flush_size = flush_size
+
+    def get(self, name, key):
+        """
+        :type name str
+        :type key bytes
+        :rtype: str|None
+        """
+        row = self._connection.execute(
+            'SELECT value FROM normalization_cache WHERE name = ? AND key = ?',
+            (name, sqlite3.Binary(key))
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def set(self, name, key, value):
+        """
+        :type name str
+        :type key bytes
+        :type value str
+        """
+        self._pending.append((name, sqlite3.Binary(key), value))
+
+        if len(self._pending) >= self._flush_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes pending entries
+        """
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO normalization_cache VALUES (?, ?, ?)', self._pending)
+
+        self._pending = []
+
+    def close(self):
+        """
+        Writes pending entries and closes the store
+        """
+        self.flush()
+        self._connection.close()
+
+
+class NormalizationCache(object):
+    """
+    Memoizes SQL normalization functions keyed by a hash of the raw query text
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        """
+        :type max_size int
+        """
+        self._cache = LRUCache(max_size)
+        self._store = None
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def open(self, path):
+        """
+        Use persistent on-disk store located at given path
+
+        :type path str
+        """
+        self._logger.info('Using on-disk normalization cache in "%s"', path)
+        self._store = DiskCacheStore(path)
+
+    def close(self):
+        """
+        Flushes on-disk store (if used) and reports cache stats
+        """
+        self._logger.debug(
+            'Normalization cache: %d hits, %d on-disk hits, %d misses, %d entries in memory',
+            self.hits, self.disk_hits, self.misses, len(self._cache))
+
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def memoize(self, func):
+        """
+        Returns memoized version of given single-argument SQL normalization function
+
+        :type func (str) -> str
+        :rtype: (str) -> str
+        """
+        name = func.__name__
+
+        def wrapper(sql):
+            """
+            :type sql str|None
+            :rtype: str|None
+            """
+            if sql is None:
+                return func(sql)
+
+            key = (name, query_hash(sql))
+            value = self._cache.get(key)
+
+            if value is not None:
+                self.hits += 1
+                return value
+
+            if self._store is not None:
+                value = self._store.get(*key)
+
+            if value is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                value = func(sql)
+
+                if self._store is not None:
+                    self._store.set(name, key[1], value)
+
+            self._cache.set(key, value)
+            return value
+
+        wrapper.__name__ = name
+        wrapper.__doc__ = func.__doc__
+        return wrapper
@@ -0,0 +1,186 @@
+"""
+Columnar, NumPy-backed aggregation of normalized log entries
+"""
+from array import array
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:  # numpy is an optional dependency
+    numpy = None  # pylint: disable=invalid-name
+
+from .aggregate import ENTRY_SPECIFIC_FIELDS, entry_key
+
+
+def is_available():
+    """
+    :rtype: bool
+    """
+    return numpy is not None
+
+
+def _batched_quantile(values, starts, counts, quantile):
+    """
+    Returns the quantile for every group of values sorted within groups
+
+    :type values numpy.ndarray
+    :type starts numpy.ndarray
+    :type counts numpy.ndarray
+    :type quantile float
+    :rtype: numpy.ndarray
+    """
+    position = starts + quantile * (counts - 1)
+    low_index = numpy.floor(position).astype(numpy.int64)
+    high_index = numpy.minimum(low_index + 1, starts + counts - 1)
+
+    return values[low_index] + (values[high_index] - values[low_index]) * (position - low_index)
+
+
+def _top_groups(time_sum, top):
+    """
+    Returns indices of top groups with the highest total time ordered by it
+
+    :type time_sum numpy.ndarray
+    :type top int
+    :rtype: list[int]
+    """
+    # partial sort: select top groups first, then order them only
+    group_ids = numpy.argpartition(-time_sum, top - 1)[:top] if top < len(time_sum) \
+        else numpy.arange(len(time_sum))
+
+    return sorted(group_ids, key=lambda group_id: -time_sum[group_id])
+
+
+class ColumnarAggregator(object):
+    """
+    Keeps time and rows of every entry in flat arrays together with their group index
+    and calculates sums, medians and percentiles for all groups in a single batched pass.
+
+    Provides the same interface as QueryAggregator, percentiles are exact.
+    """
+    def __init__(self, key_func=entry_key):
+        """
+        :type key_func (dict) -> str
+        """
+        self._key_func = key_func
+
+        # key -> group index, group index -> reported entry template
+        self._groups = OrderedDict()
+        self._entries = []
+
+        self._group_ids = array('l')
+        self._times = array('d')
+        self._rows = array('d')
+
+        self.total = 0
+
+    def __len__(self):
+        return len(self._groups)
+
+    def _group_id(self, key, entry):
+        """
+        :type key str
+        :type entry dict
+        :rtype: int
+        """
+        group_id = self._groups.get(key)
+
+        if group_id is None:
+            group_id = self._groups[key] = len(self._entries)
+            self._entries.append(OrderedDict(
+                (name, value) for (name, value) in entry.items()
+                if name not in ENTRY_SPECIFIC_FIELDS
+            ))
+
+        return group_id
+
+    def add(self, entry):
+        """
+        :type entry dict
+        """
+        self._group_ids.append(self._group_id(self._key_func(entry), entry))
+        self._times.append(entry.get('time', 0))
+        self._rows.append(entry.get('rows', 0))
+        self.total += 1
+
+    def update(self, entries):
+        """
+        :type entries collections.Iterable[dict]
+        :rtype: ColumnarAggregator
+        """
+        for entry in entries:
+            self.add(entry)
+
+        return self
+
+    def merge(self, other):
+        """
+        Fold the state of another aggregator into this one
+
+        :type other ColumnarAggregator
+        :rtype: ColumnarAggregator
+        """
+        # pylint: disable=protected-access
+        mapping = [
+            self._group_id(key, other._entries[group_id])
+            for key, group_id in other._groups.items()
+        ]
+
+        self._group_ids.extend(mapping[group_id] for group_id in other._group_ids)
+        self._times.extend(other._times)
+        self._rows.extend(other._rows)
+
+        self.total += other.total
+        return self
+
+    def results(self, top=None):  # pylint: disable=too-many-locals
+        """
+        Yields (key, entry) pairs with reported stats for every query kind
+
+        Query kinds are reported in the order of their total time, the highest first. When top
+        is set, only that many of them are reported.
+
+        :type top int|None
+        :rtype: collections.Iterable[tuple]
+        """
+        if not self.total:
+            return
+
+        group_ids = numpy.array(self._group_ids, dtype=numpy.int64)
+        times = numpy.array(self._times, dtype=numpy.float64)
+        rows = numpy.array(self._rows, dtype=numpy.float64)
+
+        # group boundaries - every group has at least one entry and groups are sorted by their index
+        counts = numpy.bincount(group_ids, minlength=len(self._entries))
+        starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+
+        # sort by the group index only for sums, by the group index and values for quantiles
+        order = numpy.argsort(group_ids, kind='stable')
+        sorted_times = times[numpy.lexsort((times, group_ids))]
+        sorted_rows = rows[numpy.lexsort((rows, group_ids))]
+
+        columns = OrderedDict([
+            ('time_sum', numpy.add.reduceat(times[order], starts)),
+            ('time_median', _batched_quantile(sorted_times, starts, counts, 0.5)),
+            ('time_p95', _batched_quantile(sorted_times, starts, counts, 0.95)),
+            ('time_p99', _batched_quantile(sorted_times, starts, counts, 0.99)),
+            ('rows_sum', numpy.add.reduceat(rows[order], starts).astype(numpy.int64)),
+            ('rows_median', _batched_quantile(sorted_rows, starts, counts, 0.5)),
+            ('rows_p95', _batched_quantile(sorted_rows, starts, counts, 0.95)),
+        ])
+
+        keys = list(self._groups.keys())
+        group_ids = _top_groups(columns['time_sum'], len(keys) if top is None else top)
+
+        for group_id in group_ids:
+            key = keys[group_id]
+            ret = self._entries[group_id].copy()
+
+            ret['count'] = int(counts[group_id])
+            ret['percentage'] = '{:.2f}%'.format(100. * counts[group_id] / self.total)
+
+            for name, values in columns.items():
+                # cast numpy scalars to Python types
+                ret[name] = values[group_id].item()
+
+            yield key, ret
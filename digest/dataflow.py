@@ -1,45 +1,42 @@
 """
-Helper function used to format TSV-like entry for data flow file
+Data flow graph built from aggregated entries: (source node, edge label, target node) edges
+
+@see https://github.com/macbre/data-flow-graph
 """
 from __future__ import unicode_literals
 
 import logging
 import re
 
+from collections import OrderedDict
+from xml.sax.saxutils import escape, quoteattr
+
+from .parallel import iter_chunks
 from .query_metadata import get_query_metadata
 
+# --data-flow-format
+GRAPH_FORMATS = ('tsv', 'dot', 'graphml')
 
-def data_flow_format_entry(entry, max_queries):
-    """
-    Generate an entry for data-flow TSV file:
+# how many aggregated entries are sent to a worker at once
+CHUNK_SIZE = 500
 
-    (source node)\t(edge label)\t(target node)\t(edge weight - optional)\t(metadata for tooltip)
 
-    @see https://github.com/macbre/data-flow-graph
+def data_flow_edges(entry, metadata=None):
+    """
+    Yields (source node, edge label, target node) tuples for every table involved in a query
 
     :type entry: dict
-    :type max_queries: int
-    :rtype: list[str]
+    :type metadata: tuple|None
+    :arg metadata: (kind, tables) tuple if already extracted during the aggregation
+    :rtype: collections.Iterable[tuple]
     """
-    # OrderedDict([('query', 'SELECT wiki_id,page_id FROM `image_review` WHERE wiki_id = X'),
-    # ('method', u'UpdateImageReview::getImageReviewFiles'),
-    # ('dbname', u'dataware'),
-    # ('source_host', u'cron'),
-    # ('count', 172),
-    # ('percentage', '45.38%'),
-    # ('time_sum', 102.78344154357926),
-    # ('time_median', 0.37848949432372997),
-    # ('rows_sum', 5405),
-    # ('rows_median', 8.0)]) 379
-    # print(entry, max_queries)
-
     logger = logging.getLogger('dataflow')
 
     # get query metadata (kind and tables involved
     query = entry.get('query')
 
     try:
-        (kind, tables) = get_query_metadata(query)
+        (kind, tables) = metadata or get_query_metadata(query)
     except ValueError:
         logger.error('Unable to parse query metadata: %s', query, exc_info=True)
         return
@@ -83,16 +80,274 @@ def data_flow_format_entry(entry, max_queries):
 
         # for writing queries reverse the order
         if kind != 'SELECT':
-            (source, target) = (target, source)
-
-        yield '{source}\t{edge}\t{target}\t{weight:.2f}{metadata}\n'.format(
-            source=source,
-            edge=edge,
-            target=target,
-            weight=1. * entry.get('count') / max_queries,
-            metadata='\t{at}, median time: {time:.2f} ms, count: {count}'.format(
-                at=entry.get('source_host'),  # cron, ap, ...
-                time=entry.get('time_median') * 100.,
-                count=entry.get('count') * 100  # multiply for 1% logs sampling
-            ) if entry.get('source_host') else ''
+            yield target, edge, source
+        else:
+            yield source, edge, target
+
+
+class EdgeStats(object):  # pylint: disable=too-few-public-methods
+    """
+    Summed up stats of entries sharing a single data flow edge
+    """
+    __slots__ = ('count', 'max_time_median', 'max_time_p95', 'source_hosts')
+
+    def __init__(self):
+        self.count = 0
+        # the highest ones of all entries (medians of merged entries are not known)
+        self.max_time_median = 0.
+        self.max_time_p95 = 0.
+        self.source_hosts = []
+
+    def add(self, count, time_median, time_p95, source_host):
+        """
+        :type count int
+        :type time_median float|None
+        :type time_p95 float|None
+        :type source_host str|None
+        """
+        self.count += count
+        self.max_time_median = max(self.max_time_median, time_median or 0.)
+        self.max_time_p95 = max(self.max_time_p95, time_p95 or 0.)
+
+        if source_host and source_host not in self.source_hosts:
+            self.source_hosts.append(source_host)
+
+    def tooltip(self):
+        """
+        :rtype: str
+        """
+        if not self.source_hosts:
+            return ''
+
+        return '{at}, max median time: {median:.2f} ms, max p95: {p95:.2f} ms, count: {count}'.format(
+            at='/'.join(self.source_hosts),  # cron, ap, ...
+            median=self.max_time_median * 100.,
+            p95=self.max_time_p95 * 100.,
+            count=self.count * 100  # multiply for 1% logs sampling
         )
+
+
+class DataFlowGraph(object):
+    """
+    Data flow edges keyed by (source node, edge label, target node) with stats of all entries
+    sharing them summed up, so that every edge is reported once
+    """
+    def __init__(self):
+        # (source, edge, target) -> EdgeStats, in the order edges were found
+        self.edges = OrderedDict()
+
+    def __len__(self):
+        return len(self.edges)
+
+    def add(self, entry, metadata=None):
+        """
+        :type entry dict
+        :type metadata tuple|None
+        :arg metadata: (kind, tables) tuple if already extracted during the aggregation
+        """
+        count = entry.get('count')
+
+        for key in data_flow_edges(entry, metadata):
+            stats = self.edges.get(key)
+
+            if stats is None:
+                stats = self.edges[key] = EdgeStats()
+
+            stats.add(count, entry.get('time_median'), entry.get('time_p95'),
+                      entry.get('source_host'))
+
+    def update(self, items):
+        """
+        :type items collections.Iterable[tuple]
+        :arg items: (entry, metadata) pairs
+        :rtype: DataFlowGraph
+        """
+        for (entry, metadata) in items:
+            self.add(entry, metadata)
+
+        return self
+
+    def merge(self, other):
+        """
+        :type other DataFlowGraph
+        :rtype: DataFlowGraph
+        """
+        for (key, theirs) in other.edges.items():
+            stats = self.edges.get(key)
+
+            if stats is None:
+                self.edges[key] = theirs
+                continue
+
+            stats.count += theirs.count
+            stats.max_time_median = max(stats.max_time_median, theirs.max_time_median)
+            stats.max_time_p95 = max(stats.max_time_p95, theirs.max_time_p95)
+            stats.source_hosts += [host for host in theirs.source_hosts
+                                   if host not in stats.source_hosts]
+
+        return self
+
+    @property
+    def max_queries(self):
+        """
+        The count of the heaviest edge, edge weights are relative to it
+
+        :rtype: int
+        """
+        return max([stats.count for stats in self.edges.values()] or [0])
+
+    def _weights(self, max_queries=None):
+        """
+        Yields (edge key, stats, weight) tuples
+
+        :type max_queries int|None
+        :rtype: collections.Iterable[tuple]
+        """
+        max_queries = max_queries or self.max_queries
+
+        for (key, stats) in self.edges.items():
+            yield key, stats, 1. * stats.count / max_queries
+
+    def nodes(self):
+        """
+        Returns node names in the order they were found
+
+        :rtype: list[str]
+        """
+        nodes = OrderedDict()
+
+        for (source, _, target) in self.edges:
+            nodes[source] = True
+            nodes[target] = True
+
+        return list(nodes)
+
+    def write_tsv(self, output, report_header, max_queries=None):
+        """
+        (source node)\t(edge label)\t(target node)\t(edge weight)\t(metadata for tooltip)
+
+        :type output io.TextIOBase
+        :type report_header str
+        :type max_queries int|None
+        """
+        output.write('# {}\n'.format(report_header))
+
+        for ((source, edge, target), stats, weight) in self._weights(max_queries):
+            tooltip = stats.tooltip()
+
+            output.write('{}\t{}\t{}\t{:.2f}{}\n'.format(
+                source, edge, target, weight,
+                '\t' + tooltip if tooltip else ''))
+
+    def write_dot(self, output, report_header, max_queries=None):
+        """
+        Graphviz DOT digraph
+
+        :type output io.TextIOBase
+        :type report_header str
+        :type max_queries int|None
+        """
+        def quote(value):
+            return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+        output.write('// {}\ndigraph data_flow {{\n'.format(report_header))
+
+        for ((source, edge, target), stats, weight) in self._weights(max_queries):
+            output.write('  {} -> {} [label={}, weight={:.2f}, tooltip={}];\n'.format(
+                quote(source), quote(target), quote(edge), weight,
+                quote(stats.tooltip())))
+
+        output.write('}\n')
+
+    def write_graphml(self, output, report_header, max_queries=None):
+        """
+        GraphML document with label, weight and tooltip edge attributes
+
+        :type output io.TextIOBase
+        :type report_header str
+        :type max_queries int|None
+        """
+        output.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<!-- {} -->\n'
+            '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+            '  <key id="label" for="edge" attr.name="label" attr.type="string"/>\n'
+            '  <key id="weight" for="edge" attr.name="weight" attr.type="double"/>\n'
+            '  <key id="tooltip" for="edge" attr.name="tooltip" attr.type="string"/>\n'
+            '  <graph id="data_flow" edgedefault="directed">\n'.format(
+                escape(report_header.replace('--', '- -'))))
+
+        for node in self.nodes():
+            output.write('    <node id={}/>\n'.format(quoteattr(node)))
+
+        for ((source, edge, target), stats, weight) in self._weights(max_queries):
+            output.write(
+                '    <edge source={} target={}>'
+                '<data key="label">{}</data><data key="weight">{:.2f}</data>'
+                '<data key="tooltip">{}</data></edge>\n'.format(
+                    quoteattr(source), quoteattr(target), escape(edge),
+                    weight, escape(stats.tooltip())))
+
+        output.write('  </graph>\n</graphml>\n')
+
+    def write(self, output, report_header, graph_format='tsv', max_queries=None):
+        """
+        :type output io.TextIOBase
+        :type report_header str
+        :type graph_format str
+        :arg graph_format: one of GRAPH_FORMATS
+        :type max_queries int|None
+        """
+        writers = {
+            'tsv': self.write_tsv,
+            'dot': self.write_dot,
+            'graphml': self.write_graphml,
+        }
+
+        writers[graph_format](output, report_header, max_queries=max_queries)
+
+
+def graph_of_chunk(chunk):
+    """
+    Builds a partial graph of a chunk of (entry, metadata) pairs (run by worker processes)
+
+    :type chunk list[tuple]
+    :rtype: DataFlowGraph
+    """
+    return DataFlowGraph().update(chunk)
+
+
+def build_data_flow_graph(data, query_metadata=None, jobs=1, chunk_size=CHUNK_SIZE):
+    """
+    Builds the data flow graph of aggregated entries.
+
+    When more than one job is requested, entries are sent in chunks to a process pool
+    (parsing queries metadata and method names is done there) and partial graphs are merged.
+
+    :type data collections.Iterable[dict]
+    :type query_metadata dict|None
+    :arg query_metadata: (kind, tables) tuples extracted during the aggregation
+    :type jobs int
+    :type chunk_size int
+    :rtype: DataFlowGraph
+    """
+    query_metadata = query_metadata or dict()
+    items = ((entry, query_metadata.get(entry.get('query'))) for entry in data)
+
+    if jobs <= 1:
+        return DataFlowGraph().update(items)
+
+    from multiprocessing import Pool
+
+    graph = DataFlowGraph()
+    pool = Pool(processes=jobs)
+
+    try:
+        # partial graphs are merged in the order of entries
+        for partial_graph in pool.imap(graph_of_chunk, iter_chunks(items, chunk_size)):
+            graph.merge(partial_graph)
+    finally:
+        pool.close()
+        pool.join()
+
+    return graph
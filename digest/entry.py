@@ -0,0 +1,99 @@
+"""
+Compact record for a single normalized log entry
+"""
+from collections import OrderedDict
+
+try:
+    from sys import intern
+except ImportError:  # Python 2.x has intern() built-in
+    pass
+
+
+class QueryEntry(object):
+    """
+    Normalized log entry with a fixed set of fields.
+
+    Uses __slots__ instead of a per-entry dict and interns low-cardinality strings
+    (method, database and host names). It can be read like a dict and
+    converted back to it with to_dict() at the output boundary.
+    """
+    __slots__ = (
+        'original_query', 'query', 'method', 'dbname', 'from_master', 'source_host', 'rows', 'time',
+        'timestamp',
+    )
+
+    # these repeat a lot across entries, keep a single copy of each value
+    INTERNED_FIELDS = ('method', 'dbname', 'source_host')
+
+    def __init__(self, **fields):
+        """
+        :type fields dict
+        """
+        for name, value in fields.items():
+            self[name] = value
+
+    def __setitem__(self, name, value):
+        """
+        :type name str
+        :type value object
+        """
+        if name in self.INTERNED_FIELDS and isinstance(value, str):
+            value = intern(value)
+
+        setattr(self, name, value)
+
+    def __getitem__(self, name):
+        """
+        :type name str
+        :rtype: object
+        """
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        """
+        :type name str
+        :rtype: bool
+        """
+        return name in self.__slots__ and hasattr(self, name)
+
+    def __eq__(self, other):
+        return isinstance(other, QueryEntry) and self.items() == other.items()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<QueryEntry {}>'.format(dict(self.items()))
+
+    def get(self, name, default=None):
+        """
+        :type name str
+        :type default object
+        :rtype: object
+        """
+        return getattr(self, name, default)
+
+    def keys(self):
+        """
+        Names of fields that are set
+
+        :rtype: list[str]
+        """
+        return [name for name in self.__slots__ if hasattr(self, name)]
+
+    def items(self):
+        """
+        (name, value) pairs of fields that are set
+
+        :rtype: list[tuple]
+        """
+        return [(name, getattr(self, name)) for name in self.keys()]
+
+    def to_dict(self):
+        """
+        :rtype: OrderedDict
+        """
+        return OrderedDict(self.items())
@@ -0,0 +1,369 @@
+"""
+Elasticsearch helpers: shared connection pools, streaming scroll ingestion and time slicing
+"""
+import logging
+
+from math import ceil
+from threading import BoundedSemaphore, Event, Lock, Thread
+from time import time
+
+try:
+    from queue import Full, Queue
+except ImportError:  # Python 2.x
+    from Queue import Full, Queue
+
+from elasticsearch import Elasticsearch
+from elasticsearch_query import ElasticsearchQuery
+
+# the size of the connection pool shared by concurrent requests to a given host
+POOL_SIZE = 8
+READ_TIMEOUT = 10
+
+# how many documents are fetched in every scroll request
+BATCH_SIZE = 1000
+
+# how many batches can wait for the consumer (per source, shared by its time slices)
+PREFETCH_BATCHES = 2
+
+# how many time slices of a source are fetched at once (each one keeps a scroll context open)
+MAX_OPEN_SCROLLS = 4
+
+SCROLL_TIMEOUT = '2m'
+
+_clients = dict()  # pylint: disable=invalid-name
+_clients_lock = Lock()  # pylint: disable=invalid-name
+
+
+def get_client(es_host):
+    """
+    Returns Elasticsearch client for given host, clients (and their connection pools) are shared
+
+    :type es_host str
+    :rtype: Elasticsearch
+    """
+    with _clients_lock:
+        if es_host not in _clients:
+            _clients[es_host] = Elasticsearch(
+                hosts=es_host, timeout=READ_TIMEOUT, maxsize=POOL_SIZE)
+
+        return _clients[es_host]
+
+
+class FetchStats(object):
+    """
+    Counts documents matching the query and the ones that were actually fetched
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.matching = 0
+        self.fetched = 0
+
+    @property
+    def skipped(self):
+        """
+        Documents that were not fetched because of the limit
+
+        :rtype: int
+        """
+        return max(self.matching - self.fetched, 0)
+
+    def add(self, matching=0, fetched=0):
+        """
+        :type matching int
+        :type fetched int
+        """
+        with self._lock:
+            self.matching += matching
+            self.fetched += fetched
+
+
+class Prefetcher(object):
+    """
+    Consumes given iterables of batches (e.g. one per time slice) in background threads,
+    keeping at most max_batches of them in memory, and yields their items. Batches coming
+    from different iterables are interleaved in the order they were fetched.
+
+    Fetching starts with start() (or on iteration), at most max_producers iterables are
+    consumed at once, the next one starts when any of them is done. The bounded queue
+    blocks producers that get ahead of the consumer. When the consumer stops early,
+    producers are stopped and their iterables of batches are closed (in the producer threads).
+    """
+    _DONE = object()
+
+    # how often a blocked producer checks whether the consumer is gone [s]
+    _PUT_TIMEOUT = 0.1
+
+    def __init__(self, producers, max_batches=PREFETCH_BATCHES, max_producers=None):
+        """
+        :type producers list[collections.Iterable[list]]
+        :type max_batches int
+        :type max_producers int or None
+        """
+        self._producers = list(producers)
+        self._queue = Queue(maxsize=max_batches)
+        self._running = BoundedSemaphore(max_producers or max(len(self._producers), 1))
+        self._closed = Event()
+        self._threads = None
+
+    def start(self):
+        """
+        Starts fetching batches in the background (if not started yet)
+        """
+        if self._threads is None:
+            self._threads = []
+
+            for batches in self._producers:
+                thread = Thread(target=self._produce, args=(batches,))
+                thread.daemon = True
+                thread.start()
+
+                self._threads.append(thread)
+
+    def close(self):
+        """
+        Stops producers, batches that were not consumed yet are dropped
+        """
+        self._closed.set()
+
+    def _put(self, item):
+        """
+        :type item object
+        :rtype: bool
+        :return: False when the consumer is gone
+        """
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=self._PUT_TIMEOUT)
+                return True
+            except Full:
+                continue
+
+        return False
+
+    def _acquire(self):
+        """
+        Waits until fewer than max_producers iterables are consumed
+
+        :rtype: bool
+        :return: False when the consumer is gone
+        """
+        while not self._running.acquire(False):
+            if self._closed.wait(self._PUT_TIMEOUT):
+                return False
+
+        if self._closed.is_set():
+            self._running.release()
+            return False
+
+        return True
+
+    def _produce(self, batches):
+        """
+        :type batches collections.Iterable[list]
+        """
+        started = self._acquire()
+
+        try:
+            if started:
+                for batch in batches:
+                    if not self._put(batch):
+                        break
+        except Exception as ex:  # pylint: disable=broad-except
+            # re-raised in the consumer thread
+            self._put(ex)
+        finally:
+            # e.g. a generator that clears its scroll context
+            if hasattr(batches, 'close'):
+                batches.close()
+
+            if started:
+                self._running.release()
+
+        self._put(self._DONE)
+
+    def __iter__(self):
+        self.start()
+        running = len(self._producers)
+
+        try:
+            while running > 0:
+                batch = self._queue.get()
+
+                if batch is self._DONE:
+                    running -= 1
+                    continue
+
+                if isinstance(batch, Exception):
+                    raise batch
+
+                for item in batch:
+                    yield item
+        finally:
+            self.close()
+
+
+def get_indices(index_prefix, now):
+    """
+    Returns comma-separated names of yesterday's and today's indices
+
+    :type index_prefix str
+    :type now int
+    :rtype: str
+    """
+    return ','.join([
+        ElasticsearchQuery.format_index(prefix=index_prefix, timestamp=timestamp)
+        for timestamp in (now - ElasticsearchQuery.DAY, now)
+    ])
+
+
+def get_time_slices(since, until, slices):
+    """
+    Splits [since, until) time range into given number of slices
+
+    :type since int
+    :type until int
+    :type slices int
+    :rtype: list[tuple]
+    """
+    step = 1. * (until - since) / slices
+    bounds = [since + int(step * index) for index in range(slices)] + [until]
+
+    return [(bounds[index], bounds[index + 1]) for index in range(slices)]
+
+
+def iter_batches(client, index, query, fields, time_slice, limit, stats, batch_size=BATCH_SIZE,
+                 oldest_first=False):
+    """
+    Yields batches of documents logged in the [since, until) time slice
+    that match given query string using the scroll API
+
+    Documents are returned in the index order (the cheapest one to scroll), unless
+    oldest_first is set (so that the limit only cuts off the most recent documents).
+
+    :type client Elasticsearch
+    :type index str
+    :type query str
+    :type fields list[str] or None
+    :type time_slice tuple
+    :type limit int
+    :type stats FetchStats
+    :type batch_size int
+    :type oldest_first bool
+    :rtype: collections.Iterable[list[dict]]
+    """
+    # pylint: disable=too-many-locals
+    (since, until) = time_slice
+
+    body = {
+        'query': {
+            'bool': {
+                'must': [
+                    {'query_string': {'query': query}},
+                    # slices are half-open, so that entries on their boundaries are fetched once
+                    {'range': {'@timestamp': {
+                        'gte': ElasticsearchQuery.format_timestamp(since),
+                        'lt': ElasticsearchQuery.format_timestamp(until),
+                    }}},
+                ]
+            }
+        },
+        'sort': [{'@timestamp': 'asc'}, '_doc'] if oldest_first else ['_doc'],
+    }
+
+    if fields:
+        body['_source'] = {'includes': fields}
+
+    res = client.search(
+        index=index, body=body, params={'scroll': SCROLL_TIMEOUT, 'size': batch_size})
+
+    # Elasticsearch 7.x returns {"value": 10000, "relation": "gte"}, it can be a lower bound
+    # only, so it is just reported and scrolling goes on until no more hits are returned
+    total = res['hits']['total']
+    total = total.get('value', 0) if isinstance(total, dict) else total
+    stats.add(matching=total)
+
+    remaining = limit
+    scroll_id = res.get('_scroll_id')
+
+    try:
+        while remaining > 0:
+            hits = res['hits']['hits'][:remaining]
+
+            if not hits:
+                break
+
+            remaining -= len(hits)
+            stats.add(fetched=len(hits))
+
+            yield [hit['_source'] for hit in hits]
+
+            if remaining > 0:
+                res = client.scroll(body={'scroll_id': scroll_id, 'scroll': SCROLL_TIMEOUT})
+                scroll_id = res.get('_scroll_id', scroll_id)
+    finally:
+        # do not keep the search context open until it expires
+        if scroll_id is not None:
+            try:
+                client.clear_scroll(body={'scroll_id': [scroll_id]})
+            except Exception:  # pylint: disable=broad-except
+                logging.getLogger('iter_batches').warning(
+                    'Clearing the scroll context failed', exc_info=True)
+
+
+def iter_log_entries(es_host, query, period, fields, limit, index_prefix, slices=1,
+                     max_open_scrolls=MAX_OPEN_SCROLLS, oldest_first=False):
+    """
+    Lazily yields log entries from the last period of time that match given query string.
+
+    The period is split into time slices, each one returns at most an equal share of
+    the limit. Up to max_open_scrolls slices are fetched concurrently, starting right away
+    (and not when entries are consumed for the first time), so that several sources are
+    fetched in parallel too. The number of fetched, but not yet consumed batches is bounded.
+
+    :type es_host str
+    :type query str
+    :type period int
+    :type fields list[str] or None
+    :type limit int
+    :type index_prefix str
+    :type slices int
+    :type max_open_scrolls int
+    :type oldest_first bool
+    :arg oldest_first: fetch the oldest entries of every slice when the limit is reached
+    :rtype: collections.Iterable[dict]
+    """
+    # pylint: disable=too-many-locals
+    logger = logging.getLogger('iter_log_entries')
+
+    now = int(time())
+    until = now - ElasticsearchQuery.SHORT_DELAY  # give logs some time to reach Logstash
+
+    index = get_indices(index_prefix, now)
+    slice_limit = int(ceil(1. * limit / slices))
+    stats = FetchStats()
+
+    logger.info('Fetching %d time slice(s) from %s indices (up to %d entries each)',
+                slices, index, slice_limit)
+
+    prefetcher = Prefetcher([
+        iter_batches(get_client(es_host), index, query, fields, time_slice, slice_limit, stats,
+                     oldest_first=oldest_first)
+        for time_slice in get_time_slices(until - period, until, slices)
+    ], max_producers=max_open_scrolls)
+    prefetcher.start()
+
+    def entries():
+        """
+        :rtype: collections.Iterable[dict]
+        """
+        try:
+            for entry in prefetcher:
+                yield entry
+        finally:
+            # stop producers when the consumer stops early
+            prefetcher.close()
+
+        logger.info('Fetched %d of %d matching entries (%d skipped because of the limit)',
+                    stats.fetched, stats.matching, stats.skipped)
+
+    return entries()
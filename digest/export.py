@@ -0,0 +1,182 @@
+"""
+Columnar binary export (Parquet / Arrow IPC) of aggregated stats and raw entries
+"""
+from array import array
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:  # pyarrow is an optional dependency
+    pyarrow = None  # pylint: disable=invalid-name
+
+from .fingerprint import fingerprint
+
+try:
+    from sys import intern
+except ImportError:  # Python 2.x has intern() built-in
+    pass
+
+
+def is_available():
+    """
+    :rtype: bool
+    """
+    return pyarrow is not None
+
+
+class RawRowsAggregator(object):  # pylint: disable=too-many-instance-attributes
+    """
+    Passes entries to the wrapped aggregator and keeps fingerprint, method, host,
+    time, rows and timestamp of every one of them in compact columns
+    """
+    def __init__(self, aggregator_class):
+        """
+        :type aggregator_class type
+        """
+        self.aggregator = aggregator_class()
+
+        self._fingerprints = dict()  # normalized query -> its fingerprint
+
+        self.fingerprint = array('Q')
+        self.method = []
+        self.source_host = []
+        self.time = array('d')
+        self.rows = array('l')
+        self.timestamp = []
+
+    def __len__(self):
+        return len(self.aggregator)
+
+    @property
+    def total(self):
+        """
+        :rtype: int
+        """
+        return self.aggregator.total
+
+    def add(self, entry):
+        """
+        :type entry dict
+        """
+        self.aggregator.add(entry)
+
+        query = entry.get('query')
+        query_fingerprint = self._fingerprints.get(query)
+
+        if query_fingerprint is None:
+            query_fingerprint = self._fingerprints[query] = fingerprint(query)
+
+        self.fingerprint.append(query_fingerprint)
+        self.method.append(intern(str(entry.get('method'))))
+        self.source_host.append(intern(str(entry.get('source_host'))))
+        self.time.append(entry.get('time', 0))
+        self.rows.append(entry.get('rows', 0))
+        self.timestamp.append(entry.get('timestamp'))
+
+    def update(self, entries):
+        """
+        :type entries collections.Iterable[dict]
+        :rtype: RawRowsAggregator
+        """
+        for entry in entries:
+            self.add(entry)
+
+        return self
+
+    def merge(self, other):
+        """
+        :type other RawRowsAggregator
+        :rtype: RawRowsAggregator
+        """
+        self.aggregator.merge(other.aggregator)
+
+        self.fingerprint.extend(other.fingerprint)
+        self.method.extend(other.method)
+        self.source_host.extend(other.source_host)
+        self.time.extend(other.time)
+        self.rows.extend(other.rows)
+        self.timestamp.extend(other.timestamp)
+
+        return self
+
+
+def aggregated_table(data, total):
+    """
+    Returns aggregated stats as Arrow table with numeric columns
+
+    :type data list[dict]
+    :type total int
+    :rtype: pyarrow.Table
+    """
+    def column(name):
+        """
+        :type name str
+        :rtype: list
+        """
+        return [entry.get(name) for entry in data]
+
+    return pyarrow.Table.from_arrays([
+        pyarrow.array([fingerprint(query) for query in column('query')], type=pyarrow.uint64()),
+        pyarrow.array(column('query'), type=pyarrow.string()),
+        pyarrow.array(column('method'), type=pyarrow.string()).dictionary_encode(),
+        pyarrow.array(column('dbname'), type=pyarrow.string()).dictionary_encode(),
+        pyarrow.array(column('source_host'), type=pyarrow.string()).dictionary_encode(),
+        pyarrow.array(column('count'), type=pyarrow.int64()),
+        pyarrow.array([100. * count / total for count in column('count')], type=pyarrow.float64()),
+        pyarrow.array(column('time_sum'), type=pyarrow.float64()),
+        pyarrow.array(column('time_median'), type=pyarrow.float64()),
+        pyarrow.array(column('time_p95'), type=pyarrow.float64()),
+        pyarrow.array(column('time_p99'), type=pyarrow.float64()),
+        pyarrow.array(column('rows_sum'), type=pyarrow.int64()),
+        pyarrow.array(column('rows_median'), type=pyarrow.float64()),
+        pyarrow.array(column('rows_p95'), type=pyarrow.float64()),
+    ], names=[
+        'fingerprint', 'query', 'method', 'dbname', 'source_host', 'count', 'percentage',
+        'time_sum', 'time_median', 'time_p95', 'time_p99', 'rows_sum', 'rows_median', 'rows_p95',
+    ])
+
+
+def raw_rows_table(raw_rows):
+    """
+    Returns per-entry rows as Arrow table
+
+    :type raw_rows RawRowsAggregator
+    :rtype: pyarrow.Table
+    """
+    return pyarrow.Table.from_arrays([
+        pyarrow.array(raw_rows.fingerprint, type=pyarrow.uint64()),
+        pyarrow.array(raw_rows.method, type=pyarrow.string()).dictionary_encode(),
+        pyarrow.array(raw_rows.source_host, type=pyarrow.string()).dictionary_encode(),
+        pyarrow.array(raw_rows.time, type=pyarrow.float64()),
+        pyarrow.array(raw_rows.rows, type=pyarrow.int64()),
+        pyarrow.array(
+            [int(value * 1e6) if value is not None else None for value in raw_rows.timestamp],
+            type=pyarrow.timestamp('us', tz='UTC')),
+    ], names=['fingerprint', 'method', 'source_host', 'time', 'rows', 'timestamp'])
+
+
+def raw_rows_path(path):
+    """
+    Returns the path raw rows are saved to, e.g. digest.parquet -> digest.raw.parquet
+
+    :type path str
+    :rtype: str
+    """
+    (name, dot, extension) = path.rpartition('.')
+    return '{}.raw.{}'.format(name, extension) if dot and '/' not in extension \
+        else path + '.raw'
+
+
+def write_table(table, path, file_format):
+    """
+    :type table pyarrow.Table
+    :type path str
+    :type file_format str
+    :arg file_format: parquet or arrow
+    """
+    if file_format == 'parquet':
+        pyarrow.parquet.write_table(table, path)
+    else:
+        # Arrow IPC file format, can be memory-mapped by readers
+        pyarrow.feather.write_feather(table, path, compression='uncompressed')
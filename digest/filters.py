@@ -0,0 +1,274 @@
+"""
+Configurable filtering of normalized entries (see --include, --exclude and --min-time)
+
+Include and exclude rules are given for query kinds (SELECT, UPDATE, ...), tables,
+database names and methods (a regular expression), e.g.
+
+    --include="kind:SELECT,UPDATE table:page,revision" --exclude="method:^Wall"
+
+QueryFilter compiles them once into a list of checks that only contains the configured ones.
+Query kinds are taken from the first token of a query, so they can be checked on raw
+queries too (before the normalization). Tables come from query metadata that is memoized
+per normalized query. The number of entries dropped by every rule is kept in "dropped".
+"""
+import re
+
+from collections import Counter, OrderedDict
+from functools import partial
+
+from .errors import QueryDigestCommandLineError
+from .query_metadata import get_query_metadata
+
+# transactions, SHOW statements and "Important table write: ..." messages are not reported
+DEFAULT_EXCLUDED_KINDS = frozenset(['BEGIN', 'COMMIT', 'SHOW', 'IMPORTANT'])
+
+RULE_FIELDS = ('kind', 'table', 'dbname', 'method')
+
+# leading whitespace and comments (raw queries only) are skipped, the first token is the kind
+_KIND_RE = re.compile(r'\s*(?:/\*.*?\*/\s*)*(\S*)', flags=re.DOTALL)
+
+
+def query_kind(sql):
+    """
+    Returns the kind of a raw or normalized query, e.g. SELECT, INSERT, BEGIN
+
+    :type sql str
+    :rtype: str
+    """
+    return _KIND_RE.match(sql).group(1).upper()
+
+
+def parse_rules(value, option='--include'):
+    """
+    Parses space separated "field:value" rules, values of kind, table and dbname rules
+    are comma separated lists, method rules are regular expressions
+
+    :type value str|None
+    :type option str
+    :arg option: the command line option rules were given with (used in error messages)
+    :rtype: OrderedDict
+    :raises QueryDigestCommandLineError
+    """
+    rules = OrderedDict()
+
+    for rule in (value or '').split():
+        (field, _, values) = rule.partition(':')
+
+        if field not in RULE_FIELDS or not values:
+            raise QueryDigestCommandLineError(
+                'Invalid {} rule "{}", use field:value with one of {} fields'.format(
+                    option, rule, ', '.join(RULE_FIELDS)))
+
+        if field == 'method':
+            try:
+                re.compile(values)
+            except re.error as ex:
+                raise QueryDigestCommandLineError(
+                    'Invalid {} method pattern "{}": {}'.format(option, values, ex))
+
+            rules.setdefault(field, []).append(values)
+        else:
+            rules.setdefault(field, []).extend(
+                item.upper() if field == 'kind' else item for item in values.split(','))
+
+    return rules
+
+
+def _query_tables(query):
+    """
+    :type query str
+    :rtype: tuple
+    """
+    try:
+        return get_query_metadata(query)[1] or ()
+    except ValueError:
+        return ()
+
+
+class QueryFilter(object):  # pylint: disable=too-many-instance-attributes
+    """
+    Drops entries that do not match include rules, match exclude rules
+    or took less than min_time [ms]
+    """
+    def __init__(self, include=None, exclude=None, min_time=None, skip_transactions=True):
+        """
+        :type include dict|None
+        :arg include: field -> list of values, as returned by parse_rules()
+        :type exclude dict|None
+        :type min_time float|None
+        :type skip_transactions bool
+        :arg skip_transactions: exclude DEFAULT_EXCLUDED_KINDS as well
+            (except for the ones that are included explicitly)
+        """
+        self.include = dict(include or {})
+        self.exclude = dict(exclude or {})
+        self.min_time = min_time
+        self.skip_transactions = skip_transactions
+
+        # rule label -> the number of dropped entries
+        self.dropped = Counter()
+
+        self._compile()
+
+    def _compile(self):
+        """
+        Prepares lists of (rule label, check) pairs for the configured rules only
+        """
+        self._include_kinds = frozenset(self.include.get('kind', ()))
+        self._exclude_kinds = frozenset(self.exclude.get('kind', ())) | \
+            (DEFAULT_EXCLUDED_KINDS - self._include_kinds if self.skip_transactions
+             else frozenset())
+        self._include_tables = frozenset(self.include.get('table', ()))
+        self._exclude_tables = frozenset(self.exclude.get('table', ()))
+        self._include_dbnames = frozenset(self.include.get('dbname', ()))
+        self._exclude_dbnames = frozenset(self.exclude.get('dbname', ()))
+
+        # all patterns of a rule are combined into a single expression
+        self._include_methods = self._compile_patterns(self.include.get('method'))
+        self._exclude_methods = self._compile_patterns(self.exclude.get('method'))
+
+        # kinds can be checked on raw queries before the normalization
+        self._kind_checks = [(label, check) for (label, rule, check) in (
+            ('include kind', self._include_kinds, self._check_include_kind),
+            ('exclude kind', self._exclude_kinds, self._check_exclude_kind),
+        ) if rule]
+
+        # the cheapest checks go first, tables are only parsed when table rules are given
+        self._entry_checks = [(label, check) for (label, rule, check) in (
+            ('min time', self.min_time, self._check_min_time),
+            ('include dbname', self._include_dbnames, self._check_include_dbname),
+            ('exclude dbname', self._exclude_dbnames, self._check_exclude_dbname),
+            ('include method', self._include_methods, self._check_include_method),
+            ('exclude method', self._exclude_methods, self._check_exclude_method),
+            ('include table', self._include_tables, self._check_include_table),
+            ('exclude table', self._exclude_tables, self._check_exclude_table),
+        ) if rule]
+
+    @staticmethod
+    def _compile_patterns(patterns):
+        """
+        :type patterns list[str]|None
+        :rtype: re.Pattern|None
+        """
+        if not patterns:
+            return None
+
+        return re.compile('|'.join('(?:{})'.format(pattern) for pattern in patterns))
+
+    def __getstate__(self):
+        """
+        Only rules are sent to worker processes, checks are compiled there again
+        """
+        return self.include, self.exclude, self.min_time, self.skip_transactions
+
+    def __setstate__(self, state):
+        (self.include, self.exclude, self.min_time, self.skip_transactions) = state
+
+        self.dropped = Counter()
+        self._compile()
+
+    def _check_include_kind(self, kind):
+        return kind in self._include_kinds
+
+    def _check_exclude_kind(self, kind):
+        return kind not in self._exclude_kinds
+
+    def _check_min_time(self, entry):
+        return (entry.get('time') or 0) >= self.min_time
+
+    def _check_include_dbname(self, entry):
+        return entry.get('dbname') in self._include_dbnames
+
+    def _check_exclude_dbname(self, entry):
+        return entry.get('dbname') not in self._exclude_dbnames
+
+    def _check_include_method(self, entry):
+        return self._include_methods.search(entry.get('method') or '') is not None
+
+    def _check_exclude_method(self, entry):
+        return self._exclude_methods.search(entry.get('method') or '') is None
+
+    def _check_include_table(self, entry):
+        return not self._include_tables.isdisjoint(_query_tables(entry['query']))
+
+    def _check_exclude_table(self, entry):
+        return self._exclude_tables.isdisjoint(_query_tables(entry['query']))
+
+    @property
+    def excluded_kinds(self):
+        """
+        Query kinds that are dropped regardless of other fields of entries
+
+        :rtype: frozenset
+        """
+        return self._exclude_kinds
+
+    def accepts_sql(self, sql):
+        """
+        Checks kind rules on a raw query, so that entries can be rejected before they are
+        normalized (None is accepted and left for the normalization)
+
+        :type sql str|None
+        :rtype: bool
+        """
+        if sql is None or not self._kind_checks:
+            return True
+
+        kind = query_kind(sql)
+
+        for (label, check) in self._kind_checks:
+            if not check(kind):
+                self.dropped[label] += 1
+                return False
+
+        return True
+
+    def __call__(self, entry):
+        """
+        :type entry dict
+        :rtype: bool
+        """
+        if self._kind_checks:
+            kind = query_kind(entry['query'])
+
+            for (label, check) in self._kind_checks:
+                if not check(kind):
+                    self.dropped[label] += 1
+                    return False
+
+        for (label, check) in self._entry_checks:
+            if not check(entry):
+                self.dropped[label] += 1
+                return False
+
+        return True
+
+    def summary(self):
+        """
+        Returns a single line with the number of entries dropped by every rule
+
+        :rtype: str
+        """
+        return ', '.join('{}: {}'.format(label, self.dropped[label])
+                         for (label, _) in self._kind_checks + self._entry_checks) or 'no rules'
+
+
+def find_query_filter(filter_func):
+    """
+    Returns QueryFilter given directly or wrapped with functools.partial
+    (e.g. partial(filter_since, query_filter, since)), None for other filter functions
+
+    :type filter_func (dict) -> bool
+    :rtype: QueryFilter|None
+    """
+    if isinstance(filter_func, QueryFilter):
+        return filter_func
+
+    if isinstance(filter_func, partial):
+        for func in (filter_func.func,) + filter_func.args:
+            query_filter = find_query_filter(func)
+
+            if query_filter is not None:
+                return query_filter
+
+    return None
@@ -0,0 +1,77 @@
+"""
+Fast SQL query fingerprinting
+
+generalize_sql_fast() produces the same normalized form as sql_metadata.generalize_sql
+(comments removed, strings replaced with X, numbers with N, lists with XYZ), but uses
+fewer precompiled passes and skips the ones that given query does not need.
+"""
+import re
+
+from hashlib import md5
+
+# MediaWiki comments (with preceding whitespace), e.g. /* Foo::bar N.N.N.N */
+# greedy and bound to a single line just like in sql_metadata
+_COMMENTS = re.compile(r'\s*/\*.+\*/')
+_STRINGS = re.compile(r"'[^']*'|\"[^\"]*\"")
+_NUMBERS = re.compile(r'-?[0-9]+')
+
+# WHERE foo IN ('880987','882618','708228','522330')
+_LISTS = re.compile(r' (IN|VALUES)\s*\([^,]+,[^)]+\)', flags=re.IGNORECASE)
+
+
+def _needs_compat(sql):
+    """
+    LIKE statements, escaped characters, mixed quotes and multi-line comments are rare,
+    but they are normalized in a way that depends on the order of sql_metadata passes
+
+    :type sql str
+    :rtype: bool
+    """
+    return 'LIKE' in sql or 'like' in sql or '%' in sql or '\\' in sql \
+        or ('"' in sql and "'" in sql) or ('\n' in sql and '/*' in sql)
+
+
+def generalize_sql_fast(sql):
+    """
+    Removes most variables from an SQL query and replaces them with X or N for numbers.
+
+    Drop-in replacement for sql_metadata.generalize_sql
+
+    :type sql str|None
+    :rtype: str|None
+    """
+    if sql is None:
+        return None
+
+    if _needs_compat(sql):
+        import sql_metadata
+        return sql_metadata.generalize_sql(sql)
+
+    if '/*' in sql:
+        sql = _COMMENTS.sub('', sql)
+
+    if "'" in sql or '"' in sql:
+        sql = _STRINGS.sub('X', sql)
+
+    # lists at the very beginning are only matched when preceded by whitespace
+    prefix = ' ' if sql[:1].isspace() else ''
+
+    # all newlines, tabs and multiple spaces replaced by a single space (and stripped)
+    sql = _NUMBERS.sub('N', ' '.join(sql.split()))
+
+    lowered = sql.lower()
+
+    if 'in' in lowered or 'values' in lowered:
+        sql = _LISTS.sub(' \\1 (XYZ)', prefix + sql)[len(prefix):]
+
+    return sql
+
+
+def fingerprint(normalized_sql):
+    """
+    Returns a stable 64-bit fingerprint of the normalized SQL query
+
+    :type normalized_sql str
+    :rtype: int
+    """
+    return int(md5(normalized_sql.encode('utf8')).hexdigest()[:16], 16)
@@ -0,0 +1,217 @@
+"""
+Follow mode: tails a growing SQL log and keeps a digest of a sliding time window
+
+Entries are folded into fixed-size time buckets as they arrive. Buckets that fall out
+of the window are dropped, so memory usage does not grow with the time the log is followed.
+"""
+import logging
+
+from os import SEEK_END, fstat, stat
+from time import sleep as time_sleep, time
+
+from .aggregate import QueryAggregator
+from .errors import QueryDigestReadError
+
+# window of the reported digest [sec] and how often it is reported
+DEFAULT_WINDOW = 300
+DEFAULT_INTERVAL = 10
+
+# how many buckets the window is split into
+BUCKETS_PER_WINDOW = 10
+
+
+def _open(path):
+    """
+    :type path str
+    :rtype: file|None
+    """
+    try:
+        return open(path, 'rb')
+    except (IOError, OSError):
+        return None
+
+
+def _rotated(path, handler):
+    """
+    Tells whether the file was rotated (moved away, replaced or truncated) since it was opened
+
+    :type path str
+    :type handler file|None
+    :rtype: bool
+    """
+    if handler is None:
+        return True
+
+    try:
+        current = stat(path)
+    except OSError:
+        return True
+
+    return current.st_ino != fstat(handler.fileno()).st_ino or current.st_size < handler.tell()
+
+
+def follow_lines(path, poll_interval=1., from_start=False, sleep=time_sleep, stop=None):
+    """
+    Lazily yields lines appended to a given file, like "tail -F" does
+
+    When the file is rotated it is reopened and read from its beginning.
+    None is yielded each time no new lines were found, before waiting for poll_interval.
+
+    :type path str
+    :type poll_interval float
+    :type from_start bool
+    :arg from_start: read the lines that are already in the file too
+    :type sleep (float) -> None
+    :type stop () -> bool
+    :arg stop: following ends when it returns True
+    :rtype: collections.Iterable[str|None]
+    :raises QueryDigestReadError
+    """
+    logger = logging.getLogger('follow_lines')
+
+    handler = _open(path)
+
+    if handler is None:
+        raise QueryDigestReadError('Can not open "{}" file'.format(path))
+
+    if not from_start:
+        handler.seek(0, SEEK_END)
+
+    pending = b''
+
+    try:
+        while stop is None or not stop():
+            line = handler.readline() if handler is not None else b''
+
+            if line:
+                # the line may be still being written
+                pending += line
+
+                if pending.endswith(b'\n'):
+                    yield pending.decode('utf8', 'replace')
+                    pending = b''
+
+                continue
+
+            if _rotated(path, handler):
+                if pending:
+                    yield pending.decode('utf8', 'replace')
+                    pending = b''
+
+                if handler is not None:
+                    handler.close()
+                    logger.info('"%s" file was rotated, reopening it', path)
+
+                handler = _open(path)
+
+                if handler is not None:
+                    continue
+
+            yield None
+            sleep(poll_interval)
+    finally:
+        if handler is not None:
+            handler.close()
+
+
+class SlidingWindowAggregator(object):
+    """
+    Keeps a QueryAggregator for each time bucket of the window, the oldest ones expire
+    """
+    def __init__(self, window=DEFAULT_WINDOW, bucket_size=None):
+        """
+        :type window int
+        :type bucket_size int|None
+        """
+        self.window = window
+        self.bucket_size = bucket_size or max(1, window // BUCKETS_PER_WINDOW)
+        self.buckets = dict()
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def _bucket_start(self, timestamp):
+        """
+        :type timestamp float
+        :rtype: int
+        """
+        return int(timestamp // self.bucket_size * self.bucket_size)
+
+    def add(self, entry, now):
+        """
+        :type entry dict
+        :type now float
+        :arg now: used for entries without a timestamp
+        """
+        timestamp = entry.get('timestamp')
+        key = self._bucket_start(timestamp if timestamp is not None else now)
+
+        if key + self.bucket_size <= now - self.window:
+            return
+
+        bucket = self.buckets.get(key)
+
+        if bucket is None:
+            bucket = self.buckets[key] = QueryAggregator()
+
+        bucket.add(entry)
+
+    def expire(self, now):
+        """
+        Drops buckets that are out of the window
+
+        :type now float
+        """
+        for key in [key for key in self.buckets if key + self.bucket_size <= now - self.window]:
+            del self.buckets[key]
+
+    def aggregate(self, now):
+        """
+        Merges buckets of the window ending now into a single aggregate
+
+        :type now float
+        :rtype: QueryAggregator
+        """
+        self.expire(now)
+
+        aggregator = QueryAggregator()
+
+        for key in sorted(self.buckets):
+            # merge a copy, keep buckets intact
+            aggregator.merge(QueryAggregator.from_state(self.buckets[key].to_state()))
+
+        return aggregator
+
+
+def follow_digest(lines, normalize_func, filter_func, emit, window=DEFAULT_WINDOW,
+                  interval=DEFAULT_INTERVAL, clock=time):
+    """
+    Aggregates lines as they come and emits the digest of the window every interval
+
+    :type lines collections.Iterable[str|dict|None]
+    :arg lines: lines or raw entries (e.g. parsed slow log ones),
+        None items mean that there are no new lines at the moment
+    :type normalize_func (str|dict) -> dict
+    :type filter_func (dict) -> bool
+    :type emit (QueryAggregator, float) -> None
+    :type window int
+    :type interval int
+    :type clock () -> float
+    """
+    sliding_window = SlidingWindowAggregator(window)
+    next_emit = clock() + interval
+
+    for line in lines:
+        now = clock()
+
+        # filter out lines with SQL commands (-- foo) and empty ones
+        if line is not None and (isinstance(line, dict) or
+                                 not line.startswith('--') and line.strip()):
+            entry = normalize_func(line)
+
+            if filter_func(entry):
+                sliding_window.add(entry, now)
+
+        if now >= next_emit:
+            emit(sliding_window.aggregate(now), now)
+            next_emit = now + interval
@@ -0,0 +1,173 @@
+"""
+Approximate top query kinds with bounded memory (see --approx-top)
+
+Weighted Space-Saving keeps stats for a fixed number of query kinds only. When a kind that
+is not monitored arrives and all counters are taken, the one with the smallest counter
+is replaced and the new kind inherits its value as the maximum error.
+
+Reported stats cover entries seen since the kind is monitored, so they are lower bounds:
+the real total time (or count) is at most the reported one plus the reported error.
+
+@see Metwally et al., Efficient Computation of Frequent and Top-k Elements in Data Streams
+"""
+from heapq import heapify, heappop, heappush, nlargest
+
+from .aggregate import QueryStats, entry_key
+
+# how many more query kinds than reported are monitored, the more the smaller the errors
+CAPACITY_FACTOR = 10
+
+
+class SpaceSavingAggregator(object):  # pylint: disable=too-many-instance-attributes
+    """
+    Keeps stats of at most capacity query kinds, ranked by total time (or by count)
+    """
+    def __init__(self, top, capacity=None, by_time=True, key_func=entry_key):
+        """
+        :type top int
+        :type capacity int|None
+        :type by_time bool
+        :arg by_time: rank query kinds by total time, by count otherwise
+        :type key_func (dict) -> str
+        """
+        self.top = top
+        self.capacity = capacity or top * CAPACITY_FACTOR
+        self.by_time = by_time
+
+        self._key_func = key_func
+
+        self._stats = dict()
+        # key -> [counter, maximum error of the counter]
+        self._counters = dict()
+        # (counter, key) min-heap, counters in it can be smaller than the current ones
+        self._heap = []
+
+        self.total = 0
+
+    def __len__(self):
+        return len(self._stats)
+
+    def _weight(self, entry):
+        """
+        :type entry dict
+        :rtype: float
+        """
+        return entry.get('time', 0) if self.by_time else 1
+
+    def _evict(self):
+        """
+        Stops monitoring the query kind with the smallest counter and returns the counter
+
+        :rtype: float
+        """
+        while True:
+            (counter, key) = heappop(self._heap)
+            current = self._counters[key][0]
+
+            if current == counter:
+                del self._counters[key]
+                del self._stats[key]
+                return counter
+
+            # the counter has grown since it was pushed
+            heappush(self._heap, (current, key))
+
+    def add(self, entry):
+        """
+        :type entry dict
+        """
+        key = self._key_func(entry)
+        weight = self._weight(entry)
+
+        self.total += 1
+
+        counter = self._counters.get(key)
+
+        if counter is None:
+            error = self._evict() if len(self._stats) >= self.capacity else 0
+
+            counter = self._counters[key] = [error, error]
+            self._stats[key] = QueryStats(entry)
+            heappush(self._heap, (error, key))
+
+        counter[0] += weight
+        self._stats[key].add(entry)
+
+    def update(self, entries):
+        """
+        :type entries collections.Iterable[dict]
+        :rtype: SpaceSavingAggregator
+        """
+        for entry in entries:
+            self.add(entry)
+
+        return self
+
+    def _min_counter(self):
+        """
+        The largest counter a query kind that is not monitored can have
+
+        :rtype: float
+        """
+        if len(self._stats) < self.capacity:
+            return 0
+
+        return min(counter for (counter, _) in self._counters.values())
+
+    def merge(self, other):
+        """
+        Fold the state of another aggregator into this one (mergeable summaries),
+        query kinds missing in one of them get its smallest counter as the error
+
+        :type other SpaceSavingAggregator
+        :rtype: SpaceSavingAggregator
+        """
+        # pylint: disable=protected-access
+        (own_min, other_min) = (self._min_counter(), other._min_counter())
+
+        merged = dict()
+
+        for key in set(self._counters) | set(other._counters):
+            (own_counter, own_error) = self._counters.get(key, (own_min, own_min))
+            (other_counter, other_error) = other._counters.get(key, (other_min, other_min))
+
+            merged[key] = [own_counter + other_counter, own_error + other_error]
+
+        keep = nlargest(self.capacity, merged, key=lambda key: merged[key][0])
+
+        stats = dict()
+
+        for key in keep:
+            own = self._stats.get(key)
+            theirs = other._stats.get(key)
+
+            if own is not None and theirs is not None:
+                own.merge(theirs)
+
+            stats[key] = own if own is not None else theirs
+
+        self._stats = stats
+        self._counters = dict((key, merged[key]) for key in keep)
+        self._heap = [(counter, key) for (key, (counter, _)) in self._counters.items()]
+        heapify(self._heap)
+
+        self.total += other.total
+        return self
+
+    def results(self, top=None):
+        """
+        Yields (key, entry) pairs of query kinds with the highest counters
+
+        Entries have the maximum error of the total time (or count) reported too.
+
+        :type top int|None
+        :rtype: collections.Iterable[tuple]
+        """
+        top = min(top or self.top, self.top)
+        error_field = 'time_sum_error' if self.by_time else 'count_error'
+
+        for key in nlargest(top, self._counters, key=lambda key: self._counters[key][0]):
+            entry = self._stats[key].as_dict(self.total)
+            entry[error_field] = self._counters[key][1]
+
+            yield key, entry
@@ -0,0 +1,177 @@
+"""
+Persistent SQLite index of digests keyed by query fingerprint, method and source host
+
+Every run stores its per query kind aggregates, so that two runs can be compared
+with index lookups only, without fetching and aggregating log entries again.
+"""
+import logging
+import sqlite3
+
+from collections import OrderedDict
+
+from .errors import QueryDigestCommandLineError
+from .fingerprint import fingerprint
+
+# stats columns kept for every query kind
+STATS_COLUMNS = ('count', 'time_sum', 'time_median', 'time_p95', 'time_p99', 'rows_sum')
+
+# by default a query kind is reported as regressed when its total or p95 time grew by 10%
+DEFAULT_THRESHOLD = 0.1
+
+
+def to_signed(value):
+    """
+    SQLite integers are signed, store 64-bit fingerprints as such
+
+    :type value int
+    :rtype: int
+    """
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class FingerprintIndex(object):
+    """
+    Stores aggregates of digest runs and compares them
+    """
+    def __init__(self, path):
+        """
+        :type path str
+        """
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._connection = sqlite3.connect(path)
+
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS runs '
+                '(run TEXT PRIMARY KEY, source TEXT, created INTEGER, total INTEGER)'
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS stats ('
+                'run TEXT, fingerprint INTEGER, method TEXT, source_host TEXT, '
+                'dbname TEXT, query TEXT, {}, '
+                'PRIMARY KEY (run, fingerprint, method, source_host)'
+                ') WITHOUT ROWID'.format(', '.join(
+                    '{} REAL'.format(column) for column in STATS_COLUMNS))
+            )
+
+    def runs(self):
+        """
+        Returns names of stored runs, the oldest first
+
+        :rtype: list[str]
+        """
+        return [
+            row[0] for row in
+            self._connection.execute('SELECT run FROM runs ORDER BY created, run')
+        ]
+
+    def save_run(self, run, data, total, source='', created=0):
+        """
+        Stores (or replaces) aggregates of a given run
+
+        :type run str
+        :type data collections.Iterable[dict]
+        :type total int
+        :type source str
+        :type created int
+        """
+        # primary key columns can not be NULL, e.g. backend entries may have no method
+        rows = (
+            (run, to_signed(fingerprint(entry.get('query'))), entry.get('method') or '',
+             entry.get('source_host') or '', entry.get('dbname'), entry.get('query')) +
+            tuple(entry.get(column) for column in STATS_COLUMNS)
+            for entry in data
+        )
+
+        with self._connection:
+            self._connection.execute('DELETE FROM stats WHERE run = ?', (run,))
+            self._connection.execute(
+                'INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)', (run, source, created, total))
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?, ?, ?, {})'.format(
+                    ', '.join('?' * len(STATS_COLUMNS))),
+                rows
+            )
+
+        self._logger.info('Saved run "%s" with %d queries', run, total)
+
+    def _check_run(self, run):
+        """
+        :type run str
+        :raises QueryDigestCommandLineError
+        """
+        if self._connection.execute('SELECT 1 FROM runs WHERE run = ?', (run,)).fetchone() is None:
+            raise QueryDigestCommandLineError('Run "{}" not found in the index, try: {}'.format(
+                run, ', '.join(self.runs()) or 'none stored yet'))
+
+    def diff(self, run_a, run_b, threshold=DEFAULT_THRESHOLD):
+        """
+        Returns query kinds that are new in run_b, disappeared since run_a
+        or regressed by more than the threshold (relative change of time_sum or time_p95).
+
+        The biggest changes of total time are reported first.
+
+        :type run_a str
+        :type run_b str
+        :type threshold float
+        :rtype: list[OrderedDict]
+        """
+        self._check_run(run_a)
+        self._check_run(run_b)
+
+        def columns(alias_a, alias_b):
+            """
+            :type alias_a str
+            :type alias_b str
+            :rtype: str
+            """
+            return ', '.join(
+                '{}.{column}, {}.{column}'.format(alias_a, alias_b, column=column)
+                for column in STATS_COLUMNS
+            )
+
+        # rows of run "x" are looked up in run "y" using its primary key
+        query = (
+            'SELECT ? AS change, x.method, x.source_host, x.dbname, x.query, {columns} '
+            'FROM stats AS x LEFT JOIN stats AS y ON y.run = ? '
+            'AND y.fingerprint = x.fingerprint AND y.method = x.method '
+            'AND y.source_host = x.source_host '
+            'WHERE x.run = ? AND {where}'
+        )
+
+        results = []
+
+        # new query kinds (not found in run_a) and disappeared ones (not found in run_b)
+        results += self._connection.execute(
+            query.format(columns=columns('y', 'x'), where='y.run IS NULL'),
+            ('new', run_a, run_b)).fetchall()
+
+        results += self._connection.execute(
+            query.format(columns=columns('x', 'y'), where='y.run IS NULL'),
+            ('disappeared', run_b, run_a)).fetchall()
+
+        # regressed query kinds
+        results += self._connection.execute(
+            query.format(
+                columns=columns('y', 'x'),
+                where='(x.time_sum > y.time_sum * ? OR x.time_p95 > y.time_p95 * ?)'),
+            ('regressed', run_a, run_b, 1 + threshold, 1 + threshold)).fetchall()
+
+        header = ['change', 'method', 'source_host', 'dbname', 'query']
+
+        for column in STATS_COLUMNS:
+            header += ['{}_a'.format(column), '{}_b'.format(column)]
+
+        diff = [OrderedDict(zip(header, row)) for row in results]
+
+        return sorted(
+            diff,
+            key=lambda row: abs((row['time_sum_b'] or 0) - (row['time_sum_a'] or 0)),
+            reverse=True
+        )
+
+    def close(self):
+        """
+        Closes the index
+        """
+        self._connection.close()
@@ -1,6 +1,8 @@
 """
 Some math helpes
 """
+from array import array
+from math import ceil, log
 
 
 def median(data_list):
@@ -23,3 +25,190 @@ def median(data_list):
     high_index = int(length / 2)
     average = (data_list[low_index] + data_list[high_index]) / 2
     return average
+
+
+def _interpolate(sorted_list, quantile):
+    """
+    Returns the quantile of a sorted list of numbers using linear interpolation between
+    the closest ranks (the median of an even-length list is the average of the two middle values)
+
+    :type sorted_list list[float]
+    :type quantile float
+    :rtype: float
+    """
+    position = quantile * (len(sorted_list) - 1)
+    low_index = int(position)
+    high_index = min(low_index + 1, len(sorted_list) - 1)
+
+    return sorted_list[low_index] + \
+        (sorted_list[high_index] - sorted_list[low_index]) * (position - low_index)
+
+
+class QuantileSketch(object):
+    """
+    Mergeable quantile sketch of non-negative numbers with bounded relative error (DDSketch).
+
+    Samples are kept as they are (and quantiles are exact) until exact_limit of them are added.
+    Then they're folded into logarithmically spaced buckets, so that memory usage is bounded
+    by the range of values, not their number, and any quantile is within relative_accuracy
+    of the exact value.
+
+    @see https://arxiv.org/abs/1908.10693
+    """
+    __slots__ = (
+        'relative_accuracy', 'exact_limit', 'count', '_gamma', '_samples', '_bins', '_zero_count',
+    )
+
+    # values smaller than that are counted as zeros
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy=0.01, exact_limit=128):
+        """
+        :type relative_accuracy float
+        :type exact_limit int
+        """
+        self.relative_accuracy = relative_accuracy
+        self.exact_limit = exact_limit
+        self.count = 0
+
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._samples = array('d')
+        self._bins = None
+        self._zero_count = 0
+
+    def _bin_index(self, value):
+        """
+        :type value float
+        :rtype: int
+        """
+        return int(ceil(log(value) / log(self._gamma)))
+
+    def _add_to_bins(self, value, count=1):
+        """
+        :type value float
+        :type count int
+        """
+        if value < self.MIN_VALUE:
+            self._zero_count += count
+        else:
+            index = self._bin_index(value)
+            self._bins[index] = self._bins.get(index, 0) + count
+
+    def _collapse(self):
+        """
+        Fold kept samples into buckets
+        """
+        if self._bins is not None:
+            return
+
+        self._bins = dict()
+
+        for value in self._samples:
+            self._add_to_bins(value)
+
+        self._samples = None
+
+    def add(self, value):
+        """
+        :type value float
+        """
+        self.count += 1
+
+        if self._bins is None:
+            self._samples.append(value)
+
+            if len(self._samples) > self.exact_limit:
+                self._collapse()
+        else:
+            self._add_to_bins(value)
+
+    def merge(self, other):
+        """
+        Fold the state of another sketch (with the same relative accuracy) into this one
+
+        :type other QuantileSketch
+        """
+        # pylint: disable=protected-access
+        if self._bins is None and other._bins is None \
+                and self.count + other.count <= self.exact_limit:
+            self._samples.extend(other._samples)
+            self.count += other.count
+            return
+
+        self._collapse()
+        self.count += other.count
+
+        if other._bins is None:
+            for value in other._samples:
+                self._add_to_bins(value)
+        else:
+            self._zero_count += other._zero_count
+
+            for index, count in other._bins.items():
+                self._bins[index] = self._bins.get(index, 0) + count
+
+    def to_state(self):
+        """
+        Returns JSON-serializable state of the sketch
+
+        :rtype: dict
+        """
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'exact_limit': self.exact_limit,
+            'count': self.count,
+            'samples': list(self._samples) if self._bins is None else None,
+            'bins': dict((str(index), count) for (index, count) in self._bins.items())
+                    if self._bins is not None else None,
+            'zero_count': self._zero_count,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Restores the sketch from the state returned by to_state()
+
+        :type state dict
+        :rtype: QuantileSketch
+        """
+        # pylint: disable=protected-access
+        sketch = cls(relative_accuracy=state['relative_accuracy'], exact_limit=state['exact_limit'])
+        sketch.count = state['count']
+        sketch._zero_count = state['zero_count']
+
+        if state['bins'] is None:
+            sketch._samples = array('d', state['samples'])
+        else:
+            sketch._samples = None
+            sketch._bins = dict((int(index), count) for (index, count) in state['bins'].items())
+
+        return sketch
+
+    def quantile(self, quantile):
+        """
+        Returns the value at given quantile (0.5 is the median) or None for an empty sketch
+
+        :type quantile float
+        :rtype: float|None
+        """
+        if not self.count:
+            return None
+
+        if self._bins is None:
+            return _interpolate(sorted(self._samples), quantile)
+
+        rank = quantile * (self.count - 1)
+
+        if rank < self._zero_count:
+            return 0.
+
+        seen = self._zero_count
+
+        for index in sorted(self._bins):
+            seen += self._bins[index]
+
+            if seen > rank:
+                # the middle of the bucket
+                return 2. * self._gamma ** index / (self._gamma + 1)
+
+        return 2. * self._gamma ** max(self._bins) / (self._gamma + 1)
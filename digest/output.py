@@ -0,0 +1,105 @@
+"""
+Output formatters for aggregated query stats
+
+All of them but the default table write rows one by one as they are consumed from data.
+"""
+from __future__ import unicode_literals
+
+from csv import DictWriter
+from itertools import chain
+
+from .dataflow import build_data_flow_graph
+
+
+def write_csv(output, data, report_header):
+    """
+    --csv: CSV-formatted statistics for further processing
+
+    :type output io.TextIOBase
+    :type data collections.Iterable[dict]
+    :type report_header str
+    """
+    data = iter(data)
+    first = next(data)
+
+    writer = DictWriter(f=output, fieldnames=first.keys())
+
+    output.write('# {}\n'.format(report_header))
+    writer.writeheader()
+
+    for entry in chain([first], data):
+        writer.writerow(entry)
+
+
+def write_simple(output, data, report_header):
+    """
+    --simple: list queries only
+
+    :type output io.TextIOBase
+    :type data collections.Iterable[dict]
+    :type report_header str
+    """
+    output.write(report_header + '\n')
+
+    for entry in data:
+        output.write(
+            '{method} {percentage} [{source_host}] db:{dbname} '
+            'p95:{time_p95:.2f}ms p99:{time_p99:.2f}ms | {query}\n'.format(**entry))
+
+
+def write_data_flow(output, data, report_header, query_metadata=None, max_queries=None,
+                    jobs=1, graph_format='tsv'):
+    """
+    --data-flow: TSV suitable for data-flow-graph visualization (or DOT / GraphML)
+
+    Edges shared by many query kinds are reported once, with their stats summed up.
+
+    :type output io.TextIOBase
+    :type data collections.Iterable[dict]
+    :type report_header str
+    :type query_metadata dict|None
+    :arg query_metadata: (kind, tables) tuples extracted during the aggregation
+    :type max_queries int|None
+    :arg max_queries: edge weights are relative to it, the heaviest edge count by default
+    :type jobs int
+    :arg jobs: worker processes used to build the graph
+    :type graph_format str
+    :arg graph_format: tsv, dot or graphml
+    """
+    graph = build_data_flow_graph(data, query_metadata=query_metadata, jobs=jobs)
+    graph.write(output, report_header, graph_format=graph_format, max_queries=max_queries)
+
+
+def write_sql_log(output, data, report_header):
+    """
+    --sql-log: real queries SQL log (index-digest input)
+
+    :type output io.TextIOBase
+    :type data collections.Iterable[dict]
+    :type report_header str
+    """
+    output.write('-- {}\n'.format(report_header))
+
+    for entry in data:
+        output.write('/* {} */ {}\n'.format(
+            entry.get('method'),
+            entry.get('original_query', '').replace("\n", ' ').encode('utf-8')
+        ))
+
+
+def write_table(output, data, report_header):
+    """
+    The default output: a table with all the stats
+
+    Columns widths depend on all rows, so the table is rendered as a whole.
+
+    :type output io.TextIOBase
+    :type data collections.Iterable[dict]
+    :type report_header str
+    """
+    # @see https://pypi.python.org/pypi/tabulate
+    from tabulate import tabulate
+
+    output.write(report_header + '\n')
+    output.write(tabulate(list(data), headers='keys', tablefmt='grid') + '\n')
+    output.write('Note: times are in [ms], queries are normalized' + '\n')
@@ -0,0 +1,120 @@
+"""
+Normalize and pre-aggregate log entries using a pool of worker processes
+"""
+import logging
+
+from collections import deque
+from functools import partial
+from itertools import islice
+
+from .aggregate import QueryAggregator
+from .filters import find_query_filter
+
+# how many raw entries are sent to a worker at once
+CHUNK_SIZE = 5000
+
+
+def iter_chunks(items, size):
+    """
+    Lazily splits given iterable into lists of at most size items
+
+    :type items collections.Iterable
+    :type size int
+    :rtype: collections.Iterable[list]
+    """
+    items = iter(items)
+
+    while True:
+        chunk = list(islice(items, size))
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def aggregate_chunk(aggregator_class, normalize_func, filter_func, chunk):
+    """
+    Normalizes, filters and aggregates a chunk of raw entries (run by worker processes)
+
+    Entries dropped by QueryFilter rules are counted by its copy sent with the chunk,
+    the counts are returned together with the partial aggregate.
+
+    :type aggregator_class type
+    :type normalize_func (object) -> dict
+    :type filter_func (dict) -> bool
+    :type chunk list
+    :rtype: tuple[QueryAggregator, collections.Counter|None]
+    """
+    aggregator = aggregator_class().update(filter(filter_func, map(normalize_func, chunk)))
+    query_filter = find_query_filter(filter_func)
+
+    return aggregator, query_filter.dropped if query_filter is not None else None
+
+
+def aggregate_sources(sources, filter_func, jobs=1, chunk_size=CHUNK_SIZE,
+                      aggregator_class=QueryAggregator, initializer=None, initargs=()):
+    """
+    Aggregates entries from given (raw entries, normalize function) pairs.
+
+    When more than one job is requested, raw entries are sharded across a process pool,
+    each worker normalizes and pre-aggregates its chunk and partial aggregates are merged here.
+
+    :type sources list[tuple]
+    :type filter_func (dict) -> bool
+    :type jobs int
+    :type chunk_size int
+    :type aggregator_class type
+    :type initializer (*object) -> None|None
+    :arg initializer: called with initargs when a worker process starts
+        (module globals set in this process are not inherited with spawn and forkserver)
+    :type initargs tuple
+    :rtype: QueryAggregator
+    """
+    # pylint: disable=too-many-locals
+    aggregator = aggregator_class()
+
+    if jobs <= 1:
+        for entries, normalize_func in sources:
+            aggregator.update(filter(filter_func, map(normalize_func, entries)))
+
+        return aggregator
+
+    logger = logging.getLogger('aggregate_sources')
+    logger.info('Using %d worker processes', jobs)
+
+    # worker processes are not used by the most of runs, do not import multiprocessing upfront
+    from multiprocessing import Pool
+
+    pool = Pool(processes=jobs, initializer=initializer, initargs=initargs)
+
+    # entries dropped by filter rules in worker processes are counted in this process too
+    query_filter = find_query_filter(filter_func)
+
+    def merge(result):
+        (partial_aggregator, dropped) = result
+        aggregator.merge(partial_aggregator)
+
+        if dropped and query_filter is not None:
+            query_filter.dropped.update(dropped)
+
+    try:
+        for entries, normalize_func in sources:
+            worker = partial(aggregate_chunk, aggregator_class, normalize_func, filter_func)
+
+            # keep the number of chunks in flight bounded, merge in the submission order
+            pending = deque()
+
+            for chunk in iter_chunks(entries, chunk_size):
+                pending.append(pool.apply_async(worker, (chunk,)))
+
+                if len(pending) >= 2 * jobs:
+                    merge(pending.popleft().get())
+
+            while pending:
+                merge(pending.popleft().get())
+    finally:
+        pool.close()
+        pool.join()
+
+    return aggregator
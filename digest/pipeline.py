@@ -0,0 +1,416 @@
+"""
+Library API: digests built from composable, iterator-based stages
+
+    source -> normalizer -> filter -> aggregator -> digest -> sink
+
+Example:
+
+    from digest.pipeline import Pipeline, Source
+
+    digest = Pipeline([Source.from_file('/var/log/queries.log')]).run()
+
+    for stats in digest.results(top=10):
+        print(stats.query, stats.count, stats.time_p95)
+
+Every stage can be used on its own too, e.g. Filter().process(Normalizer(func).process(entries)).
+"""
+from collections import namedtuple
+from functools import partial
+from itertools import chain
+from operator import itemgetter
+
+from .aggregate import QueryAggregator
+from .filters import DEFAULT_EXCLUDED_KINDS, find_query_filter
+from .output import write_data_flow, write_table
+from .parallel import aggregate_sources
+from .profile import NullProfiler
+from .queries import filter_query, iter_file_queries, iter_slow_log_queries, \
+    get_normalizer, get_skipped_kinds, normalize_file_entry, normalize_slow_log_entry, \
+    set_normalizer, set_skipped_kinds
+
+
+def _identity(entry):
+    """
+    Used by sources of already normalized entries (a module-level function can be pickled)
+
+    :type entry dict
+    :rtype: dict
+    """
+    return entry
+
+
+def _init_worker(normalizer, skipped_kinds):
+    """
+    Sets up the SQL normalization of a worker process the same way as in this process
+
+    :type normalizer str
+    :type skipped_kinds frozenset
+    """
+    set_normalizer(normalizer)
+    set_skipped_kinds(skipped_kinds)
+
+
+class QueryKindStats(namedtuple('QueryKindStats', [
+        'query', 'original_query', 'method', 'dbname', 'source_host', 'count', 'percentage',
+        'time_sum', 'time_median', 'time_p95', 'time_p99', 'rows_sum', 'rows_median', 'rows_p95',
+])):
+    """
+    Typed stats of a single kind of queries (percentage is a number here)
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_entry(cls, entry, total):
+        """
+        :type entry dict
+        :arg entry: as reported by aggregators' results()
+        :type total int
+        :rtype: QueryKindStats
+        """
+        values = dict((field, entry.get(field)) for field in cls._fields)
+        values['percentage'] = 100. * entry.get('count') / total
+
+        return cls(**values)
+
+
+class Normalizer(object):  # pylint: disable=too-few-public-methods
+    """
+    Turns raw log entries into normalized ones
+    """
+    def __init__(self, func):
+        """
+        :type func (object) -> dict
+        """
+        self.func = func
+
+    def process(self, entries):
+        """
+        :type entries collections.Iterable
+        :rtype: collections.Iterable[dict]
+        """
+        func = self.func
+        return (func(entry) for entry in entries)
+
+
+class Source(object):
+    """
+    Raw log entries and the normalizer that understands them
+    """
+    def __init__(self, entries, normalizer, raw_sql=None):
+        """
+        :type entries collections.Iterable
+        :type normalizer Normalizer|(object) -> dict
+        :type raw_sql (object) -> str|None
+        :arg raw_sql: returns SQL of a raw entry, lets filters drop it before the normalization
+        """
+        self.entries = entries
+        self.normalizer = normalizer if isinstance(normalizer, Normalizer) \
+            else Normalizer(normalizer)
+        self.raw_sql = raw_sql
+
+    def fetch(self):
+        """
+        Returns raw entries
+
+        :rtype: collections.Iterable
+        """
+        return self.entries
+
+    def __iter__(self):
+        """
+        Yields normalized entries
+        """
+        return iter(self.normalizer.process(self.fetch()))
+
+    @classmethod
+    def from_file(cls, file_path, use_mmap=False, slow_log=False):
+        """
+        Raw SQL queries (one per line) or MySQL slow query log entries read from a file
+
+        :type file_path str
+        :type use_mmap bool
+        :type slow_log bool
+        :rtype: Source
+        """
+        if slow_log:
+            return cls(iter_slow_log_queries(file_path, use_mmap=use_mmap),
+                       normalize_slow_log_entry, raw_sql=itemgetter('sql'))
+
+        return cls(iter_file_queries(file_path, use_mmap=use_mmap), normalize_file_entry,
+                   raw_sql=_identity)
+
+    @classmethod
+    def from_queries(cls, queries):
+        """
+        Raw SQL queries, e.g. collected by a service
+
+        :type queries collections.Iterable[str]
+        :rtype: Source
+        """
+        return cls(queries, normalize_file_entry, raw_sql=_identity)
+
+    @classmethod
+    def from_entries(cls, entries):
+        """
+        Entries that are already normalized (dicts with query, method, source_host, time, ...)
+
+        :type entries collections.Iterable[dict]
+        :rtype: Source
+        """
+        return cls(entries, _identity)
+
+
+class Filter(object):  # pylint: disable=too-few-public-methods
+    """
+    Drops entries that should not be reported (transactions by default)
+    """
+    def __init__(self, func=filter_query, raw_func=None):
+        """
+        :type func (dict) -> bool
+        :type raw_func (str) -> bool|None
+        :arg raw_func: checks raw SQL, e.g. QueryFilter.accepts_sql
+        """
+        self.func = func
+        self.raw_func = raw_func
+
+    def process_raw(self, entries, raw_sql):
+        """
+        Drops raw entries before they are normalized (when both the filter and the source can)
+
+        :type entries collections.Iterable
+        :type raw_sql (object) -> str|None
+        :rtype: collections.Iterable
+        """
+        if self.raw_func is None or raw_sql is None:
+            return entries
+
+        raw_func = self.raw_func
+        return (entry for entry in entries if raw_func(raw_sql(entry)))
+
+    def dropped_kinds(self):
+        """
+        Returns query kinds that are always dropped, so that they do not need to be normalized
+        (none when it can not be told for the filter function)
+
+        :rtype: frozenset
+        """
+        query_filter = find_query_filter(self.func)
+
+        if query_filter is not None:
+            return query_filter.excluded_kinds
+
+        # e.g. partial(filter_since, filter_query, since)
+        funcs = (self.func.func,) + self.func.args if isinstance(self.func, partial) \
+            else (self.func,)
+
+        return DEFAULT_EXCLUDED_KINDS if filter_query in funcs else frozenset()
+
+    def process(self, entries):
+        """
+        :type entries collections.Iterable[dict]
+        :rtype: collections.Iterable[dict]
+        """
+        func = self.func
+        return (entry for entry in entries if func(entry))
+
+
+class Digest(object):
+    """
+    Aggregated stats of query kinds
+    """
+    def __init__(self, aggregator):
+        """
+        :type aggregator QueryAggregator
+        :arg aggregator: or any other aggregator implementing results()
+        """
+        self.aggregator = aggregator
+
+    def __len__(self):
+        return len(self.aggregator)
+
+    @property
+    def total(self):
+        """
+        The number of aggregated entries
+
+        :rtype: int
+        """
+        return self.aggregator.total
+
+    def entries(self, top=None):
+        """
+        Yields reported entries (dicts) of query kinds, the highest total time first
+
+        :type top int|None
+        :rtype: collections.Iterable[dict]
+        """
+        return (entry for (_, entry) in self.aggregator.results(top=top))
+
+    def results(self, top=None):
+        """
+        Yields stats of query kinds, the highest total time first
+
+        :type top int|None
+        :rtype: collections.Iterable[QueryKindStats]
+        """
+        return (QueryKindStats.from_entry(entry, self.total) for entry in self.entries(top))
+
+    def query_metadata(self):
+        """
+        Returns (kind, tables) tuples extracted during the aggregation keyed by normalized query
+
+        :rtype: dict|None
+        """
+        if isinstance(self.aggregator, QueryAggregator):
+            return self.aggregator.query_metadata()
+
+        return None
+
+
+class Aggregator(object):  # pylint: disable=too-few-public-methods
+    """
+    Folds normalized entries into per query kind stats
+    """
+    def __init__(self, aggregator_class=QueryAggregator, jobs=1):
+        """
+        :type aggregator_class type
+        :arg aggregator_class: e.g. QueryAggregator, ColumnarAggregator or SpaceSavingAggregator
+        :type jobs int
+        :arg jobs: worker processes used by Pipeline (normalize functions need to be picklable)
+        """
+        self.aggregator_class = aggregator_class
+        self.jobs = jobs
+
+    def process(self, entries):
+        """
+        :type entries collections.Iterable[dict]
+        :rtype: Digest
+        """
+        return Digest(self.aggregator_class().update(entries))
+
+
+class Sink(object):  # pylint: disable=too-few-public-methods
+    """
+    Writes a digest using one of the formatters from digest.output
+    """
+    def __init__(self, output, writer=write_table):
+        """
+        :type output io.TextIOBase
+        :type writer (io.TextIOBase, collections.Iterable[dict], str) -> None
+        """
+        self.output = output
+        self.writer = writer
+
+        # the number of entries passed to the writer by the last write() call
+        self.written = 0
+
+    def _count(self, entries):
+        """
+        :type entries collections.Iterable[dict]
+        :rtype: collections.Iterable[dict]
+        """
+        for entry in entries:
+            self.written += 1
+            yield entry
+
+    def write(self, digest, report_header, top=None, entries=None):
+        """
+        :type digest Digest
+        :type report_header str
+        :type top int|None
+        :type entries collections.Iterable[dict]|None
+        :arg entries: the digest's entries (e.g. wrapped by the profiler)
+        :rtype: int
+        :return: the number of entries written
+        """
+        if entries is None:
+            entries = digest.entries(top)
+
+        self.written = 0
+        entries = self._count(entries)
+
+        # e.g. partial(write_data_flow, jobs=4)
+        if getattr(self.writer, 'func', self.writer) is write_data_flow:
+            self.writer(self.output, entries, report_header,
+                        query_metadata=digest.query_metadata())
+        else:
+            self.writer(self.output, entries, report_header)
+
+        return self.written
+
+
+class Pipeline(object):  # pylint: disable=too-few-public-methods
+    """
+    Normalizes, filters and aggregates entries from all sources into a single digest
+    """
+    def __init__(self, sources, filter_stage=None, aggregator=None, profiler=None):
+        """
+        :type sources list[Source]
+        :type filter_stage Filter|None
+        :type aggregator Aggregator|None
+        :type profiler digest.profile.Profiler|None
+        """
+        self.sources = sources
+        self.filter = filter_stage or Filter()
+        self.aggregator = aggregator or Aggregator()
+        self.profiler = profiler or NullProfiler()
+
+    def run(self):
+        """
+        :rtype: Digest
+        """
+        # queries that the filter keeps are never left not normalized
+        set_skipped_kinds(self.filter.dropped_kinds())
+
+        if self.aggregator.jobs > 1:
+            return self._run_parallel()
+
+        profiler = self.profiler
+
+        # time spent waiting for entries is reported as "fetch",
+        # the time of every stage does not include the time of the stages it pulls entries from
+        streams = []
+
+        for source in self.sources:
+            entries = profiler.iterate('fetch', source.fetch())
+
+            # raw entries are rejected here, before they are normalized
+            if self.filter.raw_func is not None and source.raw_sql is not None:
+                entries = profiler.iterate(
+                    'prefilter', self.filter.process_raw(entries, source.raw_sql))
+
+            entries = profiler.iterate('normalize', source.normalizer.process(entries))
+            streams.append(profiler.iterate('filter', self.filter.process(entries)))
+
+        with profiler.stage('aggregate'):
+            digest = self.aggregator.process(chain.from_iterable(streams))
+
+        profiler.count('aggregate', digest.total)
+
+        return digest
+
+    def _run_parallel(self):
+        """
+        Stages functions are sent to worker processes (they need to be picklable),
+        raw entries are rejected before they are sent. Worker processes are not profiled.
+
+        :rtype: Digest
+        """
+        profiler = self.profiler
+
+        sources = [
+            (self.filter.process_raw(profiler.iterate('fetch', source.fetch()), source.raw_sql),
+             source.normalizer.func)
+            for source in self.sources
+        ]
+
+        with profiler.stage('aggregate'):
+            # workers use the same SQL normalization function as this process
+            aggregator = aggregate_sources(
+                sources, filter_func=self.filter.func, jobs=self.aggregator.jobs,
+                aggregator_class=self.aggregator.aggregator_class,
+                initializer=_init_worker, initargs=(get_normalizer(), get_skipped_kinds()))
+
+        profiler.count('aggregate', aggregator.total)
+
+        return Digest(aggregator)
@@ -0,0 +1,357 @@
+"""
+Per-stage profiling of the digest pipeline (see --profile)
+
+Stages of a streaming pipeline are interleaved: every entry is fetched, normalized,
+filtered and aggregated before the next one is read. Time spent in nested stages
+is subtracted from the enclosing one, so each stage reports its exclusive time.
+
+Memory is not exclusive: the peak RSS of a stage is the peak of the whole process
+when the stage has ended (stages that run first can only report lower values).
+"""
+from __future__ import unicode_literals
+
+import sys
+
+from collections import OrderedDict
+from timeit import default_timer
+
+try:
+    from time import process_time
+except ImportError:  # Python 2.x
+    from time import clock as process_time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # pylint: disable=invalid-name
+
+
+def peak_rss():
+    """
+    Returns peak resident set size of the current process so far [kB]
+
+    :rtype: int|None
+    """
+    if resource is None:
+        return None
+
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # bytes on macOS, kilobytes on Linux
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+class StageStats(object):  # pylint: disable=too-few-public-methods
+    """
+    Exclusive wall and CPU time, items count and the peak memory of the process
+    so far (cumulative, not per stage) when a single stage has ended
+    """
+    __slots__ = ('wall', 'cpu', 'items', 'peak_rss', 'spans')
+
+    def __init__(self):
+        self.wall = 0.
+        self.cpu = 0.
+        self.items = 0
+        self.peak_rss = None
+
+        # (start, duration) of the stage blocks, used by the Chrome trace
+        self.spans = []
+
+    def as_dict(self):
+        """
+        :rtype: OrderedDict
+        """
+        return OrderedDict([
+            ('wall', self.wall),
+            ('cpu', self.cpu),
+            ('items', self.items),
+            ('items_per_sec', int(self.items / self.wall) if self.wall > 0 else None),
+            ('process_peak_rss_kb', self.peak_rss),
+        ])
+
+
+class _Stage(object):
+    """
+    Context manager that times a block of code as a given stage
+    """
+    __slots__ = ('_profiler', '_name')
+
+    def __init__(self, profiler, name):
+        """
+        :type profiler Profiler
+        :type name str
+        """
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._profiler.enter()
+
+    def __exit__(self, *args):
+        self._profiler.exit(self._name, span=True)
+
+
+class Profiler(object):
+    """
+    Records exclusive wall time, CPU time, item counts and peak memory of pipeline stages
+    """
+    def __init__(self, use_cprofile=False):
+        """
+        :type use_cprofile bool
+        """
+        self.stages = OrderedDict()
+
+        # [wall start, CPU start, wall of nested stages, CPU of nested stages]
+        self._stack = []
+        self._started = default_timer()
+
+        if use_cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        else:
+            self.cprofile = None
+
+    def _get_stats(self, name):
+        """
+        :type name str
+        :rtype: StageStats
+        """
+        stats = self.stages.get(name)
+
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+
+        return stats
+
+    def enter(self):
+        """
+        Marks the beginning of a stage
+        """
+        self._stack.append([default_timer(), process_time(), 0., 0.])
+
+    def exit(self, name, items=0, span=False):
+        """
+        Marks the end of a given stage
+
+        :type name str
+        :type items int
+        :type span bool
+        :arg span: keep the block for the trace (not done for every item of streaming stages)
+        """
+        (wall_start, cpu_start, nested_wall, nested_cpu) = self._stack.pop()
+
+        wall = default_timer() - wall_start
+        cpu = process_time() - cpu_start
+
+        stats = self._get_stats(name)
+        stats.wall += wall - nested_wall
+        stats.cpu += cpu - nested_cpu
+        stats.items += items
+
+        if span:
+            stats.spans.append((wall_start - self._started, wall))
+            stats.peak_rss = peak_rss()
+
+        # do not count this time in the enclosing stage
+        if self._stack:
+            self._stack[-1][2] += wall
+            self._stack[-1][3] += cpu
+
+    def stage(self, name):
+        """
+        Times the block of code wrapped with "with profiler.stage(name):"
+
+        :type name str
+        :rtype: _Stage
+        """
+        return _Stage(self, name)
+
+    def count(self, name, items):
+        """
+        Adds to the number of items processed by a given stage
+
+        :type name str
+        :type items int
+        """
+        self._get_stats(name).items += items
+
+    def iterate(self, name, iterable):
+        """
+        Times getting every item from given iterable as a given stage
+
+        :type name str
+        :type iterable collections.Iterable
+        :rtype: collections.Iterable
+        """
+        iterator = iter(iterable)
+
+        while True:
+            self.enter()
+
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.exit(name)
+                self._get_stats(name).peak_rss = peak_rss()
+                return
+
+            self.exit(name, items=1)
+            yield item
+
+    def wrap(self, name, func):
+        """
+        Times every call of given single-argument function as a given stage
+
+        :type name str
+        :type func (object) -> object
+        :rtype: (object) -> object
+        """
+        def wrapper(arg):
+            """
+            :type arg object
+            :rtype: object
+            """
+            self.enter()
+
+            try:
+                return func(arg)
+            finally:
+                self.exit(name, items=1)
+
+        return wrapper
+
+    def stop(self):
+        """
+        Disables cProfile (if used), can be called more than once
+        """
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+    def summary(self):
+        """
+        :rtype: str
+        """
+        from tabulate import tabulate
+
+        total = default_timer() - self._started
+
+        rows = [
+            OrderedDict([
+                ('stage', name),
+                ('wall [s]', stats.wall),
+                ('wall %', 100. * stats.wall / total),
+                ('cpu [s]', stats.cpu),
+                ('items', stats.items),
+                ('items/sec', stats.as_dict()['items_per_sec']),
+                ('process peak RSS so far [kB]', stats.peak_rss),
+            ])
+            for (name, stats) in self.stages.items()
+        ]
+
+        return tabulate(rows, headers='keys', floatfmt='.3f') + \
+            '\nTotal: {:.3f} s, peak RSS: {} kB\n'.format(total, peak_rss())
+
+    def chrome_trace(self):
+        """
+        Returns the trace in Chrome trace event format (chrome://tracing, Perfetto)
+
+        Stage blocks are reported as they happened in the "pipeline" thread,
+        exclusive times of all stages are laid out one after another in the "stages" thread.
+
+        :rtype: dict
+        """
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 1, 'args': {'name': 'pipeline'}},
+            {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 2, 'args': {'name': 'stages'}},
+        ]
+
+        offset = 0.
+
+        for (name, stats) in self.stages.items():
+            for (start, duration) in stats.spans:
+                events.append({
+                    'name': name, 'ph': 'X', 'pid': 1, 'tid': 1,
+                    'ts': int(start * 1e6), 'dur': int(duration * 1e6),
+                })
+
+            events.append({
+                'name': name, 'ph': 'X', 'pid': 1, 'tid': 2,
+                'ts': int(offset * 1e6), 'dur': int(stats.wall * 1e6),
+                'args': stats.as_dict(),
+            })
+
+            offset += stats.wall
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump(self, path):
+        """
+        Saves Chrome trace (*.json files) or cProfile stats (any other file name)
+
+        :type path str
+        """
+        if path.endswith('.json'):
+            import json
+
+            with open(path, 'wt') as handler:
+                json.dump(self.chrome_trace(), handler)
+        elif self.cprofile is not None:
+            self.stop()
+            self.cprofile.dump_stats(path)
+
+
+class _NullStage(object):
+    """
+    No-op context manager
+    """
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullProfiler(object):
+    """
+    Used when profiling is disabled, returns iterables and functions as they are
+    """
+    # pylint: disable=unused-argument
+    def stage(self, name):
+        """
+        :type name str
+        :rtype: _NullStage
+        """
+        return _NULL_STAGE
+
+    def count(self, name, items):
+        """
+        :type name str
+        :type items int
+        """
+        pass
+
+    def iterate(self, name, iterable):
+        """
+        :type name str
+        :type iterable collections.Iterable
+        :rtype: collections.Iterable
+        """
+        return iterable
+
+    def wrap(self, name, func):
+        """
+        :type name str
+        :type func (object) -> object
+        :rtype: (object) -> object
+        """
+        return func
+
+    def stop(self):
+        """
+        Nothing to stop
+        """
+        pass
@@ -1,80 +1,364 @@
 """
 Fetch SQL queries from elasticsearch
 """
+import gzip
+import io
 import logging
+import mmap
 import re
 
-from collections import OrderedDict
+from calendar import timegm
+from collections import Counter
+from datetime import datetime
 from hashlib import md5
-from elasticsearch_query import ElasticsearchQuery
-from sql_metadata import generalize_sql, remove_comments_from_sql
 
-from digest.errors import QueryDigestReadError
+from digest.cache import NormalizationCache
+from digest.entry import QueryEntry
+from digest.errors import QueryDigestCommandLineError, QueryDigestReadError
+from digest.filters import DEFAULT_EXCLUDED_KINDS, query_kind
+from digest.fingerprint import generalize_sql_fast
+from digest.slowlog import iter_slow_log_entries
 
 QUERIES_LIMIT = 50000
 LOGS_ES_HOST = 'logs-prod.es.service.sjc.consul'
 
+# the same literal queries repeat a lot in logs, memoize their normalization
+normalization_cache = NormalizationCache()  # pylint: disable=invalid-name
 
-def get_sql_queries_by_file(file_path):
+# query kind -> the number of entries that the filter drops and were not normalized
+# (counted in the current process only)
+skipped_normalizations = Counter()  # pylint: disable=invalid-name
+
+# kinds of queries that the filter drops, see set_skipped_kinds()
+skipped_kinds = DEFAULT_EXCLUDED_KINDS  # pylint: disable=invalid-name
+
+
+def generalize_sql_compat(sql):
     """
-    Get normalized log entries from provided file
+    sql_metadata.generalize_sql (sql_metadata and sqlparse are imported on the first call)
+
+    :type sql str|None
+    :rtype: str|None
+    """
+    import sql_metadata
+    return sql_metadata.generalize_sql(sql)
+
+
+def _remove_comments_from_sql(sql):
+    """
+    :type sql str
+    :rtype: str
+    """
+    import sql_metadata
+    return sql_metadata.remove_comments_from_sql(sql)
+
+
+# --normalizer: sql_metadata implementation or a few precompiled regular expression passes
+# producing the same output (with a fallback to sql_metadata for queries they can not handle)
+NORMALIZERS = {
+    'compat': generalize_sql_compat,
+    'fast': generalize_sql_fast,
+}
+
+normalizer_name = 'compat'  # pylint: disable=invalid-name
+generalize_sql = normalization_cache.memoize(NORMALIZERS[normalizer_name])
+remove_comments_from_sql = normalization_cache.memoize(_remove_comments_from_sql)
+
+
+def set_normalizer(name):
+    """
+    Selects SQL normalization function used by normalize_*_entry functions
+
+    It only affects the current process, worker processes call it on start
+    with the name returned by get_normalizer() (see Pipeline).
+
+    :type name str
+    :raises QueryDigestCommandLineError
+    """
+    global generalize_sql, normalizer_name  # pylint: disable=global-statement,invalid-name
+
+    if name not in NORMALIZERS:
+        raise QueryDigestCommandLineError('Unknown normalizer "{}", use one of: {}'.format(
+            name, ', '.join(sorted(NORMALIZERS))))
+
+    normalizer_name = name
+    generalize_sql = normalization_cache.memoize(NORMALIZERS[name])
+
+
+def get_normalizer():
+    """
+    Returns the name of SQL normalization function selected by set_normalizer()
+
+    :rtype: str
+    """
+    return normalizer_name
+
+
+def set_skipped_kinds(kinds):
+    """
+    Sets kinds of queries that are dropped by the filter, normalize_*_entry functions
+    do not generalize them (filter_query ones by default, see Filter.dropped_kinds)
+
+    It only affects the current process, worker processes call it on start
+    with kinds returned by get_skipped_kinds() (see Pipeline).
+
+    :type kinds collections.Iterable[str]
+    """
+    global skipped_kinds  # pylint: disable=global-statement,invalid-name
+    skipped_kinds = frozenset(kinds)
+
+
+def get_skipped_kinds():
+    """
+    Returns kinds of queries set by set_skipped_kinds()
+
+    :rtype: frozenset
+    """
+    return skipped_kinds
+
+
+# magic bytes used to detect compressed log files
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def _iter_mmap_lines(file_path):
+    """
+    Yields lines from a memory-mapped file
+
+    :type file_path str
+    :rtype: collections.Iterable[str]
+    """
+    with open(file_path, 'rb') as handler:
+        try:
+            mapped = mmap.mmap(handler.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be mapped
+            return
+
+        try:
+            for line in iter(mapped.readline, b''):
+                yield line.decode('utf8')
+        finally:
+            mapped.close()
+
+
+def _iter_zstd_lines(file_path):
+    """
+    Yields lines from zstd compressed file
 
     :type file_path str
-    :rtype tuple
+    :rtype: collections.Iterable[str]
     """
     try:
-        with open(file_path, 'rt') as handler:
-            lines = handler.readlines()
+        import zstandard
+    except ImportError:
+        raise QueryDigestReadError(
+            'zstandard module is required to read "{}" file'.format(file_path))
+
+    with open(file_path, 'rb') as handler:
+        reader = zstandard.ZstdDecompressor().stream_reader(handler)
+
+        for line in io.TextIOWrapper(io.BufferedReader(reader), encoding='utf8'):
+            yield line
+
+
+def iter_file_lines(file_path, use_mmap=False):
+    """
+    Lazily yields lines from provided file, gzip and zstd compressed files are handled transparently
+
+    :type file_path str
+    :type use_mmap bool
+    :rtype: collections.Iterable[str]
+    """
+    try:
+        with open(file_path, 'rb') as handler:
+            magic = handler.read(4)
+
+        if magic.startswith(GZIP_MAGIC):
+            with gzip.open(file_path, 'rt') as handler:
+                for line in handler:
+                    yield line
+        elif magic.startswith(ZSTD_MAGIC):
+            for line in _iter_zstd_lines(file_path):
+                yield line
+        elif use_mmap:
+            for line in _iter_mmap_lines(file_path):
+                yield line
+        else:
+            with open(file_path, 'rt') as handler:
+                for line in handler:
+                    yield line
+    except QueryDigestReadError:
+        raise
     except Exception as ex:
         raise QueryDigestReadError(ex)
 
-    def wrap_query(sql):
-        """
-        :type sql str
-        :rtype: str
-        """
-        comment = re.match(r'/\*([^*]+)\*/', sql)
-        if comment:
-            comment = str(comment.group(1)).strip()
-
-        normalized_sql = generalize_sql(sql.strip())
-        sql_hash = md5(normalized_sql.encode('utf8')).hexdigest()[0:8]
-
-        return {
-            'query': normalized_sql,
-            # use comment extracted from SQL or
-            # a short md5 hash of normalized SQL
-            'method': comment or sql_hash,
-            'source_host': sql_hash,
-        }
-
-    return [
-        wrap_query(line) for line in lines
+
+# comments of skipped queries, e.g. BEGIN /* DatabaseBase::begin */
+_SKIPPED_COMMENTS_RE = re.compile(r'/\*.*?\*/', flags=re.DOTALL)
+
+
+def skip_normalization(sql):
+    """
+    Cheap classification of a raw query done before its normalization: queries of kinds
+    that the filter drops (see set_skipped_kinds, transactions, SHOW and "Important table
+    write" by default) are counted and returned without comments and extra whitespace,
+    so that normalize_*_entry functions can skip generalizing them
+
+    :type sql str|None
+    :rtype: str|None
+    :return: None when a query needs to be normalized
+    """
+    if sql is None:
+        return None
+
+    kind = query_kind(sql)
+
+    if kind not in skipped_kinds:
+        return None
+
+    skipped_normalizations[kind] += 1
+
+    if '/*' in sql:
+        sql = _SKIPPED_COMMENTS_RE.sub(' ', sql)
+
+    return ' '.join(sql.split())
+
+
+def normalize_file_entry(sql):
+    """
+    Normalizes given SQL query read from a file
+
+    :type sql str
+    :rtype: QueryEntry
+    """
+    comment = re.match(r'/\*([^*]+)\*/', sql)
+    if comment:
+        comment = str(comment.group(1)).strip()
+
+    normalized_sql = skip_normalization(sql) or generalize_sql(sql.strip())
+    sql_hash = md5(normalized_sql.encode('utf8')).hexdigest()[0:8]
+
+    return QueryEntry(
+        query=normalized_sql,
+        # use comment extracted from SQL or
+        # a short md5 hash of normalized SQL
+        method=comment or sql_hash,
+        source_host=sql_hash,
+    )
+
+
+def iter_file_queries(file_path, use_mmap=False):
+    """
+    Lazily yields raw SQL queries from provided file
+
+    :type file_path str
+    :type use_mmap bool
+    :rtype: collections.Iterable[str]
+    """
+    for line in iter_file_lines(file_path, use_mmap=use_mmap):
         # filter out lines with SQL commands (-- foo) and empty ones
-        if not line.startswith('--') and line != '\n'
-    ]
+        if not line.startswith('--') and line != '\n':
+            yield line
+
+
+def iter_slow_log_queries(file_path, use_mmap=False):
+    """
+    Lazily yields raw entries from provided MySQL slow query log file
+
+    :type file_path str
+    :type use_mmap bool
+    :rtype: collections.Iterable[dict]
+    """
+    return iter_slow_log_entries(iter_file_lines(file_path, use_mmap=use_mmap))
+
+
+def normalize_slow_log_entry(entry):
+    """
+    Normalizes given MySQL slow query log entry
+
+    :type entry dict
+    :rtype: QueryEntry
+    """
+    # stripped just like queries read from files
+    sql = entry.get('sql', '').strip()
+
+    # e.g. SELECT /* Title::getArticleID */ page_id FROM ...
+    comment = re.search(r'/\*([^*]+)\*/', sql)
+    if comment:
+        comment = str(comment.group(1)).strip()
+
+    skipped = skip_normalization(sql)
+    normalized_sql = skipped or generalize_sql(sql)
+    sql_hash = md5(normalized_sql.encode('utf8')).hexdigest()[0:8]
+
+    return QueryEntry(
+        original_query=skipped or remove_comments_from_sql(sql),
+        query=normalized_sql,
+        # use comment extracted from SQL or a short md5 hash of normalized SQL
+        method=comment or sql_hash,
+        dbname=entry.get('db'),
+        # e.g. ap-s10 -> ap
+        source_host=(entry.get('host') or entry.get('ip') or 'localhost').split('-')[0],
+        rows=entry.get('rows_sent', 0),
+        time=1000. * entry.get('query_time', 0),  # [ms]
+        timestamp=entry.get('timestamp'),
+    )
+
+
+def iter_sql_queries_by_file(file_path, use_mmap=False):
+    """
+    Lazily yields normalized log entries from provided file
+
+    :type file_path str
+    :type use_mmap bool
+    :rtype: collections.Iterable[QueryEntry]
+    """
+    for sql in iter_file_queries(file_path, use_mmap=use_mmap):
+        yield normalize_file_entry(sql)
 
 
-def get_log_entries(query, period, fields, limit, index_prefix='logstash-other'):
+def get_sql_queries_by_file(file_path):
+    """
+    Get normalized log entries from provided file
+
+    :type file_path str
+    :rtype list
+    """
+    return list(iter_sql_queries_by_file(file_path))
+
+
+def get_log_entries(query, period, fields, limit, index_prefix='logstash-other',
+                    es_host=LOGS_ES_HOST, slices=1, oldest_first=False):
     """
     Get log entries from elasticsearch that match given query
 
+    Entries are fetched in the background and yielded lazily, when more than one slice
+    is requested, the period is split into time slices fetched in parallel.
+
     :type query str
     :type period int
     :type fields list[str] or None
     :type limit int
     :type index_prefix str
-    :rtype tuple
+    :type es_host str
+    :type slices int
+    :type oldest_first bool
+    :arg oldest_first: only the most recent entries are not fetched when the limit is reached
+    :rtype collections.Iterable[dict]
     """
-    logger = logging.getLogger('get_log_entries')
-    source = ElasticsearchQuery(es_host=LOGS_ES_HOST, period=period, index_prefix=index_prefix)
+    # elasticsearch client is only imported when entries are fetched from it
+    from digest.es import iter_log_entries
 
+    logger = logging.getLogger('get_log_entries')
     logger.info('Query: \'%s\' for the last %d hour(s)', query, period / 3600)
 
-    return source.query_by_string(query, fields, limit)
+    return iter_log_entries(es_host, query, period, fields, limit, index_prefix, slices,
+                            oldest_first=oldest_first)
 
 
-def get_sql_queries_by_path(path, limit=QUERIES_LIMIT, period=3600):
+def get_sql_queries_by_path(path, limit=QUERIES_LIMIT, period=3600, raw=False, **options):
     """
     Get MediaWiki SQL queries made in the last hour from a given code path
 
@@ -83,7 +367,10 @@ def get_sql_queries_by_path(path, limit=QUERIES_LIMIT, period=3600):
     :type path str
     :type limit int
     :type period int
-    :rtype tuple
+    :type raw bool
+    :type options dict
+    :arg options: passed to get_log_entries (es_host, slices, oldest_first)
+    :rtype collections.Iterable[QueryEntry]
     """
     query = '@fields.datacenter: "sjc" AND @fields.environment: "prod" ' \
             'AND @exception.trace: "{}"'.format(path)
@@ -97,14 +384,20 @@ def get_sql_queries_by_path(path, limit=QUERIES_LIMIT, period=3600):
         '@context.elapsed',
         '@fields.wiki_dbname',
         '@source_host',
+        '@timestamp',
     ]
 
-    entries = get_log_entries(query, period, fields, limit, index_prefix='logstash-mediawiki-sql')
+    entries = get_log_entries(
+        query, period, fields, limit, index_prefix='logstash-mediawiki-sql', **options)
+
+    # raw entries are normalized by the caller (e.g. in worker processes)
+    if raw:
+        return entries
 
-    return tuple(map(normalize_mediawiki_entry, entries))
+    return (normalize_mediawiki_entry(entry) for entry in entries)
 
 
-def get_sql_queries_by_table(table, limit=QUERIES_LIMIT, period=3600):
+def get_sql_queries_by_table(table, limit=QUERIES_LIMIT, period=3600, raw=False, **options):
     """
     Get MediaWiki SQL queries made in the last hour affecting given table
 
@@ -113,7 +406,10 @@ def get_sql_queries_by_table(table, limit=QUERIES_LIMIT, period=3600):
     :type table str
     :type limit int
     :type period int
-    :rtype tuple
+    :type raw bool
+    :type options dict
+    :arg options: passed to get_log_entries (es_host, slices, oldest_first)
+    :rtype collections.Iterable[QueryEntry]
     """
     query = '@fields.datacenter: "sjc" AND @fields.environment: "prod" ' \
             'AND @message: "{}"'.format(table)
@@ -127,14 +423,20 @@ def get_sql_queries_by_table(table, limit=QUERIES_LIMIT, period=3600):
         '@context.elapsed',
         '@fields.wiki_dbname',
         '@source_host',
+        '@timestamp',
     ]
 
-    entries = get_log_entries(query, period, fields, limit, index_prefix='logstash-mediawiki-sql')
+    entries = get_log_entries(
+        query, period, fields, limit, index_prefix='logstash-mediawiki-sql', **options)
+
+    # raw entries are normalized by the caller (e.g. in worker processes)
+    if raw:
+        return entries
 
-    return tuple(map(normalize_mediawiki_entry, entries))
+    return (normalize_mediawiki_entry(entry) for entry in entries)
 
 
-def get_backend_queries_by_table(table, limit=QUERIES_LIMIT, period=3600):
+def get_backend_queries_by_table(table, limit=QUERIES_LIMIT, period=3600, raw=False, **options):
     """
     Get Perl backend SQL queries made in the last hour affecting given table
 
@@ -143,7 +445,10 @@ def get_backend_queries_by_table(table, limit=QUERIES_LIMIT, period=3600):
     :type table str
     :type limit int
     :type period int
-    :rtype tuple
+    :type raw bool
+    :type options dict
+    :arg options: passed to get_log_entries (es_host, slices, oldest_first)
+    :rtype collections.Iterable[QueryEntry]
     """
     query = 'program:"backend" AND @context.statement: * AND @context.statement: "{}"'.format(table)
 
@@ -155,14 +460,20 @@ def get_backend_queries_by_table(table, limit=QUERIES_LIMIT, period=3600):
         '@context.num_rows',
         '@context.elapsed',
         '@source_host',
+        '@timestamp',
     ]
 
-    entries = get_log_entries(query, period, fields, limit, index_prefix='logstash-backend-sql')
+    entries = get_log_entries(
+        query, period, fields, limit, index_prefix='logstash-backend-sql', **options)
+
+    # raw entries are normalized by the caller (e.g. in worker processes)
+    if raw:
+        return entries
 
-    return tuple(map(normalize_backend_entry, entries))
+    return (normalize_backend_entry(entry) for entry in entries)
 
 
-def get_sql_queries_by_database(database, limit=QUERIES_LIMIT, period=3600):
+def get_sql_queries_by_database(database, limit=QUERIES_LIMIT, period=3600, raw=False, **options):
     """
     Get MediaWiki SQL queries made in the last hour affecting given database
 
@@ -171,7 +482,10 @@ def get_sql_queries_by_database(database, limit=QUERIES_LIMIT, period=3600):
     :type database str
     :type limit int
     :type period int
-    :rtype tuple
+    :type raw bool
+    :type options dict
+    :arg options: passed to get_log_entries (es_host, slices, oldest_first)
+    :rtype collections.Iterable[QueryEntry]
     """
     query = '@fields.datacenter: "sjc" AND @fields.environment: "prod"' \
             ' AND @context.db_name:"{}"'.format(database)
@@ -185,14 +499,21 @@ def get_sql_queries_by_database(database, limit=QUERIES_LIMIT, period=3600):
         '@context.elapsed',
         '@fields.wiki_dbname',
         '@source_host',
+        '@timestamp',
     ]
 
-    entries = get_log_entries(query, period, fields, limit, index_prefix='logstash-mediawiki-sql')
+    entries = get_log_entries(
+        query, period, fields, limit, index_prefix='logstash-mediawiki-sql', **options)
 
-    return tuple(map(normalize_mediawiki_entry, entries))
+    # raw entries are normalized by the caller (e.g. in worker processes)
+    if raw:
+        return entries
 
+    return (normalize_mediawiki_entry(entry) for entry in entries)
 
-def get_backend_queries_by_database(database, limit=QUERIES_LIMIT, period=3600):
+
+def get_backend_queries_by_database(database, limit=QUERIES_LIMIT, period=3600, raw=False,
+                                    **options):
     """
     Get Perl backend SQL queries made in the last hour affecting given database
 
@@ -201,7 +522,10 @@ def get_backend_queries_by_database(database, limit=QUERIES_LIMIT, period=3600):
     :type database str
     :type limit int
     :type period int
-    :rtype tuple
+    :type raw bool
+    :type options dict
+    :arg options: passed to get_log_entries (es_host, slices, oldest_first)
+    :rtype collections.Iterable[QueryEntry]
     """
     query = 'program:"backend" AND @context.statement: * AND @context.db_name:"{}"'.format(database)
 
@@ -213,14 +537,20 @@ def get_backend_queries_by_database(database, limit=QUERIES_LIMIT, period=3600):
         '@context.num_rows',
         '@context.elapsed',
         '@source_host',
+        '@timestamp',
     ]
 
-    entries = get_log_entries(query, period, fields, limit, index_prefix='logstash-backend-sql')
+    entries = get_log_entries(
+        query, period, fields, limit, index_prefix='logstash-backend-sql', **options)
 
-    return tuple(map(normalize_backend_entry, entries))
+    # raw entries are normalized by the caller (e.g. in worker processes)
+    if raw:
+        return entries
 
+    return (normalize_backend_entry(entry) for entry in entries)
 
-def get_sql_queries_by_service(service, limit=25000, period=3600):
+
+def get_sql_queries_by_service(service, limit=25000, period=3600, raw=False, **options):
     """
     Get Pandora SQL queries made by a given service
 
@@ -229,7 +559,10 @@ def get_sql_queries_by_service(service, limit=25000, period=3600):
     :type service str
     :type limit int
     :type period int
-    :rtype tuple
+    :type raw bool
+    :type options dict
+    :arg options: passed to get_log_entries (es_host, slices, oldest_first)
+    :rtype collections.Iterable[QueryEntry]
     """
     query = 'logger_name:"query-log-sampler" AND env: "prod" AND raw_query: *'
 
@@ -242,12 +575,54 @@ def get_sql_queries_by_service(service, limit=25000, period=3600):
             'kubernetes.host',
             'rows_number',
             'execution_time',
+            '@timestamp',
         ],
         limit=limit,
-        index_prefix='logstash-{}'.format(service)
+        index_prefix='logstash-{}'.format(service),
+        **options
     )
 
-    return tuple(map(normalize_pandora_entry, entries))
+    # raw entries are normalized by the caller (e.g. in worker processes)
+    if raw:
+        return entries
+
+    return (normalize_pandora_entry(entry) for entry in entries)
+
+
+# e.g. 2014-07-09T08:37:18.123Z, 2014-07-09T10:37:18+02:00 or 2014-07-09T08:37:18.123+0000
+_TIMESTAMP_RE = re.compile(
+    r'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d+))?(Z|([+-])(\d{2}):?(\d{2}))?$')
+
+
+def parse_timestamp(value):
+    """
+    Parses Elasticsearch timestamp (e.g. 2014-07-09T08:37:18.123Z) into UNIX timestamp,
+    UTC offsets (+02:00 or +0200) are taken into account
+
+    :type value str|None
+    :rtype: float|None
+    :return: None for empty and unparsable values
+    """
+    if not value:
+        return None
+
+    matches = _TIMESTAMP_RE.match(value)
+
+    if matches is None:
+        return None
+
+    (date, fraction, _, sign, hours, minutes) = matches.groups()
+
+    try:
+        timestamp = timegm(datetime.strptime(date, '%Y-%m-%dT%H:%M:%S').timetuple())
+    except ValueError:
+        return None
+
+    if sign is not None:
+        offset = int(hours) * 3600 + int(minutes) * 60
+        timestamp -= offset if sign == '+' else -offset
+
+    return timestamp + float('0.' + (fraction or '0'))
 
 
 def normalize_mediawiki_entry(entry):
@@ -255,15 +630,18 @@ def normalize_mediawiki_entry(entry):
     Normalizes given MediaWiki query log entry and keeps only needed fields
 
     :type entry dict
-    :return: dict
+    :return: QueryEntry
     """
     context = entry.get('@context', {})
     fields = entry.get('@fields', {})
 
-    res = OrderedDict()
+    res = QueryEntry()
+
+    sql = entry.get('@message')
+    skipped = skip_normalization(sql)
 
-    res['original_query'] = remove_comments_from_sql(entry.get('@message'))
-    res['query'] = generalize_sql(entry.get('@message'))
+    res['original_query'] = skipped or remove_comments_from_sql(sql)
+    res['query'] = skipped or generalize_sql(sql)
 
     # e.g. WikiFactory::loadVariableFromDB (from foo::bar)
     res['method'] = re.sub(r'\s\(([^)]+)\)', '', context.get('method'))
@@ -276,6 +654,7 @@ def normalize_mediawiki_entry(entry):
 
     res['rows'] = int(context.get('num_rows', 0))
     res['time'] = float(1000. * context.get('elapsed', 0))  # [ms]
+    res['timestamp'] = parse_timestamp(entry.get('@timestamp'))
 
     return res
 
@@ -285,14 +664,17 @@ def normalize_backend_entry(entry):
     Normalizes given backend query log entry and keeps only needed fields
 
     :type entry dict
-    :return: dict
+    :return: QueryEntry
     """
     context = entry.get('@context', {})
 
-    res = OrderedDict()
+    res = QueryEntry()
 
-    res['original_query'] = remove_comments_from_sql(entry.get('@message'))
-    res['query'] = generalize_sql(entry.get('@message'))
+    sql = entry.get('@message')
+    skipped = skip_normalization(sql)
+
+    res['original_query'] = skipped or remove_comments_from_sql(sql)
+    res['query'] = skipped or generalize_sql(sql)
     res['method'] = context.get('method')  # e.g. "DB.pm line 171 via phalanx_stats.pl line 158"
     res['dbname'] = context.get('db_name')  # e.g. "specials"
     res['from_master'] = context.get('server_role', 'slave') == 'master'
@@ -301,6 +683,7 @@ def normalize_backend_entry(entry):
 
     res['rows'] = int(context.get('num_rows', 0))
     res['time'] = float(1000. * context.get('elapsed', 0))  # [ms]
+    res['timestamp'] = parse_timestamp(entry.get('@timestamp'))
 
     return res
 
@@ -312,15 +695,17 @@ def normalize_pandora_entry(entry):
     logger_name: "query-log-sampler"
 
     :type entry dict
-    :return: dict
+    :return: QueryEntry
     """
-    res = OrderedDict()
+    res = QueryEntry()
 
     query = entry.get('raw_query')
     k8s = entry.get('kubernetes', {})
 
-    res['original_query'] = remove_comments_from_sql(query)
-    res['query'] = generalize_sql(query)
+    skipped = skip_normalization(query)
+
+    res['original_query'] = skipped or remove_comments_from_sql(query)
+    res['query'] = skipped or generalize_sql(query)
     # res['method'] = k8s.get('container_name')  # e.g liftigniter-metadata
     res['dbname'] = entry.get('container_name')  # TODO: implement in Pandora
 
@@ -328,6 +713,7 @@ def normalize_pandora_entry(entry):
 
     res['rows'] = int(entry.get('rows_number', 0))
     res['time'] = float(entry.get('execution_time', 0))  # [ms]
+    res['timestamp'] = parse_timestamp(entry.get('@timestamp'))
 
     # use a short md5 hash of normalized SQL method to generate the method name
     res['method'] = md5(res['query'].encode('utf8')).hexdigest()[0:8]
@@ -337,12 +723,12 @@ def normalize_pandora_entry(entry):
 
 def filter_query(entry):
     """
-    Filter out transactions
+    Filter out transactions, SHOW statements and "Important table write" messages
+
+    Only the query kind is checked, so e.g. BEGIN_DATE column does not drop a query.
+    See digest.filters.QueryFilter for configurable rules.
 
     :type entry dict
     :rtype bool
     """
-    query = entry['query']
-
-    return 'BEGIN' not in query and 'COMMIT' not in query and not query.startswith('SHOW') \
-        and not query.startswith('Important table write')
+    return query_kind(entry['query']) not in DEFAULT_EXCLUDED_KINDS
@@ -3,13 +3,25 @@ Given SQL query returns its type and tables involved
 """
 import re
 
-from sql_metadata import get_query_tables
+from .cache import LRUCache
 
+# INSERT INTO, DELETE FROM, INSERT OVERWRITE TABLE
+TABLES_RE = re.compile(r'(FROM|INTO|TABLE) ([`,.\w]+)', flags=re.IGNORECASE)
 
-def get_query_metadata(query):
+# UPDATE foo SET ...
+UPDATE_RE = re.compile(r'([`\w]+) SET', flags=re.IGNORECASE)
+
+# the same normalized query is reported for many methods and hosts, parse it once
+_metadata_cache = LRUCache()  # pylint: disable=invalid-name
+
+# cached for queries that could not be parsed
+_UNPARSABLE = object()
+
+
+def _parse_query_metadata(query):
     """
     :type query: string
-    :rtype list
+    :rtype tuple
     :raises ValueError
     """
     kind = query.split(' ')[0].upper()  # SELECT, INSERT, UPDATE, ...
@@ -21,11 +33,11 @@ def get_query_metadata(query):
         return kind, None
 
     if kind == 'SELECT':
+        from sql_metadata import get_query_tables
         return kind, tuple(get_query_tables(query))
 
     try:
-        # INSERT INTO, DELETE FROM, INSERT OVERWRITE TABLE
-        matches = re.search(r'(FROM|INTO|TABLE) ([`,.\w]+)', query, flags=re.IGNORECASE)
+        matches = TABLES_RE.search(query)
 
         # multi-table SELECTS
         # SELECT * FROM foo,bar,test
@@ -39,12 +51,35 @@ def get_query_metadata(query):
         pass
 
     try:
-        # UPDATE foo SET ...
-        matches = re.search(r'([`\w]+) SET', query, flags=re.IGNORECASE) \
-            if kind == 'UPDATE' else None
+        matches = UPDATE_RE.search(query) if kind == 'UPDATE' else None
 
         return kind, (matches.group(1).strip('`'),)
     except AttributeError:
         pass
 
     raise ValueError('Could not get metadata for ' + query)
+
+
+def get_query_metadata(query):
+    """
+    Returns query kind and tables involved, results are memoized by normalized query
+
+    :type query: string
+    :rtype tuple
+    :raises ValueError
+    """
+    metadata = _metadata_cache.get(query)
+
+    if metadata is None:
+        try:
+            metadata = _parse_query_metadata(query)
+        except ValueError:
+            # remember unparsable queries as well (but not the exception with its traceback)
+            metadata = _UNPARSABLE
+
+        _metadata_cache.set(query, metadata)
+
+    if metadata is _UNPARSABLE:
+        raise ValueError('Could not get metadata for ' + query)
+
+    return metadata
@@ -0,0 +1,175 @@
+"""
+Streaming parser of MySQL slow query log files
+
+An entry consists of "#" headers followed by the statement, which can span multiple lines:
+
+# Time: 2018-11-20T12:00:00.123456Z
+# User@Host: wikia[wikia] @ ap-s10 [10.8.1.2]  Id: 12345
+# Query_time: 0.001234  Lock_time: 0.000100 Rows_sent: 1  Rows_examined: 100
+use wikicities;
+SET timestamp=1542715200;
+SELECT * FROM page
+WHERE page_id = 1;
+
+Statements logged without "#" headers are split on lines ending with a semicolon.
+"""
+import re
+
+from calendar import timegm
+from datetime import datetime
+
+# regular expressions are only used for header lines, once or twice per entry
+QUERY_TIME_RE = re.compile(
+    r'Query_time:\s*([\d.]+)\s+Lock_time:\s*([\d.]+)\s+Rows_sent:\s*(\d+)\s+Rows_examined:\s*(\d+)')
+USER_HOST_RE = re.compile(r'User@Host:\s*([^\[\s]*)\[[^\]]*\]\s*@\s*(\S*)\s*\[([^\]]*)\]')
+
+
+def parse_time_header(value):
+    """
+    Parses "# Time:" header value, both MySQL 5.7+ (2018-11-20T12:00:00.123456Z)
+    and older (181120 12:00:00) formats are handled
+
+    :type value str
+    :rtype: float|None
+    """
+    value = value.strip()
+
+    try:
+        if 'T' in value:
+            (date, _, fraction) = value.rstrip('Z').partition('.')
+            return timegm(datetime.strptime(date, '%Y-%m-%dT%H:%M:%S').timetuple()) + \
+                float('0.' + (fraction or '0'))
+
+        return float(timegm(datetime.strptime(' '.join(value.split()), '%y%m%d %H:%M:%S')
+                            .timetuple()))
+    except ValueError:
+        return None
+
+
+def is_banner(line):
+    """
+    Tells whether a given line is one of those mysqld writes when the log is (re)opened
+
+    :type line str
+    :rtype: bool
+    """
+    return (line.startswith('/') and ', Version: ' in line) or line.startswith('Tcp port: ') \
+        or (line.startswith('Time ') and ' Id Command' in line)
+
+
+def _make_entry(statement, headers):
+    """
+    :type statement list[str]
+    :type headers dict
+    :rtype: dict
+    """
+    headers['sql'] = ' '.join(line.strip() for line in statement)
+    return headers
+
+
+def iter_slow_log_entries(lines):  # pylint: disable=too-many-branches,too-many-statements
+    """
+    Lazily yields slow log entries as dicts with the following keys: sql, query_time,
+    lock_time, rows_sent, rows_examined, user, host, ip, db and timestamp
+
+    Times are in seconds, timestamp is taken from "SET timestamp"
+    (or "# Time:" header when it is not there).
+
+    None items of followed lines (no new lines at the moment, see follow_lines) are yielded
+    as they are, a complete statement read before them is yielded first.
+
+    :type lines collections.Iterable[str|None]
+    :rtype: collections.Iterable[dict|None]
+    """
+    headers = {}
+    statement = []
+
+    # the last line of the statement ends with a semicolon
+    statement_ended = False
+
+    # "use" and "# Time:" apply to all following entries, until they change
+    database = None
+    time_header = None
+
+    # "# Time:" is parsed only when there's no "SET timestamp" (strptime is slow)
+    (parsed_header, parsed_time) = (None, None)
+
+    for line in lines:
+        if line is None:
+            # do not wait for the next entry to report the last one
+            if statement and statement_ended:
+                yield _make_entry(statement, headers)
+                statement = []
+                headers = {}
+                statement_ended = False
+
+            yield None
+            continue
+
+        first = line[:1]
+
+        if first == '#':
+            # headers of the next entry
+            if statement:
+                yield _make_entry(statement, headers)
+                statement = []
+                headers = {}
+                statement_ended = False
+
+            if line.startswith('# Query_time:'):
+                match = QUERY_TIME_RE.search(line)
+
+                if match:
+                    headers['query_time'] = float(match.group(1))
+                    headers['lock_time'] = float(match.group(2))
+                    headers['rows_sent'] = int(match.group(3))
+                    headers['rows_examined'] = int(match.group(4))
+            elif line.startswith('# User@Host:'):
+                match = USER_HOST_RE.search(line)
+
+                if match:
+                    (headers['user'], headers['host'], headers['ip']) = match.groups()
+            elif line.startswith('# Time:'):
+                time_header = line[7:]
+
+            continue
+
+        # the most of lines are statements, check banners only when they can be one
+        if first in ('/', 'T') and is_banner(line):
+            continue
+
+        # the next statement logged without headers (they apply to the previous one only)
+        if statement_ended:
+            if not line.strip():
+                continue
+
+            yield _make_entry(statement, headers)
+            statement = []
+            headers = {}
+
+        if not statement:
+            # statements executed before the logged one
+            if line.startswith(('use ', 'USE ')):
+                database = line[4:].strip().rstrip(';').strip('`')
+                continue
+
+            if line.startswith('SET timestamp='):
+                headers['timestamp'] = float(line[14:].strip().rstrip(';'))
+                continue
+
+            if not line.strip():
+                continue
+
+            headers['db'] = database
+
+            if 'timestamp' not in headers:
+                if time_header is not None and time_header != parsed_header:
+                    (parsed_header, parsed_time) = (time_header, parse_time_header(time_header))
+
+                headers['timestamp'] = parsed_time if time_header is not None else None
+
+        statement.append(line)
+        statement_ended = line.rstrip().endswith(';')
+
+    if statement:
+        yield _make_entry(statement, headers)
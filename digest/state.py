@@ -0,0 +1,229 @@
+"""
+Persistent state of periodic digests: hourly buckets of aggregates and a high-water mark
+"""
+import json
+import logging
+
+from os import rename
+
+from .aggregate import QueryAggregator
+from .errors import QueryDigestCommandLineError, QueryDigestReadError
+
+BUCKET_SIZE = 3600
+
+# keep up to 24 hours of buckets (and the one being filled now)
+RETENTION = 86400 + BUCKET_SIZE
+
+
+def bucket_start(timestamp):
+    """
+    :type timestamp float
+    :rtype: int
+    """
+    return int(timestamp // BUCKET_SIZE * BUCKET_SIZE)
+
+
+def filter_since(filter_func, since, entry):
+    """
+    Drops entries that were already folded in during the previous run
+
+    :type filter_func (dict) -> bool
+    :type since float|None
+    :type entry dict
+    :rtype: bool
+    """
+    if since is not None and entry.get('timestamp') is not None and entry.get('timestamp') <= since:
+        return False
+
+    return filter_func(entry)
+
+
+class HourlyAggregator(object):
+    """
+    Keeps a separate QueryAggregator for each hour entries were logged in
+    """
+    def __init__(self):
+        self.buckets = dict()
+        self.total = 0
+        self.high_water_mark = None
+
+    def add(self, entry):
+        """
+        :type entry dict
+        """
+        timestamp = entry.get('timestamp')
+        key = bucket_start(timestamp) if timestamp is not None else None
+
+        bucket = self.buckets.get(key)
+
+        if bucket is None:
+            bucket = self.buckets[key] = QueryAggregator()
+
+        bucket.add(entry)
+        self.total += 1
+
+        if timestamp is not None and \
+                (self.high_water_mark is None or timestamp > self.high_water_mark):
+            self.high_water_mark = timestamp
+
+    def update(self, entries):
+        """
+        :type entries collections.Iterable[dict]
+        :rtype: HourlyAggregator
+        """
+        for entry in entries:
+            self.add(entry)
+
+        return self
+
+    def merge(self, other):
+        """
+        :type other HourlyAggregator
+        :rtype: HourlyAggregator
+        """
+        for key, bucket in other.buckets.items():
+            if key in self.buckets:
+                self.buckets[key].merge(bucket)
+            else:
+                self.buckets[key] = bucket
+
+        self.total += other.total
+
+        if other.high_water_mark is not None and \
+                (self.high_water_mark is None or other.high_water_mark > self.high_water_mark):
+            self.high_water_mark = other.high_water_mark
+
+        return self
+
+
+class DigestState(object):
+    """
+    Stores per-hour aggregates and the timestamp of the most recent entry folded in,
+    so that periodic runs only need to fetch and process new entries
+    """
+    VERSION = 1
+
+    def __init__(self, path, source):
+        """
+        :type path str
+        :type source str
+        """
+        self._path = path
+        self._source = source
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        self.high_water_mark = None
+        self.buckets = dict()
+
+    @classmethod
+    def load(cls, path, source):
+        """
+        Loads the state from given file, a fresh state is returned if it does not exist
+
+        :type path str
+        :type source str
+        :rtype: DigestState
+        :raises QueryDigestReadError
+        :raises QueryDigestCommandLineError
+        """
+        state = cls(path, source)
+
+        try:
+            with open(path, 'rt') as handler:
+                data = json.load(handler)
+        except IOError:
+            state._logger.info('State file "%s" does not exist yet', path)  # pylint: disable=protected-access
+            return state
+        except ValueError as ex:
+            raise QueryDigestReadError(ex)
+
+        if data.get('source') != source:
+            raise QueryDigestCommandLineError(
+                'State file "{}" was created for {}, not for {}'.format(
+                    path, data.get('source'), source))
+
+        state.high_water_mark = data.get('high_water_mark')
+        state.buckets = dict(
+            (int(key), QueryAggregator.from_state(bucket))
+            for (key, bucket) in data.get('buckets', {}).items()
+        )
+
+        return state
+
+    def save(self):
+        """
+        Atomically writes the state file
+        """
+        data = {
+            'version': self.VERSION,
+            'source': self._source,
+            'high_water_mark': self.high_water_mark,
+            'buckets': dict(
+                (str(key), bucket.to_state()) for (key, bucket) in self.buckets.items()
+            ),
+        }
+
+        tmp_path = self._path + '.tmp'
+
+        with open(tmp_path, 'wt') as handler:
+            json.dump(data, handler)
+
+        rename(tmp_path, self._path)
+        self._logger.info('State saved to "%s" (%d buckets)', self._path, len(self.buckets))
+
+    def fetch_period(self, now, period):
+        """
+        Returns the period (in seconds before now) entries need to be fetched for
+
+        :type now float
+        :type period int
+        :rtype: int
+        """
+        if self.high_water_mark is None:
+            return period
+
+        return int(min(now - self.high_water_mark, RETENTION)) + 1
+
+    def fold(self, aggregator, now):
+        """
+        Folds in new entries and drops buckets that are too old to be reported
+
+        :type aggregator HourlyAggregator
+        :type now float
+        """
+        now_bucket = bucket_start(now)
+
+        for key, bucket in aggregator.buckets.items():
+            # entries without a timestamp go to the current bucket
+            key = now_bucket if key is None else key
+
+            if key in self.buckets:
+                self.buckets[key].merge(bucket)
+            else:
+                self.buckets[key] = bucket
+
+        if aggregator.high_water_mark is not None:
+            self.high_water_mark = max(self.high_water_mark or 0, aggregator.high_water_mark)
+
+        for key in [key for key in self.buckets if key < now - RETENTION]:
+            del self.buckets[key]
+
+        self._logger.info('Folded in %d new entries, high-water mark is %s',
+                          aggregator.total, self.high_water_mark)
+
+    def aggregate(self, now, period):
+        """
+        Merges buckets covering the given period before now into a single aggregate
+
+        :type now float
+        :type period int
+        :rtype: QueryAggregator
+        """
+        aggregator = QueryAggregator()
+
+        for key in sorted(self.buckets):
+            if key + BUCKET_SIZE > now - period:
+                # merge a copy, keep stored buckets intact
+                aggregator.merge(QueryAggregator.from_state(self.buckets[key].to_state()))
+
+        return aggregator
@@ -5,8 +5,14 @@ import logging
 
 from os import getenv
 
-logging.basicConfig(
-    level=logging.DEBUG if getenv('DEBUG') == '1' else logging.INFO,
-    format='%(asctime)s %(name)-35s %(levelname)-8s %(message)s',
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+
+def setup_logging():
+    """
+    Configures logging of the command line tool (not done on import, as the package
+    may be imported by other tools and tests that set up logging on their own)
+    """
+    logging.basicConfig(
+        level=logging.DEBUG if getenv('DEBUG') == '1' else logging.INFO,
+        format='%(asctime)s %(name)-35s %(levelname)-8s %(message)s',
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
@@ -6,9 +6,33 @@ and reports those made by given feature or using given table
 Usage:
   query_digest [ --file=<file> ] [ --path=<path> ] [ --table=<table> ] [ --service=<service> ]
     [ --database=<database> ] [ --csv ] [ --data-flow ] [ --simple ] [ --sql-log ] [ --last-24h ]
+    [ --mmap ] [ --cache=<cache> ] [ --jobs=<jobs> ] [ --numpy ] [ --state=<state> ]
+    [ --es-host=<es_host> ] [ --slices=<slices> ] [ --limit=<limit> ] [ --normalizer=<normalizer> ]
+    [ --profile ] [ --profile-output=<profile_output> ] [ --top=<top> ]
+    [ --parquet=<parquet> ] [ --arrow=<arrow> ] [ --raw-rows ] [ --index=<index> ] [ --run=<run> ]
+    [ --follow ] [ --window=<window> ] [ --interval=<interval> ] [ --slow-log ]
+    [ --approx-top=<approx_top> ] [ --include=<include> ] [ --exclude=<exclude> ]
+    [ --min-time=<min_time> ] [ --data-flow-format=<data_flow_format> ]
+  query_digest --index=<index> --diff <run_a> <run_b> [ --threshold=<threshold> ] [ --csv ]
 
 Example:
   query_digest --file=/var/log/queries.log
+  query_digest --file=/var/log/queries.log.gz
+  query_digest --file=/var/log/queries.log --mmap
+  query_digest --file=/var/log/mysql/mysql-slow.log --slow-log
+  query_digest --file=/var/log/queries.log --cache=/tmp/query_digest.cache
+  query_digest --file=/var/log/queries.log --jobs=8
+  query_digest --file=/var/log/queries.log --numpy
+  query_digest --file=/var/log/queries.log --normalizer=fast
+  query_digest --file=/var/log/queries.log --profile
+  query_digest --file=/var/log/queries.log --profile-output=/tmp/query_digest.pstats
+  query_digest --file=/var/log/queries.log --profile-output=/tmp/query_digest_trace.json
+  query_digest --file=/var/log/mysql/general.log --follow --top=20
+  query_digest --file=/var/log/mysql/general.log --follow --window=60 --interval=5 --simple
+  query_digest --file=/var/log/mysql/mysql-slow.log --slow-log --follow --top=20
+  query_digest --file=/var/log/queries.log --include="kind:SELECT table:page,revision"
+  query_digest --file=/var/log/mysql/mysql-slow.log --slow-log --exclude="dbname:statsdb"
+  query_digest --file=/var/log/mysql/mysql-slow.log --slow-log --min-time=100
 
   query_digest --path=extensions/wikia/Wall
   query_digest --path=extensions/wikia/Wall --csv
@@ -17,94 +41,207 @@ Example:
   query_digest --table=wall_notification
   query_digest --table=wall_notification --csv
   query_digest --table=image_view --data-flow
+  query_digest --database=statsdb --data-flow --jobs=8
+  query_digest --database=statsdb --data-flow --data-flow-format=dot
+  query_digest --database=statsdb --data-flow --data-flow-format=graphml
+  query_digest --table=wall_notification --last-24h --slices=24 --limit=500000
+  query_digest --table=wall_notification --csv --top=100
+  query_digest --table=wall_notification --parquet=/tmp/digest.parquet
+  query_digest --table=wall_notification --arrow=/tmp/digest.arrow --raw-rows
+  query_digest --table=wall_notification --es-host=localhost:9200
 
   query_digest --service=liftigniter-metadata
   query_digest --service=liftigniter-metadata --csv
+  query_digest --service=liftigniter-metadata --approx-top=50
+
+  query_digest --table=wall_notification --exclude="method:^Wall method:Factory$ kind:DELETE"
 
   query_digest --database=statsdb --simple
   query_digest --database=statsdb --sql-log
 
+  query_digest --database=statsdb --state=/var/lib/query_digest/statsdb.json
+  query_digest --database=statsdb --state=/var/lib/query_digest/statsdb.json --last-24h
+
   query_digest --table=wall_notification --simple - simple output type (list queries only)
+
+  query_digest --table=wall_notification --index=/var/lib/query_digest/index.db --run=2018-w47
+  query_digest --index=/var/lib/query_digest/index.db --diff 2018-w46 2018-w47
+  query_digest --index=/var/lib/query_digest/index.db --diff 2018-w46 2018-w47 --threshold=0.5
 """
 from __future__ import unicode_literals
 import logging
+import sys
 
-from functools import reduce
+from functools import partial
 from operator import itemgetter
-
-from csv import DictWriter
 from sys import stdout
+from time import gmtime, localtime, strftime, time
 
 import docopt
-from tabulate import tabulate
 
-from digest.dataflow import data_flow_format_entry
+from scripts import setup_logging
+from digest.dataflow import GRAPH_FORMATS
 from digest.errors import QueryDigestCommandLineError
-from digest.map_reduce import map_reduce
-from digest.math import median
+from digest.filters import QueryFilter, parse_rules
+from digest.aggregate import QueryAggregator
+from digest.heavy_hitters import SpaceSavingAggregator
+from digest.follow import follow_digest, follow_lines, DEFAULT_INTERVAL, DEFAULT_WINDOW
+from digest.index import FingerprintIndex, DEFAULT_THRESHOLD
+from digest.output import write_csv, write_data_flow, write_simple, write_sql_log, write_table
+from digest.pipeline import Aggregator, Digest, Filter, Pipeline, Sink, Source
+from digest.profile import NullProfiler, Profiler
+from digest.state import DigestState, HourlyAggregator, filter_since
 from digest.queries import \
     get_sql_queries_by_path, get_sql_queries_by_table, get_backend_queries_by_table,\
     get_sql_queries_by_service, get_sql_queries_by_database, get_backend_queries_by_database, \
-    get_sql_queries_by_file, filter_query
+    filter_query, normalization_cache, skipped_normalizations, LOGS_ES_HOST, \
+    normalize_file_entry, normalize_mediawiki_entry, normalize_backend_entry, \
+    normalize_pandora_entry, normalize_slow_log_entry, set_normalizer, set_skipped_kinds
+from digest.slowlog import iter_slow_log_entries
 
 
-def queries_reduce(_, values, sequence_len):
+def get_writer(arguments):
     """
-    :type _ str
-    :type values tuple[dict]
-    :type sequence_len int
-    :rtype dict
+    Returns the output function selected with command line options
+
+    :type arguments dict
+    :rtype: (io.TextIOBase, collections.Iterable[dict], str) -> None
     """
-    ret = values[0].copy()
+    if arguments.get('--csv') is True:
+        return write_csv
+    if arguments.get('--simple') is True:
+        return write_simple
+    if arguments.get('--data-flow') is True:
+        # edges of the graph are found using worker processes
+        return partial(write_data_flow, jobs=int(arguments.get('--jobs') or 1),
+                       graph_format=arguments.get('--data-flow-format') or 'tsv')
+    if arguments.get('--sql-log') is True:
+        return write_sql_log
 
-    ret['count'] = len(values)
-    ret['percentage'] = '{:.2f}%'.format(100. * ret['count'] / sequence_len)
+    return write_table
 
-    # calculate times stats
-    times = [value.get('time', 0) for value in values]
 
-    ret['time_sum'] = sum(times)
-    ret['time_median'] = median(times)
+def get_filter(arguments):
+    """
+    Returns the filter configured with --include, --exclude and --min-time options
+    (None when the default one should be used)
 
-    # rows stats
-    rows = [value.get('rows', 0) for value in values]
+    :type arguments dict
+    :rtype: QueryFilter|None
+    :raises QueryDigestCommandLineError
+    """
+    if all(arguments.get(name) is None for name in ('--include', '--exclude', '--min-time')):
+        return None
+
+    try:
+        min_time = float(arguments['--min-time']) if arguments.get('--min-time') is not None \
+            else None
+    except ValueError:
+        raise QueryDigestCommandLineError('--min-time needs to be a number')
+
+    return QueryFilter(
+        include=parse_rules(arguments.get('--include'), '--include'),
+        exclude=parse_rules(arguments.get('--exclude'), '--exclude'),
+        min_time=min_time,
+    )
 
-    ret['rows_sum'] = sum(rows)
-    ret['rows_median'] = median(rows)
 
-    # get rid of item specific fields
-    ret.pop('rows', None)
-    ret.pop('time', None)
+def follow_file(file, arguments, output, top, filter_func=filter_query):
+    """
+    --follow: reports the digest of the most recent entries appended to a given file
+    (raw SQL queries or MySQL slow query log entries when --slow-log is given)
 
-    # count all queries that were made using master node
-    if ret.get('from_master') is not None:
-        master_queries = reduce(
-            lambda acc, i: acc+1 if i.get('from_master') is True else acc,
-            values,
-            0  # initializer
-        )
-        ret['from_master'] = master_queries > 0
-    else:
-        ret['from_master'] = None
+    :type file str
+    :type arguments dict
+    :type output io.StringIO
+    :type top int|None
+    :type filter_func (dict) -> bool
+    """
+    logger = logging.getLogger('query_digest')
 
-    # FIXME: from_master will show cases when DB_MASTER is selected because of load-balancer weights
-    del ret['from_master']
+    try:
+        window = int(arguments.get('--window') or DEFAULT_WINDOW)
+        interval = int(arguments.get('--interval') or DEFAULT_INTERVAL)
+    except ValueError:
+        raise QueryDigestCommandLineError('--window and --interval need to be numbers')
 
-    return ret
+    sink = Sink(output, get_writer(arguments))
 
+    # queries that the filter keeps are never left not normalized
+    set_skipped_kinds(Filter(filter_func).dropped_kinds())
 
-def main(arguments=None, output=stdout):
+    def emit(aggregator, now):
+        """
+        :type aggregator QueryAggregator
+        :type now float
+        """
+        report_header = 'Query digest for "{}" file, last {} seconds at {}, found {} queries'.\
+            format(file, window, strftime('%H:%M:%S', localtime(now)), aggregator.total)
+
+        if aggregator.total:
+            sink.write(Digest(aggregator), report_header, top=top)
+        else:
+            output.write(report_header + '\n')
+
+        output.flush()
+
+    logger.info('Following "%s" file, reporting the last %d seconds every %d seconds',
+                file, window, interval)
+
+    lines = follow_lines(file, poll_interval=min(1., interval))
+
+    if arguments.get('--slow-log') is True:
+        (entries, normalize_func) = (iter_slow_log_entries(lines), normalize_slow_log_entry)
+    else:
+        (entries, normalize_func) = (lines, normalize_file_entry)
+
+    try:
+        follow_digest(entries, normalize_func, filter_func, emit, window=window, interval=interval)
+    except KeyboardInterrupt:
+        logger.info('Stopped following "%s" file', file)
+
+
+def diff_runs(arguments, output):
     """
+    Reports query kinds that are new, disappeared or regressed between two indexed runs
+
     :type arguments dict
     :type output io.StringIO
     """
-    logger = logging.getLogger('query_digest')
+    try:
+        threshold = float(arguments.get('--threshold') or DEFAULT_THRESHOLD)
+    except ValueError:
+        raise QueryDigestCommandLineError('--threshold needs to be a number')
 
-    # handle command line options
-    if arguments is None:
-        arguments = docopt.docopt(__doc__)
+    (run_a, run_b) = (arguments.get('<run_a>'), arguments.get('<run_b>'))
 
-    logger.info("Got the following arguments: %s", arguments)
+    index = FingerprintIndex(arguments.get('--index'))
+
+    try:
+        data = index.diff(run_a, run_b, threshold=threshold)
+    finally:
+        index.close()
+
+    report_header = 'Query digest diff of "{}" and "{}" runs, found {} changes'.format(
+        run_a, run_b, len(data))
+
+    if not data:
+        output.write(report_header + '\n')
+    elif arguments.get('--csv') is True:
+        write_csv(output, data, report_header)
+    else:
+        write_table(output, data, report_header)
+
+
+def digest_queries(arguments, output, profiler):
+    """
+    Reads, aggregates and reports queries using the given command line options
+
+    :type arguments dict
+    :type output io.StringIO
+    :type profiler Profiler|NullProfiler
+    """
+    logger = logging.getLogger('query_digest')
 
     file = arguments.get('--file')
     path = arguments.get('--path')
@@ -112,15 +249,159 @@ def main(arguments=None, output=stdout):
     table = arguments.get('--table')
     database = arguments.get('--database')
 
-    output_csv = arguments.get('--csv') is True
-    simple_output = arguments.get('--simple') is True
     data_flow_output = arguments.get('--data-flow') is True
-    sql_log_output = arguments.get('--sql-log') is True
+
+    if arguments.get('--data-flow-format') not in (None,) + GRAPH_FORMATS:
+        raise QueryDigestCommandLineError('--data-flow-format needs to be one of: {}'.format(
+            ', '.join(GRAPH_FORMATS)))
+
+    cache = arguments.get('--cache')
+
+    # --profile-output: save Chrome trace (*.json) or cProfile stats (any other file)
+    profile_output = arguments.get('--profile-output')
+
+    # optional and heavy dependencies (numpy, pyarrow, elasticsearch client, tabulate)
+    # are only imported when the selected input and output modes need them
+
+    # --numpy: calculate stats in a batched, columnar way
+    if arguments.get('--numpy') is True:
+        from digest.columnar import ColumnarAggregator, is_available as numpy_available
+
+        if not numpy_available():
+            raise QueryDigestCommandLineError('numpy module is required by --numpy')
+
+        aggregator_class = ColumnarAggregator
+    elif data_flow_output:
+        # extract tables involved once per query kind while aggregating
+        aggregator_class = partial(QueryAggregator, with_metadata=True)
+    else:
+        aggregator_class = QueryAggregator
+
+    # --approx-top: keep bounded state of the heaviest query kinds only (Space-Saving)
+    if arguments.get('--approx-top') is not None:
+        try:
+            approx_top = int(arguments.get('--approx-top'))
+        except ValueError:
+            raise QueryDigestCommandLineError('--approx-top needs to be a number')
+
+        if approx_top < 1:
+            raise QueryDigestCommandLineError('--approx-top needs to be a positive number')
+
+        if arguments.get('--numpy') is True:
+            raise QueryDigestCommandLineError('--approx-top can not be used with --numpy')
+
+        # raw SQL files have no query times, rank query kinds by count then
+        aggregator_class = partial(
+            SpaceSavingAggregator, approx_top,
+            by_time=file is None or arguments.get('--slow-log') is True)
+
+    # --parquet / --arrow: typed, columnar export (optionally with per-entry raw rows)
+    if arguments.get('--parquet') is not None:
+        (export_path, export_format) = (arguments.get('--parquet'), 'parquet')
+    elif arguments.get('--arrow') is not None:
+        (export_path, export_format) = (arguments.get('--arrow'), 'arrow')
+    else:
+        (export_path, export_format) = (None, None)
+
+    if export_path is not None:
+        from digest import export
+
+        if not export.is_available():
+            raise QueryDigestCommandLineError(
+                'pyarrow module is required by --parquet and --arrow')
+
+    raw_rows = None
+
+    if arguments.get('--raw-rows') is True:
+        if export_path is None:
+            raise QueryDigestCommandLineError('--raw-rows needs --parquet or --arrow')
+
+        aggregator_class = partial(export.RawRowsAggregator, aggregator_class)
+
+    # --normalizer: "compat" (sql_metadata) or "fast" (precompiled regular expressions)
+    set_normalizer(arguments.get('--normalizer') or 'compat')
+
+    try:
+        jobs = int(arguments.get('--jobs') or 1)
+        top = int(arguments['--top']) if arguments.get('--top') is not None else None
+    except ValueError:
+        raise QueryDigestCommandLineError('--jobs and --top need to be numbers')
+
+    if top is not None and top < 1:
+        raise QueryDigestCommandLineError('--top needs to be a positive number')
+
+    # worker processes use their own in-memory caches only
+    if cache is not None and jobs > 1:
+        raise QueryDigestCommandLineError('--cache can not be used with --jobs')
 
     period = 86400 if arguments.get('--last-24h') is True else 3600
 
     # period = 60  # 10 minutes # DEBUG
 
+    # --include / --exclude / --min-time: configurable rules instead of the default filter
+    query_filter = get_filter(arguments)
+    filter_func = query_filter or filter_query
+
+    # --state: only fetch entries logged since the previous run
+    state = None
+    fetch_period = period
+    now = time()
+
+    if arguments.get('--state') is not None:
+        if file is not None:
+            raise QueryDigestCommandLineError('--state can not be used with --file')
+
+        if arguments.get('--numpy') is True:
+            raise QueryDigestCommandLineError('--state can not be used with --numpy')
+
+        if arguments.get('--approx-top') is not None:
+            raise QueryDigestCommandLineError('--state can not be used with --approx-top')
+
+        if arguments.get('--raw-rows') is True:
+            raise QueryDigestCommandLineError('--state can not be used with --raw-rows')
+
+        state = DigestState.load(arguments.get('--state'), source=' '.join(
+            '{}={}'.format(name, arguments.get(name))
+            for name in ('--path', '--service', '--table', '--database') if arguments.get(name)
+        ))
+
+        fetch_period = state.fetch_period(now, period)
+        logger.info('Fetching entries from the last %d second(s)', fetch_period)
+
+    # Elasticsearch fetch options
+    try:
+        fetch_options = dict(
+            period=fetch_period,
+            raw=True,
+            es_host=arguments.get('--es-host') or LOGS_ES_HOST,
+            slices=int(arguments.get('--slices') or 1),
+        )
+
+        if arguments.get('--limit') is not None:
+            fetch_options['limit'] = int(arguments.get('--limit'))
+    except ValueError:
+        raise QueryDigestCommandLineError('--slices and --limit need to be numbers')
+
+    # the high-water mark is the newest folded in entry, entries that are not fetched because
+    # of the limit need to be newer than it, so that the next run fetches them
+    if state is not None:
+        if fetch_options['slices'] > 1:
+            raise QueryDigestCommandLineError('--state can not be used with --slices')
+
+        fetch_options['oldest_first'] = True
+
+    # --follow: tail a growing log file and report a sliding window of it periodically
+    if arguments.get('--follow') is True:
+        if file is None:
+            raise QueryDigestCommandLineError('--follow needs --file')
+
+        if state is not None or export_path is not None or arguments.get('--index') is not None:
+            raise QueryDigestCommandLineError(
+                '--follow can not be used with --state, --parquet, --arrow or --index')
+
+        follow_file(file, arguments, output, top, filter_func)
+        return
+
     if file is not None:
         logger.info('Digesting queries from "%s" file', file)
     elif path is not None:
@@ -134,81 +415,187 @@ def main(arguments=None, output=stdout):
     else:
         raise QueryDigestCommandLineError('Either --file, --path or --table needs to be provided')
 
-    # run the reporter
-    if file is not None:
-        queries = get_sql_queries_by_file(file)
-        report_header = '"{}" file'.format(file)
-    elif path is not None:
-        queries = get_sql_queries_by_path(path, period=period)
-        report_header = '"{}" path'.format(path)
-    elif service is not None:
-        queries = get_sql_queries_by_service(service, period=period)
-        report_header = '"{}" service'.format(service)
-    elif database is not None:
-        queries = get_sql_queries_by_database(database, period=period) + \
-                  get_backend_queries_by_database(database, period=period)
-        report_header = '"{}" database'.format(database)
-    else:
-        queries = get_sql_queries_by_table(table, period=period) + \
-                  get_backend_queries_by_table(table, period=period)
-        report_header = '"{}" table'.format(table)
+    # keep normalized queries on disk to reuse them in the next runs
+    if cache is not None:
+        normalization_cache.open(cache)
+
+    try:
+        # run the reporter
+        # sources are raw entries together with functions that normalize them
+        if file is not None:
+            # --slow-log: MySQL slow query log with per-entry time and rows
+            sources = [
+                Source.from_file(file, use_mmap=arguments.get('--mmap') is True,
+                                 slow_log=arguments.get('--slow-log') is True),
+            ]
+            report_header = '"{}" file'.format(file)
+        elif path is not None:
+            sources = [
+                Source(get_sql_queries_by_path(path, **fetch_options), normalize_mediawiki_entry,
+                       raw_sql=itemgetter('@message')),
+            ]
+            report_header = '"{}" path'.format(path)
+        elif service is not None:
+            sources = [
+                Source(get_sql_queries_by_service(service, **fetch_options),
+                       normalize_pandora_entry, raw_sql=itemgetter('raw_query')),
+            ]
+            report_header = '"{}" service'.format(service)
+        elif database is not None:
+            # MediaWiki and backend queries (each one is prefetched in the background)
+            sources = [
+                Source(get_sql_queries_by_database(database, **fetch_options),
+                       normalize_mediawiki_entry, raw_sql=itemgetter('@message')),
+                Source(get_backend_queries_by_database(database, **fetch_options),
+                       normalize_backend_entry, raw_sql=itemgetter('@message')),
+            ]
+            report_header = '"{}" database'.format(database)
+        else:
+            sources = [
+                Source(get_sql_queries_by_table(table, **fetch_options),
+                       normalize_mediawiki_entry, raw_sql=itemgetter('@message')),
+                Source(get_backend_queries_by_table(table, **fetch_options),
+                       normalize_backend_entry, raw_sql=itemgetter('@message')),
+            ]
+            report_header = '"{}" table'.format(table)
+
+        # entries are consumed one by one, only per query kind stats are kept in memory
+        logger.info('Processing queries from the last %d hour(s)...', period / 3600)
+
+        # entries can be dropped by query kind rules before they are normalized
+        raw_filter_func = query_filter.accepts_sql if query_filter is not None else None
+
+        filter_stage = Filter(filter_func, raw_filter_func) if state is None \
+            else Filter(partial(filter_since, filter_func, state.high_water_mark), raw_filter_func)
+
+        if state is not None:
+            # fold new entries into stored hourly buckets and report using them
+            hourly = Pipeline(sources, filter_stage, Aggregator(HourlyAggregator, jobs=jobs),
+                              profiler=profiler).run()
+
+            with profiler.stage('state'):
+                state.fold(hourly.aggregator, now)
+                state.save()
+
+                digest = Digest(state.aggregate(now, period))
+        else:
+            digest = Pipeline(sources, filter_stage, Aggregator(aggregator_class, jobs=jobs),
+                              profiler=profiler).run()
+
+        if arguments.get('--raw-rows') is True:
+            raw_rows = digest.aggregator
+            digest = Digest(raw_rows.aggregator)
+    finally:
+        # the on-disk cache is closed when fetching or aggregating fails too
+        normalization_cache.close()
+
+    # transactions and SHOW statements are not normalized (not counted in worker processes)
+    skipped = sum(skipped_normalizations.values())
+
+    if skipped:
+        logger.info('Skipped normalization of %d entries dropped by the filter: %s', skipped,
+                    ', '.join('{} {}'.format(count, kind)
+                              for (kind, count) in skipped_normalizations.most_common()))
+        profiler.count('normalize (skipped)', skipped)
+
+    if query_filter is not None:
+        logger.info('Entries dropped by filter rules: %s', query_filter.summary())
+
+    if not digest.total:
+        raise QueryDigestCommandLineError('No queries found for {}'.format(report_header))
 
-    queries = tuple(filter(filter_query, queries))
+    logger.info('Processed %d queries', digest.total)
+    logger.info('Got %d kinds of queries', len(digest))
 
-    if not queries:
-        raise QueryDigestCommandLineError('No queries found for {}'.format(report_header))
+    # --top: only report N query kinds with the highest total time (uses a partial sort)
+    if top is None:
+        top = len(digest)
 
-    logger.info('Processing %d queries from the last %d hour(s)...', len(queries), period / 3600)
+    # results are ordered by "time_sum" descending and calculated lazily while they are written
+    data = profiler.iterate('results', digest.entries(top=top))
 
-    # this returns (method_name, entry_data) tuples
-    results = map_reduce(
-        queries,
-        map_func=lambda item: '{}-{}'.format(item.get('method'), item.get('source_host')),
-        reduce_func=queries_reduce
-    )
-    data = [entry for (_, entry) in results]
+    # --index: store aggregates of all query kinds to compare them later using --diff
+    if arguments.get('--index') is not None:
+        with profiler.stage('index'):
+            # stats of all query kinds are calculated (and sorted) once, the top ones are reported
+            entries = list(digest.entries(top=len(digest)))
+            data = iter(entries[:top])
 
-    logger.info('Got %d kinds of queries', len(data))
+            index = FingerprintIndex(arguments.get('--index'))
 
-    # sort the results ordered by "time_sum" descending
-    data = sorted(data, key=itemgetter('time_sum'), reverse=True)
-    # print(data)
+            try:
+                index.save_run(
+                    arguments.get('--run') or strftime('%Y-%m-%dT%H:%M', gmtime(now)),
+                    entries, total=digest.total, source=report_header, created=int(now))
+            finally:
+                index.close()
 
-    report_header = 'Query digest for {}, found {} queries'.format(report_header, len(queries))
+    report_header = 'Query digest for {}, found {} queries'.format(report_header, digest.total)
 
-    # --csv
-    if output_csv:
-        writer = DictWriter(f=output, fieldnames=data[0].keys())
+    with profiler.stage('output'):
+        # --parquet / --arrow
+        if export_path is not None:
+            data = list(data)
+            written = len(data)
 
-        output.write('# {}\n'.format(report_header))
-        writer.writeheader()
-        writer.writerows(data)
-    # --simple
-    elif simple_output:
-        output.write(report_header + '\n')
-        output.writelines([
-            '{method} {percentage} [{source_host}] db:{dbname} | {query}\n'.format(**entry)
-            for entry in data
-        ])
-    # --data-flow
-    elif data_flow_output:
-        max_queries = max(item.get('count') for item in data)
-
-        output.write('# {}\n'.format(report_header))
-
-        for item in data:
-            output.writelines(data_flow_format_entry(item, max_queries))
-    # --sql-log
-    elif sql_log_output:
-        output.write('-- {}\n'.format(report_header))
-        output.writelines([
-            '/* {} */ {}\n'.format(
-                entry.get('method'),
-                entry.get('original_query', '').replace("\n", ' ').encode('utf-8')
-            ) for entry in data
-        ])
+            export.write_table(
+                export.aggregated_table(data, digest.total), export_path, export_format)
+
+            if raw_rows is not None:
+                export.write_table(export.raw_rows_table(raw_rows),
+                                   export.raw_rows_path(export_path), export_format)
+
+            output.write('{}, saved to "{}"\n'.format(report_header, export_path))
+        # --csv, --simple, --data-flow, --sql-log or the default table
+        else:
+            written = Sink(output, get_writer(arguments)).write(
+                digest, report_header, entries=data)
+
+    # --approx-top keeps more query kinds than it reports
+    profiler.count('output', written)
+
+    if isinstance(profiler, Profiler):
+        sys.stderr.write(profiler.summary())
+
+        if profile_output is not None:
+            profiler.dump(profile_output)
+            logger.info('Profile saved to "%s"', profile_output)
+
+
+def main(arguments=None, output=stdout):
+    """
+    :type arguments dict
+    :type output io.StringIO
+    """
+    logger = logging.getLogger('query_digest')
+
+    # handle command line options
+    if arguments is None:
+        setup_logging()
+        arguments = docopt.docopt(__doc__)
+
+    logger.info("Got the following arguments: %s", arguments)
+
+    # entries skipped by the normalization are counted per run
+    skipped_normalizations.clear()
+
+    # --diff: compare two runs stored in the index
+    if arguments.get('--diff') is True:
+        diff_runs(arguments, output)
+        return
+
+    # --profile: report time spent in every stage of the pipeline to stderr
+    # --profile-output: save Chrome trace (*.json) or cProfile stats (any other file)
+    profile_output = arguments.get('--profile-output')
+
+    if arguments.get('--profile') is True or profile_output is not None:
+        profiler = Profiler(
+            use_cprofile=profile_output is not None and not profile_output.endswith('.json'))
     else:
-        # @see https://pypi.python.org/pypi/tabulate
-        output.write(report_header + '\n')
-        output.write(tabulate(data, headers='keys', tablefmt='grid') + '\n')
-        output.write('Note: times are in [ms], queries are normalized' + '\n')
+        profiler = NullProfiler()
+
+    try:
+        digest_queries(arguments, output, profiler)
+    finally:
+        # cProfile is disabled when any stage fails too
+        profiler.stop()
@@ -20,7 +20,16 @@ setup(
             'coverage==4.5.2',
             'pylint>=1.9.2, <=2.1.1',  # 2.x branch is for Python 3
             'pytest==4.0.0',
-        ]
+        ],
+        'arrow': [
+            'pyarrow',
+        ],
+        'numpy': [
+            'numpy',
+        ],
+        'zstd': [
+            'zstandard',
+        ],
     },
     include_package_data=True,
     entry_points={
@@ -0,0 +1,75 @@
+from digest.aggregate import QueryAggregator
+
+
+def _entries():
+    return [
+        {'query': 'SELECT foo FROM bar', 'method': 'Foo::bar', 'dbname': 'local', 'from_master': False,
+         'source_host': 'ap', 'rows': 1, 'time': 2.0},
+        {'query': 'SELECT foo FROM bar', 'method': 'Foo::bar', 'dbname': 'local', 'from_master': True,
+         'source_host': 'ap', 'rows': 3, 'time': 4.0},
+        {'query': 'SELECT foo FROM bar', 'method': 'Foo::bar', 'dbname': 'local', 'from_master': False,
+         'source_host': 'ap', 'rows': 5, 'time': 12.0},
+        {'query': 'DELETE FROM bar', 'method': 'Foo::delete', 'dbname': 'local', 'from_master': True,
+         'source_host': 'cron', 'rows': 0, 'time': 1.0},
+    ]
+
+
+def test_aggregate():
+    aggregator = QueryAggregator().update(iter(_entries()))
+
+    assert aggregator.total == 4
+    assert len(aggregator) == 2
+
+    results = dict(aggregator.results())
+    entry = results['Foo::bar-ap']
+
+    assert list(entry.keys()) == [
+        'query', 'method', 'dbname', 'source_host',
+        'count', 'percentage', 'time_sum', 'time_median', 'time_p95', 'time_p99',
+        'rows_sum', 'rows_median', 'rows_p95'
+    ]
+
+    assert entry['count'] == 3
+    assert entry['percentage'] == '75.00%'
+    assert entry['time_sum'] == 18.0
+    assert entry['time_median'] == 4.0
+    assert abs(entry['time_p95'] - 11.2) < 1e-9
+    assert abs(entry['time_p99'] - 11.84) < 1e-9
+    assert entry['rows_sum'] == 9
+    assert entry['rows_median'] == 3.0
+    assert abs(entry['rows_p95'] - 4.8) < 1e-9
+
+    assert results['Foo::delete-cron']['percentage'] == '25.00%'
+
+
+def test_aggregate_merge():
+    entries = _entries()
+
+    merged = QueryAggregator().update(entries[:2]).merge(QueryAggregator().update(entries[2:]))
+    single = QueryAggregator().update(entries)
+
+    assert merged.total == single.total
+    assert dict(merged.results()) == dict(single.results())
+
+
+def test_aggregate_with_metadata():
+    aggregator = QueryAggregator(with_metadata=True).update(_entries()[:2])
+    aggregator.merge(QueryAggregator(with_metadata=True).update(_entries()[2:]))
+
+    assert aggregator.query_metadata() == {
+        'SELECT foo FROM bar': ('SELECT', ('bar',)),
+        'DELETE FROM bar': ('DELETE', ('bar',)),
+    }
+
+    assert QueryAggregator().update(_entries()).query_metadata() == {}
+
+
+def test_aggregate_top():
+    aggregator = QueryAggregator().update(reversed(_entries()))
+
+    # ordered by the total time
+    assert [key for (key, _) in aggregator.results(top=1)] == ['Foo::bar-ap']
+    assert [key for (key, _) in aggregator.results(top=5)] == ['Foo::bar-ap', 'Foo::delete-cron']
+
+    # all query kinds are ordered by the total time too
+    assert [key for (key, _) in aggregator.results()] == ['Foo::bar-ap', 'Foo::delete-cron']
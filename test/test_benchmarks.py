@@ -0,0 +1,44 @@
+from benchmarks.generator import SyntheticLog
+from benchmarks.suite import run_suite
+
+from digest.queries import normalize_mediawiki_entry
+
+
+def test_synthetic_log():
+    log = SyntheticLog(kinds=10, skew=1.0, seed=1)
+
+    # seeded
+    assert log.sql_line() == SyntheticLog(kinds=10, skew=1.0, seed=1).sql_line()
+
+    entries = log.entries('mediawiki', 100)
+    assert len(entries) == 100
+
+    entry = normalize_mediawiki_entry(entries[0])
+    assert entry['method'].startswith('Class')
+    assert entry['timestamp'] is not None
+
+    # skewed: the first query kind is the most frequent one
+    methods = [normalize_mediawiki_entry(entry)['method'] for entry in log.entries('mediawiki', 1000)]
+    assert methods.count('Class0::method0') == max(methods.count(method) for method in methods)
+
+
+def test_run_suite():
+    stages = run_suite(lines=50, kinds=5, skew=0, seed=1).stages
+
+    assert 'normalize_mediawiki' in stages
+    assert 'output_data_flow' in stages
+    assert stages['read']['items'] == 50
+    assert stages['filter']['items'] == 150
+
+
+def test_parse_importtime():
+    from benchmarks.import_time import median, parse_importtime
+
+    assert parse_importtime(
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       100 |        100 |   digest.errors\n'
+        'import time:      2000 |       5100 | scripts.query_digest\n'
+    ) == {'digest.errors': 100, 'scripts.query_digest': 5100}
+
+    assert median([3, 1, 2]) == 2
+    assert median([4, 1, 2, 3]) == 2.5
@@ -0,0 +1,78 @@
+from digest.cache import DiskCacheStore, LRUCache, NormalizationCache
+
+
+def test_lru_cache():
+    cache = LRUCache(max_size=2)
+
+    cache.set('foo', 1)
+    cache.set('bar', 2)
+    assert cache.get('foo') == 1
+
+    # "bar" is the least recently used one now
+    cache.set('test', 3)
+    assert len(cache) == 2
+    assert cache.get('bar') is None
+    assert cache.get('foo') == 1
+    assert cache.get('test') == 3
+
+
+def test_normalization_cache():
+    calls = []
+
+    def normalize(sql):
+        calls.append(sql)
+        return sql.upper()
+
+    cache = NormalizationCache()
+    memoized = cache.memoize(normalize)
+
+    assert memoized.__name__ == 'normalize'
+    assert memoized('select 1') == 'SELECT 1'
+    assert memoized('select 1') == 'SELECT 1'
+    assert memoized('select 2') == 'SELECT 2'
+
+    assert calls == ['select 1', 'select 2']
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+
+def test_normalization_cache_on_disk(tmpdir):
+    path = str(tmpdir.join('cache.sqlite'))
+    calls = []
+
+    def normalize(sql):
+        calls.append(sql)
+        return sql.upper()
+
+    cache = NormalizationCache()
+    cache.open(path)
+    assert cache.memoize(normalize)('select 1') == 'SELECT 1'
+    cache.close()
+
+    # the next run reuses the on-disk store
+    cache = NormalizationCache()
+    cache.open(path)
+    assert cache.memoize(normalize)('select 1') == 'SELECT 1'
+    cache.close()
+
+    assert calls == ['select 1']
+    assert cache.disk_hits == 1
+    assert cache.misses == 0
+
+
+def test_disk_cache_store_flushes_in_batches(tmpdir):
+    path = str(tmpdir.join('cache.sqlite'))
+
+    store = DiskCacheStore(path, flush_size=2)
+    store.set('compat', b'1', 'SELECT 1')
+    store.set('compat', b'2', 'SELECT 2')
+    store.set('compat', b'3', 'SELECT 3')
+
+    # the first batch is already written, the rest of entries is pending
+    reader = DiskCacheStore(path)
+    assert reader.get('compat', b'2') == 'SELECT 2'
+    assert reader.get('compat', b'3') is None
+
+    store.close()
+    assert reader.get('compat', b'3') == 'SELECT 3'
+    reader.close()
@@ -0,0 +1,67 @@
+from pytest import importorskip
+
+from digest.aggregate import QueryAggregator
+
+importorskip('numpy')
+
+from digest.columnar import ColumnarAggregator  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def _entries():
+    return [
+        {'query': 'SELECT foo FROM bar', 'method': 'Foo::bar', 'dbname': 'local', 'source_host': 'ap',
+         'rows': 1, 'time': 2.0},
+        {'query': 'SELECT foo FROM bar', 'method': 'Foo::bar', 'dbname': 'local', 'source_host': 'ap',
+         'rows': 3, 'time': 4.0},
+        {'query': 'DELETE FROM bar', 'method': 'Foo::delete', 'dbname': 'local', 'source_host': 'cron',
+         'rows': 0, 'time': 1.0},
+        {'query': 'SELECT foo FROM bar', 'method': 'Foo::bar', 'dbname': 'local', 'source_host': 'ap',
+         'rows': 5, 'time': 12.0},
+        {'query': 'SELECT foo FROM bar', 'method': 'Foo::bar', 'dbname': 'local', 'source_host': 'ap',
+         'rows': 7, 'time': 3.5},
+    ]
+
+
+def _approx_equal(entry, expected):
+    assert list(entry.keys()) == list(expected.keys())
+
+    for key, value in expected.items():
+        if isinstance(value, float):
+            assert abs(entry[key] - value) < 1e-9, key
+        else:
+            assert entry[key] == value, key
+
+
+def test_columnar_aggregate():
+    entries = _entries()
+
+    columnar = ColumnarAggregator().update(entries)
+    expected = dict(QueryAggregator().update(entries).results())
+
+    assert columnar.total == 5
+    assert len(columnar) == 2
+
+    for key, entry in columnar.results():
+        _approx_equal(entry, expected[key])
+
+
+def test_columnar_merge():
+    entries = _entries()
+
+    merged = ColumnarAggregator().update(entries[2:]).merge(ColumnarAggregator().update(entries[:2]))
+    expected = dict(QueryAggregator().update(entries).results())
+
+    assert merged.total == 5
+
+    for key, entry in merged.results():
+        _approx_equal(entry, expected[key])
+
+
+def test_columnar_top():
+    columnar = ColumnarAggregator().update(reversed(_entries()))
+
+    assert [key for (key, _) in columnar.results(top=1)] == ['Foo::bar-ap']
+    assert [key for (key, _) in columnar.results(top=5)] == ['Foo::bar-ap', 'Foo::delete-cron']
+
+    # all query kinds are ordered by the total time too
+    assert [key for (key, _) in columnar.results()] == ['Foo::bar-ap', 'Foo::delete-cron']
@@ -0,0 +1,121 @@
+from io import StringIO
+from xml.dom.minidom import parseString
+
+from digest.dataflow import DataFlowGraph, build_data_flow_graph
+from digest.output import write_data_flow
+
+
+def _entry(query, method, count, source_host='ap', dbname='wikicities'):
+    return {
+        'query': query, 'method': method, 'dbname': dbname, 'source_host': source_host,
+        'count': count, 'time_median': 0.5, 'time_p95': 1.25,
+    }
+
+
+ENTRIES = [
+    _entry('SELECT foo FROM page WHERE id = N', 'Title::getArticleID', 10),
+    _entry('SELECT bar FROM page WHERE foo = X', 'Title::getArticleID', 5, source_host='cron'),
+    _entry('UPDATE page SET page_touched = X', 'Title::invalidateCache', 4),
+    _entry('BEGIN', 'DatabaseBase::begin', 100),
+    _entry('DELETE FROM user WHERE id = N', 'DB.pm line 238 via cleanup.pl line 12', 2,
+           dbname='specials'),
+]
+
+
+def test_data_flow_graph():
+    graph = build_data_flow_graph(ENTRIES)
+
+    # two SELECT query kinds share a single edge
+    assert list(graph.edges) == [
+        ('wikicities:page', 'getArticleID', 'Title'),
+        ('Title', 'invalidateCache', 'wikicities:page'),
+        ('backend:cleanup.pl', 'cleanup.pl:12 (DELETE)', 'specials:user'),
+    ]
+
+    stats = graph.edges[('wikicities:page', 'getArticleID', 'Title')]
+    assert stats.count == 15
+    assert stats.source_hosts == ['ap', 'cron']
+    # the heaviest edge (BEGIN queries have none)
+    assert graph.max_queries == 15
+
+    assert graph.nodes() == [
+        'wikicities:page', 'Title', 'backend:cleanup.pl', 'specials:user']
+
+
+def test_data_flow_graph_tsv():
+    output = StringIO()
+    build_data_flow_graph(ENTRIES).write(output, 'report')
+
+    assert output.getvalue().splitlines() == [
+        '# report',
+        'wikicities:page\tgetArticleID\tTitle\t1.00\t'
+        'ap/cron, max median time: 50.00 ms, max p95: 125.00 ms, count: 1500',
+        'Title\tinvalidateCache\twikicities:page\t0.27\t'
+        'ap, max median time: 50.00 ms, max p95: 125.00 ms, count: 400',
+        'backend:cleanup.pl\tcleanup.pl:12 (DELETE)\tspecials:user\t0.13\t'
+        'ap, max median time: 50.00 ms, max p95: 125.00 ms, count: 200',
+    ]
+
+
+def test_data_flow_weights_of_shared_edges():
+    output = StringIO()
+    write_data_flow(output, [
+        _entry('SELECT foo FROM page WHERE id = N', 'Title::get', 10),
+        _entry('SELECT bar FROM page WHERE id = N', 'Title::get', 10),
+        _entry('SELECT foo FROM user WHERE id = N', 'User::get', 5),
+    ], 'report')
+
+    # weights are relative to the heaviest edge
+    assert [line.split('\t')[3] for line in output.getvalue().splitlines()[1:]] == \
+        ['1.00', '0.25']
+
+
+def test_data_flow_graph_parallel():
+    entries = [
+        _entry('SELECT foo FROM table_{} WHERE id = N'.format(i % 7), 'Foo::bar{}'.format(i % 3), i)
+        for i in range(1, 50)
+    ]
+
+    serial = build_data_flow_graph(entries)
+    parallel = build_data_flow_graph(entries, jobs=2, chunk_size=5)
+
+    assert len(serial) == 21
+    assert list(parallel.edges) == list(serial.edges)
+    assert [stats.count for stats in parallel.edges.values()] == \
+        [stats.count for stats in serial.edges.values()]
+    assert parallel.max_queries == serial.max_queries
+
+
+def test_data_flow_graph_merge():
+    graph = DataFlowGraph().update((entry, None) for entry in ENTRIES[:1])
+    other = DataFlowGraph().update((entry, None) for entry in ENTRIES[1:])
+
+    graph.merge(other)
+
+    assert len(graph) == 3
+    assert graph.edges[('wikicities:page', 'getArticleID', 'Title')].count == 15
+    assert graph.max_queries == 15
+
+
+def test_write_data_flow_formats():
+    output = StringIO()
+    write_data_flow(output, ENTRIES, 'report', graph_format='dot')
+
+    lines = output.getvalue().splitlines()
+    assert lines[0] == '// report'
+    assert lines[1] == 'digraph data_flow {'
+    assert lines[2].startswith(
+        '  "wikicities:page" -> "Title" [label="getArticleID", weight=1.00, tooltip="ap/cron, ')
+    assert lines[-1] == '}'
+
+    output = StringIO()
+    write_data_flow(output, ENTRIES, 'report "quoted" <b>', graph_format='graphml')
+
+    document = parseString(output.getvalue().encode('utf8'))
+
+    assert len(document.getElementsByTagName('node')) == 4
+    edges = document.getElementsByTagName('edge')
+
+    assert len(edges) == 3
+    assert edges[2].getAttribute('source') == 'backend:cleanup.pl'
+    assert edges[2].getElementsByTagName('data')[0].firstChild.data == 'cleanup.pl:12 (DELETE)'
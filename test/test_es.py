@@ -0,0 +1,257 @@
+import json
+
+from threading import Thread
+from time import sleep, time
+
+from pytest import fixture, raises
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2.x
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from digest.es import Prefetcher, get_client, get_time_slices, iter_log_entries
+from digest.queries import get_sql_queries_by_table
+
+DOCUMENTS = 25
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    Handles concurrent requests (e.g. from time slices fetched in parallel)
+    """
+    daemon_threads = True
+
+
+class FakeElasticsearchHandler(BaseHTTPRequestHandler):
+    """
+    Serves DOCUMENTS fake MediaWiki SQL log entries using the search and scroll API
+    """
+    requests = []
+
+    # how long every search and scroll request takes [s]
+    delay = 0
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def _respond(self, response):
+        body = json.dumps(response).encode('utf8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length).decode('utf8')) if length else {}
+
+        self.requests.append((self.command, self.path, body))
+
+        if self.command == 'DELETE':
+            self._respond({'succeeded': True, 'num_freed': len(body['scroll_id'])})
+            return
+
+        sleep(self.delay)
+
+        if '/_search/scroll' in self.path:
+            offset = int(body['scroll_id'])
+        else:
+            offset = 0
+
+        size = 10
+        hits = [
+            {'_source': {
+                '@message': 'SELECT * FROM foo WHERE id = {}'.format(index),
+                '@context': {'method': 'Foo::bar', 'db_name': 'wikicities', 'elapsed': 0.001 * index},
+                '@source_host': 'ap-s10',
+                '@timestamp': '2018-11-20T12:34:56.000Z',
+            }}
+            for index in range(offset, min(offset + size, DOCUMENTS))
+        ]
+
+        self._respond({
+            '_scroll_id': str(offset + size),
+            'hits': {'total': DOCUMENTS, 'hits': hits},
+        })
+
+    do_GET = _handle
+    do_POST = _handle
+    do_DELETE = _handle
+
+
+@fixture
+def es_host():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeElasticsearchHandler)
+    FakeElasticsearchHandler.requests = []
+    FakeElasticsearchHandler.delay = 0
+
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield '127.0.0.1:{}'.format(server.server_address[1])
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_time_slices():
+    assert get_time_slices(0, 10, 1) == [(0, 10)]
+    assert get_time_slices(0, 10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert get_time_slices(100, 3700, 4) == [(100, 1000), (1000, 1900), (1900, 2800), (2800, 3700)]
+
+
+def test_shared_client():
+    assert get_client('localhost:9200') is get_client('localhost:9200')
+    assert get_client('localhost:9200') is not get_client('localhost:9201')
+
+
+def test_prefetcher():
+    assert list(Prefetcher([iter([[1, 2], [], [3]])], max_batches=1)) == [1, 2, 3]
+    assert sorted(Prefetcher([iter([[1, 2], [3]]), iter([[4], [5]])], max_batches=1)) == \
+        [1, 2, 3, 4, 5]
+    assert list(Prefetcher([])) == []
+
+    def failing():
+        yield [1]
+        raise ValueError('Fetch failed')
+
+    with raises(ValueError):
+        list(Prefetcher([failing()]))
+
+
+def test_prefetcher_max_producers():
+    running = []
+    most_running = []
+
+    def producer(value):
+        running.append(value)
+        most_running.append(len(running))
+        sleep(0.05)
+        yield [value]
+        running.remove(value)
+
+    entries = Prefetcher([producer(value) for value in range(5)], max_producers=2)
+
+    assert sorted(entries) == [0, 1, 2, 3, 4]
+    assert max(most_running) == 2
+
+
+def test_iter_log_entries(es_host):
+    entries = iter_log_entries(
+        es_host, query='@message: "foo"', period=3600, fields=['@message'], limit=100,
+        index_prefix='logstash-mediawiki-sql')
+
+    entries = list(entries)
+    assert len(entries) == DOCUMENTS
+
+    # the initial search, scrolls for the next batches (until an empty one)
+    # and clearing the scroll context
+    requests = FakeElasticsearchHandler.requests
+    assert len(requests) == 5
+    assert requests[4][0] == 'DELETE'
+    assert requests[4][2] == {'scroll_id': ['40']}
+
+    (_, path, body) = requests[0]
+    assert 'logstash-mediawiki-sql-' in path
+    assert 'scroll=2m' in path
+    assert body['_source'] == {'includes': ['@message']}
+    assert body['query']['bool']['must'][0] == {'query_string': {'query': '@message: "foo"'}}
+    assert 'lt' in body['query']['bool']['must'][1]['range']['@timestamp']
+
+    assert requests[1][2]['scroll_id'] == '10'
+    assert requests[2][2]['scroll_id'] == '20'
+
+
+def test_iter_log_entries_limit(es_host):
+    entries = list(iter_log_entries(
+        es_host, query='*', period=3600, fields=None, limit=12, index_prefix='logstash-foo'))
+
+    assert len(entries) == 12
+    assert entries[-1]['@message'] == 'SELECT * FROM foo WHERE id = 11'
+
+
+def test_iter_log_entries_oldest_first(es_host):
+    list(iter_log_entries(
+        es_host, query='*', period=3600, fields=None, limit=5, index_prefix='logstash-foo'))
+    list(iter_log_entries(
+        es_host, query='*', period=3600, fields=None, limit=5, index_prefix='logstash-foo',
+        oldest_first=True))
+
+    searches = [body for (_, path, body) in FakeElasticsearchHandler.requests
+                if '_search?' in path]
+
+    assert searches[0]['sort'] == ['_doc']
+    assert searches[1]['sort'] == [{'@timestamp': 'asc'}, '_doc']
+
+
+def test_iter_log_entries_stopped_early(es_host):
+    entries = iter_log_entries(
+        es_host, query='*', period=3600, fields=None, limit=100, index_prefix='logstash-foo',
+        slices=3, max_open_scrolls=2)
+
+    assert next(entries)['@message'] == 'SELECT * FROM foo WHERE id = 0'
+    entries.close()
+
+    # producers notice the consumer is gone and clear their scroll contexts
+    sleep(0.5)
+    requests = FakeElasticsearchHandler.requests
+
+    # every opened scroll context was cleared, the last slice was not started
+    searches = len([request for request in requests if '_search?' in request[1]])
+    assert [request[0] for request in requests].count('DELETE') == searches
+    assert searches == 2
+
+
+def test_iter_log_entries_slices(es_host):
+    entries = list(iter_log_entries(
+        es_host, query='*', period=3600, fields=None, limit=20, index_prefix='logstash-foo',
+        slices=2))
+
+    # each slice returns up to a half of the limit
+    assert len(entries) == 20
+
+    # a search and clearing the scroll context for each slice
+    requests = FakeElasticsearchHandler.requests
+    assert [request[0] for request in requests].count('DELETE') == 2
+    assert len(requests) == 4
+
+
+def test_iter_log_entries_concurrent(es_host):
+    FakeElasticsearchHandler.delay = 0.3
+
+    started = time()
+
+    # two sources, each one with three slices fitting a single batch
+    sources = [
+        iter_log_entries(
+            es_host, query='*', period=3600, fields=None, limit=15, index_prefix='logstash-foo',
+            slices=3)
+        for _ in range(2)
+    ]
+
+    # sources are consumed one after another (like the pipeline does)
+    entries = [entry for source in sources for entry in source]
+    elapsed = time() - started
+
+    assert len(entries) == 30
+
+    # six delayed searches (and clearing their scroll contexts) are sent at once,
+    # instead of taking the sum of their delays
+    requests = FakeElasticsearchHandler.requests
+    assert len(requests) == 12
+    assert elapsed < 0.5 * 6 * FakeElasticsearchHandler.delay
+
+
+def test_get_sql_queries_by_table(es_host):
+    queries = list(get_sql_queries_by_table('foo', es_host=es_host))
+
+    assert len(queries) == DOCUMENTS
+    assert queries[0]['query'] == 'SELECT * FROM foo WHERE id = N'
+    assert queries[0]['source_host'] == 'ap'
+    assert queries[0]['timestamp'] == 1542717296.
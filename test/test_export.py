@@ -0,0 +1,74 @@
+from os.path import dirname, join
+from io import StringIO
+
+from pytest import importorskip
+
+from digest.aggregate import QueryAggregator
+from digest.export import RawRowsAggregator, raw_rows_path
+from scripts.query_digest import main
+
+pyarrow = importorskip('pyarrow')
+importorskip('pyarrow.parquet')
+
+fixtures_dir = join(dirname(__file__), 'fixtures')
+
+
+def _entries():
+    return [
+        {'query': 'SELECT foo FROM bar', 'method': 'Foo::bar', 'dbname': 'local', 'source_host': 'ap',
+         'rows': 1, 'time': 2.0, 'timestamp': 1542717296.25},
+        {'query': 'SELECT foo FROM bar', 'method': 'Foo::bar', 'dbname': 'local', 'source_host': 'ap',
+         'rows': 3, 'time': 4.0, 'timestamp': None},
+        {'query': 'DELETE FROM bar', 'method': 'Foo::delete', 'dbname': 'local', 'source_host': 'cron',
+         'rows': 0, 'time': 1.0, 'timestamp': 1542717297.},
+    ]
+
+
+def test_raw_rows_aggregator():
+    entries = _entries()
+
+    raw_rows = RawRowsAggregator(QueryAggregator).update(entries[:1])
+    raw_rows.merge(RawRowsAggregator(QueryAggregator).update(entries[1:]))
+
+    assert raw_rows.total == 3
+    assert len(raw_rows) == 2
+    assert list(raw_rows.time) == [2.0, 4.0, 1.0]
+    assert raw_rows.method == ['Foo::bar', 'Foo::bar', 'Foo::delete']
+    assert raw_rows.fingerprint[0] == raw_rows.fingerprint[1] != raw_rows.fingerprint[2]
+
+
+def test_raw_rows_path():
+    assert raw_rows_path('/tmp/digest.parquet') == '/tmp/digest.raw.parquet'
+    assert raw_rows_path('/tmp.d/digest') == '/tmp.d/digest.raw'
+
+
+def test_parquet_export(tmpdir):
+    path = str(tmpdir.join('digest.parquet'))
+
+    out = StringIO()
+    main(arguments={'--file': join(fixtures_dir, 'queries.sql'), '--parquet': path,
+                    '--raw-rows': True}, output=out)
+
+    assert 'saved to' in out.getvalue()
+
+    table = pyarrow.parquet.read_table(path)
+    assert table.num_rows == 2
+    assert table.schema.field('count').type == pyarrow.int64()
+    assert table.schema.field('percentage').type == pyarrow.float64()
+    assert table.schema.field('fingerprint').type == pyarrow.uint64()
+    assert sorted(table.column('count').to_pylist()) == [1, 2]
+
+    raw = pyarrow.parquet.read_table(raw_rows_path(path))
+    assert raw.num_rows == 3
+    assert raw.column_names == ['fingerprint', 'method', 'source_host', 'time', 'rows', 'timestamp']
+
+
+def test_arrow_export(tmpdir):
+    feather = importorskip('pyarrow.feather')
+    path = str(tmpdir.join('digest.arrow'))
+
+    main(arguments={'--file': join(fixtures_dir, 'queries.sql'), '--arrow': path}, output=StringIO())
+
+    table = feather.read_table(path, memory_map=True)
+    assert table.num_rows == 2
+    assert abs(sum(table.column('percentage').to_pylist()) - 100.) < 1e-9
@@ -0,0 +1,175 @@
+import pickle
+
+from functools import partial
+
+import pytest
+
+from digest.errors import QueryDigestCommandLineError
+from digest.filters import QueryFilter, find_query_filter, parse_rules, query_kind
+from digest.pipeline import Aggregator, Filter, Pipeline, Source
+from digest.queries import filter_query
+
+
+def test_query_kind():
+    assert query_kind('SELECT foo FROM bar') == 'SELECT'
+    assert query_kind('  select foo FROM bar') == 'SELECT'
+    assert query_kind('/* Foo::bar */ UPDATE foo SET bar = 1') == 'UPDATE'
+    assert query_kind('/* foo */ /* bar\n */\tBEGIN') == 'BEGIN'
+    assert query_kind('Important table write: UPDATE foo SET bar = 1') == 'IMPORTANT'
+    assert query_kind('') == ''
+
+
+def test_filter_query_checks_kind_only():
+    # columns and tables named like transaction statements are not filtered out
+    assert filter_query({'query': 'SELECT BEGIN_DATE FROM events'})
+    assert filter_query({'query': 'UPDATE COMMITS SET foo = N'})
+    assert filter_query({'query': 'SELECT * FROM foo WHERE note = X SHOW'})
+
+    assert filter_query({'query': 'BEGIN'}) is False
+    assert filter_query({'query': 'COMMIT'}) is False
+
+
+def test_parse_rules():
+    rules = parse_rules('kind:select,Update table:page,revision method:^Wall method:Factory$')
+
+    assert rules == {
+        'kind': ['SELECT', 'UPDATE'],
+        'table': ['page', 'revision'],
+        'method': ['^Wall', 'Factory$'],
+    }
+
+    assert parse_rules(None) == {}
+
+    with pytest.raises(QueryDigestCommandLineError):
+        parse_rules('foo:bar')
+
+    with pytest.raises(QueryDigestCommandLineError):
+        parse_rules('kind')
+
+    with pytest.raises(QueryDigestCommandLineError):
+        parse_rules('method:(foo', '--exclude')
+
+
+def _entry(query, method='foo', dbname='wikicities', time=1.):
+    return {'query': query, 'method': method, 'dbname': dbname, 'time': time}
+
+
+def test_query_filter():
+    query_filter = QueryFilter(
+        include=parse_rules('kind:SELECT,UPDATE dbname:wikicities,statsdb'),
+        exclude=parse_rules('method:^Wall method:::get$ table:user'),
+        min_time=5,
+    )
+
+    entries = [
+        _entry('SELECT BEGIN_DATE FROM events', time=10),
+        _entry('UPDATE page SET page_touched = X', time=10),
+        _entry('BEGIN', time=10),  # include kind
+        _entry('DELETE FROM page', time=10),  # include kind
+        _entry('SELECT foo FROM page', time=1),  # min time
+        _entry('SELECT foo FROM page', dbname='muppet', time=10),  # include dbname
+        _entry('SELECT foo FROM page', method='WallNotifications::get', time=10),  # method
+        _entry('SELECT foo FROM page', method='Title::get', time=10),  # method
+        _entry('SELECT user_id FROM user', time=10),  # exclude table
+    ]
+
+    assert [entry['query'] for entry in entries if query_filter(entry)] == [
+        'SELECT BEGIN_DATE FROM events',
+        'UPDATE page SET page_touched = X',
+    ]
+
+    assert query_filter.dropped == {
+        'include kind': 2, 'min time': 1, 'include dbname': 1,
+        'exclude method': 2, 'exclude table': 1,
+    }
+
+    assert query_filter.summary() == \
+        'include kind: 2, exclude kind: 0, min time: 1, include dbname: 1, ' \
+        'exclude method: 2, exclude table: 1'
+
+
+def test_query_filter_include_tables():
+    query_filter = QueryFilter(include=parse_rules('table:page,revision'))
+
+    assert query_filter(_entry('SELECT foo FROM page WHERE id = N'))
+    assert query_filter(_entry('UPDATE revision SET rev_len = N'))
+    assert not query_filter(_entry('SELECT foo FROM user'))
+    assert not query_filter(_entry('COMMIT'))
+
+    assert query_filter.dropped == {'include table': 1, 'exclude kind': 1}
+
+
+def test_query_filter_accepts_sql():
+    query_filter = QueryFilter(exclude=parse_rules('kind:DELETE'))
+
+    assert query_filter.accepts_sql('/* Foo::bar */ SELECT 1')
+    assert query_filter.accepts_sql(None)
+    assert not query_filter.accepts_sql('delete from foo')
+    assert not query_filter.accepts_sql('BEGIN')
+
+    assert query_filter.dropped == {'exclude kind': 2}
+
+    # no kind rules - raw queries are always accepted
+    assert QueryFilter(skip_transactions=False).accepts_sql('BEGIN')
+
+
+def test_query_filter_pickle():
+    query_filter = QueryFilter(include=parse_rules('method:^Wall'))
+    assert not query_filter(_entry('SELECT 1'))
+
+    copy = pickle.loads(pickle.dumps(query_filter))
+
+    assert copy(_entry('SELECT 1', method='WallHooks::get'))
+    assert not copy(_entry('SELECT 1'))
+    assert copy.dropped == {'include method': 1}
+
+
+def test_pipeline_rejects_before_normalization():
+    normalized = []
+
+    def normalize(sql):
+        normalized.append(sql)
+        return {'query': sql.strip(), 'method': 'foo'}
+
+    query_filter = QueryFilter(include=parse_rules('kind:SELECT'))
+    queries = ['SELECT 1', 'BEGIN', 'DELETE FROM foo', 'SELECT 2', 'COMMIT']
+
+    digest = Pipeline([Source(queries, normalize, raw_sql=lambda sql: sql)],
+                      filter_stage=Filter(query_filter, query_filter.accepts_sql)).run()
+
+    assert digest.total == 2
+    assert normalized == ['SELECT 1', 'SELECT 2']
+    assert query_filter.dropped == {'include kind': 3}
+
+
+def test_query_filter_include_default_excluded_kinds():
+    query_filter = QueryFilter(include=parse_rules('kind:BEGIN,SELECT'))
+
+    assert query_filter(_entry('BEGIN'))
+    assert query_filter.accepts_sql('/* DatabaseBase::begin */ BEGIN')
+    assert query_filter(_entry('SELECT 1'))
+    assert not query_filter(_entry('COMMIT'))
+
+    assert query_filter.dropped == {'include kind': 1}
+
+
+def test_find_query_filter():
+    query_filter = QueryFilter()
+
+    assert find_query_filter(query_filter) is query_filter
+    assert find_query_filter(partial(lambda func, entry: func(entry), query_filter)) \
+        is query_filter
+    assert find_query_filter(lambda entry: True) is None
+
+
+def test_pipeline_parallel_counts_dropped():
+    queries = ['SELECT 1', 'BEGIN', 'DELETE FROM foo', 'SELECT 2', 'COMMIT', 'UPDATE foo']
+
+    query_filter = QueryFilter(include=parse_rules('kind:SELECT,UPDATE'))
+
+    # entries are rejected by worker processes only
+    digest = Pipeline([Source.from_queries(queries)], filter_stage=Filter(query_filter),
+                      aggregator=Aggregator(jobs=2)).run()
+
+    assert digest.total == 3
+    assert query_filter.dropped == {'include kind': 3}
@@ -0,0 +1,78 @@
+import random
+
+from os.path import dirname, join
+
+from pytest import raises
+from sql_metadata import generalize_sql
+
+from digest.errors import QueryDigestCommandLineError
+from digest.fingerprint import fingerprint, generalize_sql_fast
+from digest.queries import get_sql_queries_by_file, iter_file_queries, set_normalizer
+
+fixtures_dir = join(dirname(__file__), 'fixtures')
+
+QUERIES = (
+    'SELECT /* Foo::bar 10.8.1.2 */ foo FROM bar WHERE id = 123',
+    '/* Foo::bar */  SELECT  foo\n\nFROM bar WHERE id IN (1, 2, 3) AND name = \'a, b\'',
+    'SELECT foo FROM bar WHERE id IN (SELECT id, name FROM test)',
+    'INSERT INTO foo (id, name) VALUES (1, \'foo\'),(2, \'bar\')',
+    'SELECT fw1.id FROM fact_wam_scores fw1 WHERE fw1.time_id > -5 LIMIT 100',
+    'SELECT foo FROM bar WHERE name = "foo" OR name = "bar"',
+    'SELECT foo FROM bar WHERE name LIKE \'%foo\' OR name LIKE \'bar%\'',
+    'SELECT foo FROM bar WHERE name = \'it\\\'s\'',
+    'SELECT /**/ foo FROM bar',
+    'SELECT foo FROM bar WHERE name = \'unterminated',
+    'BEGIN',
+    '',
+)
+
+
+def test_conformance():
+    for query in QUERIES:
+        assert generalize_sql_fast(query) == generalize_sql(query), query
+
+    assert generalize_sql_fast(None) is None
+
+
+def test_conformance_fixtures():
+    for file_name in ('queries.sql', 'hive.sql'):
+        for query in iter_file_queries(join(fixtures_dir, file_name)):
+            assert generalize_sql_fast(query) == generalize_sql(query), query
+
+
+def test_conformance_random():
+    # random sequences of SQL-ish tokens, including corner cases of sql_metadata passes
+    tokens = [
+        'SELECT', 'FROM', 'IN', 'in', 'VALUES', 'LIKE', 'a', 'b1', '123', '-4', '=', '*', '/', '-',
+        ',', '(', ')', ' ', '  ', '\t', '\n', '/*', '*/', "'x y'", "'1,2'", "'", '"q"', '%', '\\',
+    ]
+
+    rand = random.Random(42)
+
+    for _ in range(5000):
+        query = ''.join(rand.choice(tokens) for _ in range(rand.randint(1, 15)))
+        assert generalize_sql_fast(query) == generalize_sql(query), query
+
+
+def test_fingerprint():
+    assert fingerprint('SELECT foo FROM bar WHERE id = N') == 0x787b3143899fce11
+    assert fingerprint('SELECT foo FROM bar') != fingerprint('SELECT foo FROM bar WHERE id = N')
+    assert 0 <= fingerprint('SELECT foo FROM bar') < 2 ** 64
+
+
+def test_set_normalizer():
+    try:
+        set_normalizer('fast')
+
+        queries = get_sql_queries_by_file(file_path=join(fixtures_dir, 'queries.sql'))
+        assert [query['query'] for query in queries] == [
+            'SELECT foo FROM bar WHERE foo = N;',
+            'SELECT foo FROM bar WHERE foo = N;',
+            'SELECT foo FROM bar ORDER BY foo LIMIT N;',
+        ]
+        assert queries[2]['method'] == 'get_items.sql'
+    finally:
+        set_normalizer('compat')
+
+    with raises(QueryDigestCommandLineError):
+        set_normalizer('foo')
@@ -0,0 +1,102 @@
+from os import rename
+
+from pytest import raises
+
+from digest.errors import QueryDigestReadError
+from digest.follow import SlidingWindowAggregator, follow_digest, follow_lines
+from digest.queries import filter_query, normalize_file_entry
+
+
+def _append(path, text):
+    with open(path, 'at') as handler:
+        handler.write(text)
+
+
+def test_follow_lines(tmpdir):
+    path = str(tmpdir.join('queries.log'))
+    _append(path, 'SELECT 1\n')
+
+    lines = follow_lines(path, sleep=lambda _: None)
+
+    # the existing content is skipped
+    assert next(lines) is None
+
+    _append(path, 'SELECT 2\nSELECT ')
+    assert next(lines) == 'SELECT 2\n'
+    assert next(lines) is None  # the last line is not complete yet
+
+    _append(path, '3\n')
+    assert next(lines) == 'SELECT 3\n'
+    assert next(lines) is None
+
+    # rotation: the file is moved away and a new one is created
+    rename(path, path + '.1')
+    _append(path + '.1', 'SELECT 4\n')
+    _append(path, 'SELECT 5\n')
+
+    assert next(lines) == 'SELECT 4\n'
+    assert next(lines) == 'SELECT 5\n'
+    assert next(lines) is None
+
+    # truncation (the file is now shorter than what was read from it)
+    with open(path, 'wt') as handler:
+        handler.write('SELECT\n')
+
+    assert next(lines) == 'SELECT\n'
+    assert next(lines) is None
+
+    lines.close()
+
+
+def test_follow_lines_from_start(tmpdir):
+    path = str(tmpdir.join('queries.log'))
+    _append(path, 'SELECT 1\n')
+
+    calls = []
+    lines = list(follow_lines(path, from_start=True, sleep=lambda _: None,
+                              stop=lambda: calls.append(1) or len(calls) > 3))
+
+    assert lines == ['SELECT 1\n', None, None]
+
+
+def test_follow_lines_not_found(tmpdir):
+    with raises(QueryDigestReadError):
+        next(follow_lines(str(tmpdir.join('not_existing.log'))))
+
+
+def test_sliding_window():
+    window = SlidingWindowAggregator(window=60)
+    assert window.bucket_size == 6
+
+    window.add({'query': 'SELECT 1', 'method': 'foo', 'time': 1.}, now=1000)
+    window.add({'query': 'SELECT 2', 'method': 'bar', 'time': 1.}, now=1030)
+    window.add({'query': 'SELECT 2', 'method': 'bar', 'time': 1., 'timestamp': 1031.}, now=1040)
+
+    # too old
+    window.add({'query': 'SELECT 3', 'method': 'old', 'time': 1., 'timestamp': 900.}, now=1040)
+
+    assert len(window) == 2
+    assert window.aggregate(now=1040).total == 3
+
+    # the first bucket has expired
+    aggregator = window.aggregate(now=1070)
+    assert len(window) == 1
+    assert [entry['method'] for (_, entry) in aggregator.results()] == ['bar']
+    assert aggregator.total == 2
+
+    # buckets are not modified by aggregating them
+    assert window.aggregate(now=1070).total == 2
+
+
+def test_follow_digest():
+    lines = ['SELECT 1;\n', '-- comment\n', None, 'DELETE FROM foo;\n', 'DELETE FROM foo;\n', None, None]
+    clock = iter([0, 1, 2, 2, 3, 4, 6, 11]).__next__
+
+    emitted = []
+
+    follow_digest(lines, normalize_file_entry, filter_query,
+                  lambda aggregator, now: emitted.append((now, aggregator.total, len(aggregator))),
+                  window=5, interval=3, clock=clock)
+
+    # all buckets have expired before the last digest
+    assert emitted == [(3, 2, 2), (6, 3, 2), (11, 0, 0)]
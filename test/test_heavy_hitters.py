@@ -0,0 +1,97 @@
+from collections import Counter, defaultdict
+from random import Random
+
+from digest.aggregate import QueryAggregator
+from digest.heavy_hitters import SpaceSavingAggregator
+
+
+def _entries(count=20000, kinds=5000, seed=42):
+    rand = Random(seed)
+    entries = []
+
+    for _ in range(count):
+        # a few heavy query kinds and a long tail of ad-hoc ones
+        kind = int(rand.paretovariate(1.2)) if rand.random() < 0.7 else rand.randint(10, kinds)
+
+        entries.append({
+            'query': 'SELECT {}'.format(kind), 'method': 'method{}'.format(kind),
+            'source_host': 'ap', 'rows': 1, 'time': float(kind % 7 + 1),
+        })
+
+    return entries
+
+
+def test_exact_when_within_capacity():
+    entries = _entries(count=1000, kinds=50)
+
+    exact = QueryAggregator().update(entries)
+    approx = SpaceSavingAggregator(top=10, capacity=100).update(entries)
+
+    assert len(approx) == len(exact)
+    assert approx.total == exact.total
+
+    for ((exact_key, exact_entry), (key, entry)) in \
+            zip(exact.results(top=10), approx.results()):
+        assert key == exact_key
+        assert entry['count'] == exact_entry['count']
+        assert entry['time_sum'] == exact_entry['time_sum']
+        assert entry['time_sum_error'] == 0
+
+
+def _check_bounds(approx, entries, top):
+    time_sums = defaultdict(float)
+
+    for entry in entries:
+        time_sums[entry['method'] + '-ap'] += entry['time']
+
+    results = list(approx.results())
+    assert len(results) == top
+
+    for (key, entry) in results:
+        # reported stats are lower bounds, error is the upper bound of what was missed
+        assert entry['time_sum'] <= time_sums[key] <= entry['time_sum'] + entry['time_sum_error']
+
+    # the heaviest query kinds are found
+    exact_top = sorted(time_sums, key=time_sums.get, reverse=True)[:5]
+    assert [key for (key, _) in results[:5]] == exact_top
+
+
+def test_bounded_state():
+    entries = _entries()
+    approx = SpaceSavingAggregator(top=10).update(entries)
+
+    assert approx.capacity == 100
+    assert len(approx) == 100
+    assert approx.total == len(entries)
+
+    _check_bounds(approx, entries, top=10)
+
+
+def test_merge():
+    entries = _entries()
+    approx = SpaceSavingAggregator(top=10)
+
+    for start in range(0, len(entries), 5000):
+        approx.merge(SpaceSavingAggregator(top=10).update(entries[start:start + 5000]))
+
+    assert len(approx) == 100
+    assert approx.total == len(entries)
+
+    _check_bounds(approx, entries, top=10)
+
+    # merged state can still be updated
+    approx.update(entries[:100])
+    assert len(approx) == 100
+
+
+def test_by_count():
+    entries = _entries()
+    approx = SpaceSavingAggregator(top=5, by_time=False).update(entries)
+
+    counts = Counter(entry['method'] + '-ap' for entry in entries)
+    results = list(approx.results(top=3))
+
+    assert [key for (key, _) in results] == [key for (key, _) in counts.most_common(3)]
+
+    for (key, entry) in results:
+        assert entry['count'] <= counts[key] <= entry['count'] + entry['count_error']
@@ -0,0 +1,95 @@
+from pytest import raises
+
+from digest.errors import QueryDigestCommandLineError
+from digest.index import FingerprintIndex, to_signed
+
+
+def _entry(query, method, time_sum, time_p95=1., count=1):
+    return {
+        'query': query, 'method': method, 'source_host': 'ap-s10', 'dbname': 'wikicities',
+        'count': count, 'time_sum': time_sum, 'time_median': time_p95, 'time_p95': time_p95,
+        'time_p99': time_p95, 'rows_sum': 0,
+    }
+
+
+def _index(tmpdir):
+    index = FingerprintIndex(str(tmpdir.join('index.db')))
+
+    index.save_run('a', [
+        _entry('SELECT * FROM foo WHERE id = N', 'Foo::get', 10.),
+        _entry('SELECT * FROM bar WHERE id = N', 'Bar::get', 10.),
+        _entry('DELETE FROM foo WHERE id = N', 'Foo::delete', 5.),
+        _entry('UPDATE foo SET bar = N', 'Foo::set', 5., time_p95=2.),
+    ], total=4, created=1)
+
+    index.save_run('b', [
+        _entry('SELECT * FROM foo WHERE id = N', 'Foo::get', 10.5),  # within the threshold
+        _entry('SELECT * FROM bar WHERE id = N', 'Bar::get', 25.),  # regressed time_sum
+        _entry('UPDATE foo SET bar = N', 'Foo::set', 5., time_p95=3.),  # regressed p95
+        _entry('INSERT INTO foo VALUES (XYZ)', 'Foo::add', 1.),  # new
+    ], total=4, created=2)
+
+    return index
+
+
+def test_to_signed():
+    assert to_signed(0) == 0
+    assert to_signed((1 << 63) - 1) == (1 << 63) - 1
+    assert to_signed(1 << 63) == -(1 << 63)
+    assert to_signed((1 << 64) - 1) == -1
+
+
+def test_runs(tmpdir):
+    index = _index(tmpdir)
+    assert index.runs() == ['a', 'b']
+
+    # runs can be replaced
+    index.save_run('a', [], total=0, created=3)
+    assert index.runs() == ['b', 'a']
+
+
+def test_diff(tmpdir):
+    diff = _index(tmpdir).diff('a', 'b')
+
+    assert [(row['change'], row['method']) for row in diff] == [
+        ('regressed', 'Bar::get'),
+        ('disappeared', 'Foo::delete'),
+        ('new', 'Foo::add'),
+        ('regressed', 'Foo::set'),
+    ]
+
+    assert diff[0]['time_sum_a'] == 10.
+    assert diff[0]['time_sum_b'] == 25.
+
+    assert diff[1]['time_sum_a'] == 5.
+    assert diff[1]['time_sum_b'] is None
+
+    assert diff[2]['time_sum_a'] is None
+    assert diff[2]['time_sum_b'] == 1.
+
+    # only bigger changes are reported
+    assert [row['method'] for row in _index(tmpdir).diff('a', 'b', threshold=1.)] == \
+        ['Bar::get', 'Foo::delete', 'Foo::add']
+
+
+def test_diff_run_not_found(tmpdir):
+    with raises(QueryDigestCommandLineError) as ex:
+        _index(tmpdir).diff('a', 'c')
+
+    assert 'Run "c" not found in the index, try: a, b' in str(ex.value)
+
+
+def test_save_run_without_method(tmpdir):
+    index = FingerprintIndex(str(tmpdir.join('index.db')))
+
+    entry = _entry('SELECT * FROM foo WHERE id = N', None, 10.)
+    entry['source_host'] = None
+
+    index.save_run('a', [entry], total=1, created=1)
+    index.save_run('b', [], total=0, created=2)
+
+    diff = index.diff('a', 'b')
+
+    assert len(diff) == 1
+    assert diff[0]['change'] == 'disappeared'
+    assert diff[0]['method'] == ''
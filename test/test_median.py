@@ -1,5 +1,5 @@
 import unittest
-from digest.math import median
+from digest.math import median, QuantileSketch
 
 
 class TestMath(unittest.TestCase):
@@ -10,3 +10,37 @@ class TestMath(unittest.TestCase):
         assert median([1, 2, 3]) == 2
         assert median([1, 3, 2]) == 2
         assert median([1, 2]) == 1.5
+
+    def test_quantile_sketch(self):
+        sketch = QuantileSketch()
+
+        for value in [1, 3, 2]:
+            sketch.add(value)
+
+        assert sketch.count == 3
+        assert sketch.quantile(0.5) == median([1, 2, 3])
+        assert sketch.quantile(1) == 3
+
+        sketch.add(4)
+        assert sketch.quantile(0.5) == median([1, 2, 3, 4])
+        assert QuantileSketch().quantile(0.5) is None
+
+    def test_quantile_sketch_relative_error(self):
+        values = [0] * 10 + [1. * value for value in range(1, 1001)]
+
+        sketch = QuantileSketch(relative_accuracy=0.01, exact_limit=100)
+        other = QuantileSketch(relative_accuracy=0.01, exact_limit=100)
+
+        for value in values[::2]:
+            sketch.add(value)
+
+        for value in values[1::2]:
+            other.add(value)
+
+        sketch.merge(other)
+        assert sketch.count == len(values)
+
+        assert sketch.quantile(0) == 0
+        assert abs(sketch.quantile(0.5) - 496) / 496 <= 0.01
+        assert abs(sketch.quantile(0.95) - 950) / 950 <= 0.01
+        assert abs(sketch.quantile(0.99) - 990) / 990 <= 0.01
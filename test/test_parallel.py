@@ -0,0 +1,50 @@
+import multiprocessing
+
+from os.path import dirname, join
+
+from digest.parallel import aggregate_sources, iter_chunks
+from digest.queries import filter_query, get_normalizer, iter_file_queries, \
+    normalize_file_entry, set_normalizer
+
+fixtures_dir = join(dirname(__file__), 'fixtures')
+
+
+def test_iter_chunks():
+    assert list(iter_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(iter_chunks([], 2)) == []
+
+
+def test_aggregate_sources_parallel():
+    def sources():
+        return [
+            (iter_file_queries(join(fixtures_dir, 'queries.sql')), normalize_file_entry),
+            (iter_file_queries(join(fixtures_dir, 'hive.sql')), normalize_file_entry),
+        ]
+
+    serial = aggregate_sources(sources(), filter_func=filter_query)
+    parallel = aggregate_sources(sources(), filter_func=filter_query, jobs=2, chunk_size=1)
+
+    assert serial.total == parallel.total == 5
+    assert list(serial.results()) == list(parallel.results())
+
+
+
+def _normalize_with_normalizer_name(sql):
+    return {'query': get_normalizer(), 'method': sql}
+
+
+def test_aggregate_sources_initializer(monkeypatch):
+    # module globals are not inherited by spawned worker processes
+    monkeypatch.setattr(multiprocessing, 'Pool', multiprocessing.get_context('spawn').Pool)
+
+    try:
+        set_normalizer('fast')
+
+        aggregator = aggregate_sources(
+            [(['SELECT 1', 'SELECT 2'], _normalize_with_normalizer_name)],
+            filter_func=filter_query, jobs=2, chunk_size=1,
+            initializer=set_normalizer, initargs=(get_normalizer(),))
+    finally:
+        set_normalizer('compat')
+
+    assert [entry['query'] for (_, entry) in aggregator.results()] == ['fast', 'fast']
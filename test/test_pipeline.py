@@ -0,0 +1,114 @@
+from io import StringIO
+from os.path import dirname, join
+
+from digest.output import write_csv
+from digest.pipeline import Aggregator, Digest, Filter, Normalizer, Pipeline, QueryKindStats, \
+    Sink, Source
+from digest.queries import normalize_file_entry
+
+fixtures_dir = join(dirname(__file__), 'fixtures')
+
+
+def test_pipeline_from_file():
+    digest = Pipeline([Source.from_file(join(fixtures_dir, 'queries.sql'))]).run()
+
+    assert digest.total == 3
+    assert len(digest) == 2
+
+    results = list(digest.results())
+
+    assert isinstance(results[0], QueryKindStats)
+    assert results[0].query == 'SELECT foo FROM bar WHERE foo = N;'
+    assert results[0].count == 2
+    assert abs(results[0].percentage - 66.67) < 0.01
+    assert results[1].method == 'get_items.sql'
+
+    assert len(list(digest.results(top=1))) == 1
+
+
+def test_pipeline_results_order():
+    digest = Pipeline([Source.from_file(join(fixtures_dir, 'slow.log'), slow_log=True)]).run()
+
+    # the highest total time first, even when all query kinds are reported
+    times = [stats.time_sum for stats in digest.results()]
+
+    assert len(times) > 1
+    assert times == sorted(times, reverse=True)
+
+
+def test_pipeline_parallel():
+    sources = [
+        Source.from_file(join(fixtures_dir, 'queries.sql')),
+        Source.from_file(join(fixtures_dir, 'hive.sql')),
+    ]
+
+    single = Pipeline(sources).run()
+
+    sources = [
+        Source.from_file(join(fixtures_dir, 'queries.sql')),
+        Source.from_file(join(fixtures_dir, 'hive.sql')),
+    ]
+
+    parallel = Pipeline(sources, aggregator=Aggregator(jobs=2)).run()
+
+    assert parallel.total == single.total
+    assert list(parallel.results()) == list(single.results())
+
+
+def test_sources_and_filter():
+    queries = ['SELECT 1 FROM foo', 'BEGIN', 'SELECT 2 FROM foo', 'COMMIT']
+
+    # transactions are filtered out by default
+    digest = Pipeline([Source.from_queries(queries)]).run()
+    assert digest.total == 2
+
+    digest = Pipeline([Source.from_queries(queries)], filter_stage=Filter(lambda _: True)).run()
+    assert digest.total == 4
+
+    entries = [normalize_file_entry(query) for query in queries]
+    digest = Pipeline([Source.from_entries(entries)]).run()
+    assert digest.total == 2
+
+
+def test_stages_chaining():
+    queries = ['SELECT 1 FROM foo', 'BEGIN', 'SELECT 2 FROM bar']
+
+    entries = Filter().process(Normalizer(normalize_file_entry).process(queries))
+    digest = Aggregator().process(entries)
+
+    assert isinstance(digest, Digest)
+    assert digest.total == 2
+    assert sorted(stats.query for stats in digest.results()) == \
+        ['SELECT N FROM bar', 'SELECT N FROM foo']
+
+
+def test_sink():
+    digest = Pipeline([Source.from_file(join(fixtures_dir, 'queries.sql'))]).run()
+
+    output = StringIO()
+    assert Sink(output, write_csv).write(digest, 'report', top=1) == 1
+
+    lines = output.getvalue().splitlines()
+
+    assert lines[0] == '# report'
+    assert len(lines) == 3  # header, column names and a single query kind
+
+
+def test_pipeline_runs_stages():
+    calls = []
+
+    class CountingFilter(Filter):
+        def process(self, entries):
+            calls.append('filter')
+            return super(CountingFilter, self).process(entries)
+
+    class CountingNormalizer(Normalizer):
+        def process(self, entries):
+            calls.append('normalize')
+            return super(CountingNormalizer, self).process(entries)
+
+    source = Source(['SELECT 1 FROM foo', 'BEGIN'], CountingNormalizer(normalize_file_entry))
+    digest = Pipeline([source], filter_stage=CountingFilter()).run()
+
+    assert digest.total == 1
+    assert calls == ['normalize', 'filter']
@@ -0,0 +1,60 @@
+from time import sleep
+
+from digest.profile import NullProfiler, Profiler
+
+
+def test_profiler_exclusive_time():
+    profiler = Profiler()
+
+    def slow(value):
+        sleep(0.01)
+        return value
+
+    def entries():
+        for value in range(3):
+            sleep(0.01)
+            yield value
+
+    with profiler.stage('aggregate'):
+        values = list(map(profiler.wrap('normalize', slow), profiler.iterate('fetch', entries())))
+
+    assert values == [0, 1, 2]
+
+    stages = profiler.stages
+    assert list(stages.keys()) == ['fetch', 'normalize', 'aggregate']
+
+    assert stages['fetch'].items == 3
+    assert stages['normalize'].items == 3
+    assert stages['fetch'].wall >= 0.03
+    assert stages['normalize'].wall >= 0.03
+
+    # time spent in nested stages is not included
+    assert stages['aggregate'].wall < 0.01
+    assert len(stages['aggregate'].spans) == 1
+    assert stages['aggregate'].spans[0][1] >= 0.06
+
+    assert 'normalize' in profiler.summary()
+
+
+def test_profiler_chrome_trace():
+    profiler = Profiler()
+
+    with profiler.stage('sort'):
+        profiler.count('sort', 5)
+
+    events = profiler.chrome_trace()['traceEvents']
+    spans = [event for event in events if event['ph'] == 'X']
+
+    assert [(event['name'], event['tid']) for event in spans] == [('sort', 1), ('sort', 2)]
+    assert spans[1]['args']['items'] == 5
+
+
+def test_null_profiler():
+    profiler = NullProfiler()
+    entries = iter([1, 2])
+
+    assert profiler.iterate('fetch', entries) is entries
+    assert profiler.wrap('normalize', len) is len
+
+    with profiler.stage('sort'):
+        profiler.count('sort', 5)
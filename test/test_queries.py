@@ -1,5 +1,11 @@
+from collections import Counter
 from os.path import dirname, join
-from digest.queries import filter_query, get_sql_queries_by_file
+from pytest import raises
+
+from digest.entry import QueryEntry
+from digest.filters import DEFAULT_EXCLUDED_KINDS
+from digest.queries import filter_query, get_sql_queries_by_file, iter_sql_queries_by_file, \
+    normalize_file_entry, normalize_mediawiki_entry, parse_timestamp, skip_normalization
 
 fixtures_dir = join(dirname(__file__), 'fixtures')
 
@@ -39,3 +45,129 @@ def test_read_file():
     assert queries[0]['method'] == '4d9ef9d7'
     assert queries[1]['method'] == '4d9ef9d7'
     assert queries[2]['method'] == 'get_items.sql'  # extracted from SQL query comment
+
+
+def test_read_gzip_file(tmpdir):
+    import gzip
+    from shutil import copyfileobj
+
+    gzipped = str(tmpdir.join('queries.sql.gz'))
+
+    with open(fixtures_dir + '/queries.sql', 'rb') as source, gzip.open(gzipped, 'wb') as target:
+        copyfileobj(source, target)
+
+    queries = get_sql_queries_by_file(file_path=gzipped)
+
+    assert len(queries) == 3
+    assert queries[2]['method'] == 'get_items.sql'
+
+
+def test_iter_file_mmap():
+    queries = iter_sql_queries_by_file(file_path=fixtures_dir + '/queries.sql', use_mmap=True)
+
+    assert not isinstance(queries, list), 'Entries should be yielded lazily'
+
+    queries = list(queries)
+    assert len(queries) == 3
+    assert queries[0]['query'] == 'SELECT foo FROM bar WHERE foo = N;'
+    assert queries[2]['query'] == 'SELECT foo FROM bar ORDER BY foo LIMIT N;'
+
+
+def test_normalize_mediawiki_entry():
+    entry = normalize_mediawiki_entry({
+        '@message': 'SELECT /* Foo::bar */ foo FROM bar WHERE id = 123',
+        '@context': {
+            'method': 'Foo::bar (from Foo::test)',
+            'db_name': 'wikicities',
+            'server_role': 'master',
+            'num_rows': 5,
+            'elapsed': 0.0123,
+        },
+        '@fields': {
+            'wiki_dbname': 'muppet',
+        },
+        '@source_host': 'cron-s1',
+        '@timestamp': '2018-11-20T12:34:56.250Z',
+    })
+
+    assert isinstance(entry, QueryEntry)
+    assert entry['query'] == 'SELECT foo FROM bar WHERE id = N'
+    assert entry['method'] == 'Foo::bar'
+    assert entry['dbname'] == 'wikicities'
+    assert entry['from_master'] is True
+    assert entry['source_host'] == 'cron'
+    assert entry['rows'] == 5
+    assert abs(entry['time'] - 12.3) < 1e-9
+    assert entry['timestamp'] == 1542717296.25
+
+    assert list(entry.to_dict().keys()) == [
+        'original_query', 'query', 'method', 'dbname', 'from_master', 'source_host', 'rows', 'time',
+        'timestamp'
+    ]
+
+
+def test_skip_normalization(monkeypatch):
+    import digest.queries
+
+    def generalize_sql(sql):
+        raise AssertionError('"{}" should not be normalized'.format(sql))
+
+    monkeypatch.setattr(digest.queries, 'generalize_sql', generalize_sql)
+    monkeypatch.setattr(digest.queries, 'remove_comments_from_sql', generalize_sql)
+    monkeypatch.setattr(digest.queries, 'skipped_normalizations', Counter())
+    monkeypatch.setattr(digest.queries, 'skipped_kinds', DEFAULT_EXCLUDED_KINDS)
+
+    assert skip_normalization('SELECT BEGIN_DATE FROM events') is None
+    assert skip_normalization(None) is None
+
+    entry = normalize_mediawiki_entry({
+        '@message': 'BEGIN /* DatabaseBase::begin */ ',
+        '@context': {'method': 'DatabaseBase::begin', 'db_name': 'wikicities'},
+        '@source_host': 'ap-s10',
+    })
+
+    # comments are removed, so that there's a single query kind
+    assert entry['query'] == 'BEGIN'
+    assert entry['original_query'] == entry['query']
+    assert normalize_file_entry('/* Foo::bar */  COMMIT\n')['query'] == 'COMMIT'
+    assert filter_query(entry) is False
+
+    assert filter_query(normalize_file_entry('Important table write: UPDATE foo SET id = 1\n')) \
+        is False
+    assert filter_query(normalize_file_entry('/* Foo::bar */ COMMIT\n')) is False
+
+    assert digest.queries.skipped_normalizations == {'BEGIN': 1, 'IMPORTANT': 1, 'COMMIT': 2}
+
+
+def test_query_entry():
+    entry = QueryEntry(query='SELECT foo FROM bar', method='Foo::bar')
+
+    assert entry['method'] == 'Foo::bar'
+    assert entry.get('dbname') is None
+    assert entry.get('dbname', 'local') == 'local'
+    assert 'query' in entry
+    assert 'dbname' not in entry
+    assert entry.to_dict() == {'query': 'SELECT foo FROM bar', 'method': 'Foo::bar'}
+
+    # low-cardinality strings are interned
+    assert entry['method'] is QueryEntry(method=''.join(['Foo::', 'bar']))['method']
+
+    with raises(KeyError):
+        entry['dbname']  # pylint: disable=pointless-statement
+
+
+def test_parse_timestamp():
+    assert parse_timestamp('2014-07-09T08:37:18Z') == 1404895038
+    assert parse_timestamp('2014-07-09T08:37:18.5Z') == 1404895038.5
+    assert parse_timestamp('2014-07-09T08:37:18') == 1404895038
+
+    # UTC offsets
+    assert parse_timestamp('2014-07-09T08:37:18+00:00') == 1404895038
+    assert parse_timestamp('2014-07-09T08:37:18.5+0000') == 1404895038.5
+    assert parse_timestamp('2014-07-09T10:37:18+02:00') == 1404895038
+    assert parse_timestamp('2014-07-09T06:07:18-0230') == 1404895038
+
+    assert parse_timestamp(None) is None
+    assert parse_timestamp('') is None
+    assert parse_timestamp('2014-07-09 08:37:18') is None
+    assert parse_timestamp('2014-13-09T08:37:18Z') is None
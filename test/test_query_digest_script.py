@@ -1,9 +1,13 @@
+import sys
+
 from pytest import raises
 
 from os.path import dirname, join
 from io import StringIO
+from subprocess import check_output
 
 from digest.errors import QueryDigestCommandLineError, QueryDigestReadError
+from digest.queries import normalization_cache
 from scripts.query_digest import main
 
 fixtures_dir = join(dirname(__file__), 'fixtures')
@@ -26,6 +30,25 @@ def test_read_file_not_found():
     )
 
 
+def test_read_file_not_found_closes_cache(tmpdir):
+    cache = str(tmpdir.join('cache.db'))
+
+    with raises(QueryDigestReadError):
+        main(arguments={'--file': '/foo/var/not_existing.sql', '--cache': cache})
+
+    # on-disk store is flushed and closed
+    assert normalization_cache._store is None
+
+
+def test_read_file_not_found_stops_profiler(tmpdir):
+    with raises(QueryDigestReadError):
+        main(arguments={'--file': '/foo/var/not_existing.sql',
+                        '--profile-output': str(tmpdir.join('query_digest.pstats'))})
+
+    # cProfile is disabled
+    assert sys.getprofile() is None
+
+
 def test_read_file_table():
     out = StringIO()
     main(arguments={'--file': join(fixtures_dir, 'queries.sql')}, output=out)
@@ -55,3 +78,238 @@ def test_read_hive_sql_data_flow():
     assert 'hive_01_insert\thive_01_insert\tdb:foo_report\t1.00' in out.getvalue()
     assert 'db:rollup_wiki_beacon_pageviews\thive_01_select\thive_01_select\t1.00' in out.getvalue()
     assert 'statsdb:dimension_wikis\thive_01_select\thive_01_select\t1.00' in out.getvalue()
+
+
+def test_read_file_data_flow_dot():
+    out = StringIO()
+    main(arguments={'--file': join(fixtures_dir, 'hive.sql'), '--data-flow': True,
+                    '--data-flow-format': 'dot', '--jobs': '2'}, output=out)
+
+    assert '"hive_01_insert" -> "db:foo_report" [label="hive_01_insert", weight=1.00' \
+        in out.getvalue()
+    assert out.getvalue().endswith('}\n')
+
+    with raises(QueryDigestCommandLineError):
+        main(arguments={'--file': join(fixtures_dir, 'hive.sql'), '--data-flow': True,
+                        '--data-flow-format': 'svg'})
+
+
+def test_read_file_jobs():
+    out = StringIO()
+    main(arguments={'--file': join(fixtures_dir, 'queries.sql'), '--jobs': '2'}, output=out)
+
+    assert 'test/fixtures/queries.sql" file, found 3 queries' in out.getvalue()
+    assert 'get_items.sql' in out.getvalue()
+
+
+def test_read_file_fast_normalizer():
+    out = StringIO()
+    main(arguments={'--file': join(fixtures_dir, 'queries.sql'), '--normalizer': 'fast'}, output=out)
+
+    assert 'test/fixtures/queries.sql" file, found 3 queries' in out.getvalue()
+    assert 'SELECT foo FROM bar WHERE foo = N;' in out.getvalue()
+
+
+def test_read_file_profile(tmpdir, capsys):
+    trace = str(tmpdir.join('trace.json'))
+
+    out = StringIO()
+    main(arguments={'--file': join(fixtures_dir, 'queries.sql'), '--profile': True,
+                    '--profile-output': trace}, output=out)
+
+    assert 'get_items.sql' in out.getvalue()
+
+    summary = capsys.readouterr().err
+    assert 'normalize' in summary
+    assert 'output' in summary
+
+    with open(trace) as handler:
+        assert 'traceEvents' in handler.read()
+
+
+def test_read_file_top():
+    out = StringIO()
+    main(arguments={'--file': join(fixtures_dir, 'queries.sql'), '--csv': True, '--top': '1'},
+         output=out)
+
+    lines = out.getvalue().strip().split('\n')
+
+    # the header, CSV columns and a single query kind
+    assert len(lines) == 3
+    assert lines[2].startswith('SELECT foo FROM bar WHERE foo = N;,4d9ef9d7')
+
+    with raises(QueryDigestCommandLineError):
+        main(arguments={'--file': join(fixtures_dir, 'queries.sql'), '--top': '0'})
+
+
+def test_index_and_diff(tmpdir):
+    index = str(tmpdir.join('index.db'))
+
+    main(arguments={'--file': join(fixtures_dir, 'queries.sql'), '--index': index, '--run': 'a'},
+         output=StringIO())
+    main(arguments={'--file': join(fixtures_dir, 'hive.sql'), '--index': index, '--run': 'b'},
+         output=StringIO())
+
+    out = StringIO()
+    main(arguments={'--index': index, '--diff': True, '<run_a>': 'a', '<run_b>': 'b',
+                    '--csv': True}, output=out)
+
+    lines = out.getvalue().strip().split('\n')
+
+    assert lines[0].startswith('# Query digest diff of "a" and "b" runs, found ')
+    assert lines[1].startswith('change,method,source_host,dbname,query,count_a,count_b')
+    assert any(line.startswith('new,') for line in lines)
+    assert any(line.startswith('disappeared,') for line in lines)
+
+    # the same run compared with itself
+    out = StringIO()
+    main(arguments={'--index': index, '--diff': True, '<run_a>': 'a', '<run_b>': 'a'}, output=out)
+    assert out.getvalue() == 'Query digest diff of "a" and "a" runs, found 0 changes\n'
+
+
+def test_cache_with_jobs(tmpdir):
+    # worker processes do not use the on-disk store
+    with raises(QueryDigestCommandLineError):
+        main(arguments={'--file': join(fixtures_dir, 'queries.sql'), '--jobs': '2',
+                        '--cache': str(tmpdir.join('cache.sqlite'))})
+
+
+def test_state_with_slices(tmpdir):
+    # the high-water mark can not be kept when every slice is cut off by the limit
+    with raises(QueryDigestCommandLineError):
+        main(arguments={'--table': 'foo', '--state': str(tmpdir.join('state.json')),
+                        '--slices': '2'})
+
+
+def test_follow(monkeypatch):
+    with raises(QueryDigestCommandLineError):
+        main(arguments={'--table': 'foo', '--follow': True})
+
+    with raises(QueryDigestCommandLineError):
+        main(arguments={'--file': 'foo.log', '--follow': True, '--index': 'index.db'})
+
+    monkeypatch.setattr(
+        'scripts.query_digest.follow_lines',
+        lambda path, poll_interval: iter(['SELECT foo FROM bar;\n', None]))
+
+    out = StringIO()
+    main(arguments={'--file': 'foo.log', '--follow': True, '--interval': '0', '--csv': True},
+         output=out)
+
+    lines = out.getvalue().strip().splitlines()
+
+    # the digest is reported after each line
+    assert len(lines) == 6
+    assert lines[0].startswith('# Query digest for "foo.log" file, last 300 seconds at ')
+    assert lines[0].endswith(', found 1 queries')
+    assert lines[2].startswith('SELECT foo FROM bar;,')
+    assert lines[3:] == lines[:3]
+
+
+def test_follow_slow_log(monkeypatch):
+    monkeypatch.setattr(
+        'scripts.query_digest.follow_lines',
+        lambda path, poll_interval: iter([
+            '# Query_time: 0.500000  Lock_time: 0.000000 Rows_sent: 1  Rows_examined: 10\n',
+            'use wikicities;\n',
+            'SELECT /* Foo::bar */ foo FROM bar WHERE id = 1;\n',
+            None,
+        ]))
+
+    out = StringIO()
+    main(arguments={'--file': 'mysql-slow.log', '--follow': True, '--slow-log': True,
+                    '--interval': '0', '--csv': True}, output=out)
+
+    lines = out.getvalue().strip().splitlines()
+
+    # slow log entries are parsed and the last one is reported without waiting for the next one
+    assert lines[-3].endswith(', found 1 queries')
+    assert ',SELECT foo FROM bar WHERE id = N;,Foo::bar,wikicities,' in lines[-1]
+
+
+def test_read_slow_log():
+    out = StringIO()
+    main(arguments={'--file': join(fixtures_dir, 'slow.log'), '--slow-log': True, '--csv': True,
+                    '--jobs': '2'}, output=out)
+
+    lines = out.getvalue().strip().splitlines()
+
+    assert lines[0] == '# Query digest for "{}" file, found 4 queries'.format(
+        join(fixtures_dir, 'slow.log'))
+
+    # the slowest query kind first, with its real time and rows
+    assert lines[2].startswith('"DELETE FROM events_local_users WHERE wiki_id = 123 ')
+    assert ',1,25.00%,1250.0,1250.0,' in lines[2]
+
+
+def test_read_slow_log_filter_rules():
+    out = StringIO()
+    main(arguments={'--file': join(fixtures_dir, 'slow.log'), '--slow-log': True, '--csv': True,
+                    '--include': 'kind:select,delete', '--exclude': 'dbname:specials',
+                    '--min-time': '1'}, output=out)
+
+    lines = out.getvalue().strip().splitlines()
+
+    # the DELETE query is made on specials database, one SELECT took less than 1 ms
+    assert lines[0].endswith('found 2 queries')
+    assert lines[2].startswith('SELECT page_id FROM `page` ')
+    assert ',Title::getArticleID,wikicities,ap,2,100.00%,4.0,' in lines[2]
+
+    with raises(QueryDigestCommandLineError):
+        main(arguments={'--file': join(fixtures_dir, 'slow.log'), '--include': 'foo:bar'})
+
+    with raises(QueryDigestCommandLineError):
+        main(arguments={'--file': join(fixtures_dir, 'slow.log'), '--min-time': 'foo'})
+
+
+def test_read_file_approx_top():
+    out = StringIO()
+    main(arguments={'--file': join(fixtures_dir, 'hive.sql'), '--csv': True,
+                    '--approx-top': '2', '--jobs': '2'}, output=out)
+
+    lines = out.getvalue().strip().splitlines()
+
+    # the header, CSV columns and two query kinds ranked by count
+    assert len(lines) == 4
+    assert lines[1].endswith(',count_error')
+
+    with raises(QueryDigestCommandLineError):
+        main(arguments={'--file': join(fixtures_dir, 'hive.sql'), '--approx-top': '0'})
+
+
+def test_lazy_imports():
+    # heavy dependencies are not imported until input and output modes need them
+    code = 'import sys, scripts.query_digest; print(" ".join(sorted(sys.modules)))'
+    modules = check_output([sys.executable, '-c', code], cwd=join(dirname(__file__), '..'))
+    modules = modules.decode('utf8').split()
+
+    for module in ('elasticsearch', 'elasticsearch_query', 'numpy', 'pyarrow', 'tabulate',
+                   'sql_metadata', 'multiprocessing'):
+        assert module not in modules
+
+
+def test_skipped_normalizations_counted_per_run(tmpdir):
+    from digest.queries import skipped_normalizations
+
+    queries = tmpdir.join('queries.sql')
+    queries.write('BEGIN\nSELECT foo FROM bar WHERE id = 1\nCOMMIT\n')
+
+    for _ in range(2):
+        main(arguments={'--file': str(queries)}, output=StringIO())
+        assert skipped_normalizations == {'BEGIN': 1, 'COMMIT': 1}
+
+
+def test_include_skipped_kind(tmpdir):
+    from digest.queries import skipped_normalizations
+
+    queries = tmpdir.join('queries.sql')
+    queries.write("BEGIN\nSHOW TABLES LIKE 'foo_1'\nSHOW TABLES LIKE 'foo_2'\nCOMMIT\n")
+
+    out = StringIO()
+    main(arguments={'--file': str(queries), '--include': 'kind:SHOW'}, output=out)
+
+    # included SHOW queries are normalized into a single query kind
+    assert 'found 2 queries' in out.getvalue()
+    assert 'SHOW TABLES LIKE X' in out.getvalue()
+    assert 'foo_1' not in out.getvalue()
+    assert 'SHOW' not in skipped_normalizations
@@ -66,3 +66,19 @@ class TestQueryMetadata(unittest.TestCase):
         # invalid queries
         self.assertRaises(ValueError, get_query_metadata, 'FOO BAR')
         self.assertRaises(ValueError, get_query_metadata, 'UPDATE BAR')
+
+    def test_get_query_metadata_memoized(self):
+        query = 'SELECT * FROM `wall_notification` WHERE user_id = N'
+
+        assert get_query_metadata(query) is get_query_metadata(query)
+
+        # parsing errors are remembered too
+        with self.assertRaises(ValueError) as first:
+            get_query_metadata('FOO BAR')
+
+        with self.assertRaises(ValueError) as second:
+            get_query_metadata('FOO BAR')
+
+        # a new exception is raised every time
+        assert first.exception is not second.exception
+        assert str(second.exception) == 'Could not get metadata for FOO BAR'
@@ -0,0 +1,112 @@
+from os.path import dirname, join
+
+from digest.queries import iter_slow_log_queries, normalize_slow_log_entry
+from digest.slowlog import is_banner, iter_slow_log_entries, parse_time_header
+
+fixtures_dir = join(dirname(__file__), 'fixtures')
+
+
+def test_parse_time_header():
+    assert parse_time_header(' 2018-11-20T12:00:00.123456Z\n') == 1542715200.123456
+    assert parse_time_header(' 181120 12:00:05') == 1542715205.
+    assert parse_time_header('foo') is None
+
+
+def test_is_banner():
+    assert is_banner('/usr/sbin/mysqld, Version: 5.7.24-log (MySQL Community Server (GPL)).')
+    assert is_banner('Tcp port: 3306  Unix socket: /var/run/mysqld/mysqld.sock')
+    assert is_banner('Time                 Id Command    Argument')
+    assert not is_banner('/* Foo::bar */ SELECT 1')
+
+
+def test_iter_slow_log_entries():
+    entries = list(iter_slow_log_queries(join(fixtures_dir, 'slow.log')))
+
+    assert len(entries) == 4
+
+    assert entries[0] == {
+        'sql': "SELECT /* Title::getArticleID */ page_id FROM `page` "
+               "WHERE page_namespace = 0 AND page_title = 'Main_Page' LIMIT 1;",
+        'query_time': 0.0015, 'lock_time': 0.0001, 'rows_sent': 1, 'rows_examined': 100,
+        'user': 'wikia', 'host': 'ap-s10', 'ip': '10.8.1.2',
+        'db': 'wikicities', 'timestamp': 1542715200.,
+    }
+
+    # "use" applies to the following entries
+    assert entries[1]['db'] == 'wikicities'
+    assert entries[1]['host'] == 'ap-s21'
+
+    # multi-line statement
+    assert entries[2]['sql'] == \
+        'DELETE FROM events_local_users WHERE wiki_id = 123 AND user_id IN (1, 2, 3);'
+    assert entries[2]['db'] == 'specials'
+    assert entries[2]['host'] == ''
+    assert entries[2]['ip'] == '10.8.2.1'
+    assert entries[2]['query_time'] == 1.25
+
+    # no "SET timestamp", "# Time:" header is used
+    assert entries[3]['timestamp'] == 1542715205.
+    assert entries[3]['host'] == 'localhost'
+
+
+def test_iter_slow_log_entries_without_headers():
+    assert list(iter_slow_log_entries(['SELECT 1;\n', 'SELECT 2;\n'])) == [
+        {'sql': 'SELECT 1;', 'db': None, 'timestamp': None},
+        {'sql': 'SELECT 2;', 'db': None, 'timestamp': None},
+    ]
+
+    # headers and "SET timestamp" apply to the first statement only, "use" to all of them
+    lines = [
+        '# Query_time: 0.5  Lock_time: 0.0 Rows_sent: 1  Rows_examined: 1\n',
+        'use wikicities;\n',
+        'SET timestamp=1542715200;\n',
+        'SELECT *\n',
+        'FROM page;\n',
+        '\n',
+        'SELECT 2\n',
+        'FROM user;\n',
+    ]
+
+    assert list(iter_slow_log_entries(lines)) == [
+        {'sql': 'SELECT * FROM page;', 'db': 'wikicities', 'timestamp': 1542715200.,
+         'query_time': 0.5, 'lock_time': 0.0, 'rows_sent': 1, 'rows_examined': 1},
+        {'sql': 'SELECT 2 FROM user;', 'db': 'wikicities', 'timestamp': None},
+    ]
+
+
+def test_iter_slow_log_entries_followed():
+    # None items of followed lines end complete statements only
+    lines = ['SELECT *\n', None, 'FROM page;\n', None, None, 'SELECT 2;\n']
+
+    assert list(iter_slow_log_entries(lines)) == [
+        None,
+        {'sql': 'SELECT * FROM page;', 'db': None, 'timestamp': None},
+        None,
+        None,
+        {'sql': 'SELECT 2;', 'db': None, 'timestamp': None},
+    ]
+
+
+def test_normalize_slow_log_entry():
+    entries = [
+        normalize_slow_log_entry(entry)
+        for entry in iter_slow_log_queries(join(fixtures_dir, 'slow.log'))
+    ]
+
+    assert entries[0].to_dict() == {
+        'original_query': "SELECT page_id FROM `page` "
+                          "WHERE page_namespace = 0 AND page_title = 'Main_Page' LIMIT 1;",
+        'query': 'SELECT page_id FROM `page` '
+                 'WHERE page_namespace = N AND page_title = X LIMIT N;',
+        'method': 'Title::getArticleID',
+        'dbname': 'wikicities',
+        'source_host': 'ap',
+        'rows': 1,
+        'time': 1.5,
+        'timestamp': 1542715200.,
+    }
+
+    assert entries[2]['method'] == '43fac6df'
+    assert entries[2]['query'] == 'DELETE FROM events_local_users WHERE wiki_id = N AND user_id IN (XYZ);'
+    assert entries[2]['source_host'] == '10.8.2.1'
+    assert entries[2]['time'] == 1250.
@@ -0,0 +1,67 @@
+from pytest import raises
+
+from digest.errors import QueryDigestCommandLineError
+from digest.state import DigestState, HourlyAggregator, filter_since
+
+NOW = 1542717296.0  # 2018-11-20T12:34:56Z
+
+
+def _entry(timestamp, time):
+    return {'query': 'SELECT foo FROM bar', 'method': 'Foo::bar', 'source_host': 'ap',
+            'rows': 1, 'time': time, 'timestamp': timestamp}
+
+
+def test_hourly_aggregator():
+    aggregator = HourlyAggregator().update([
+        _entry(NOW - 7200, 1.),
+        _entry(NOW - 60, 2.),
+        _entry(NOW - 30, 3.),
+    ])
+
+    assert aggregator.total == 3
+    assert aggregator.high_water_mark == NOW - 30
+    assert sorted(aggregator.buckets.keys()) == [1542708000, 1542715200]
+
+
+def test_filter_since():
+    assert filter_since(lambda _: True, None, _entry(NOW, 1.)) is True
+    assert filter_since(lambda _: True, NOW, _entry(NOW, 1.)) is False
+    assert filter_since(lambda _: True, NOW, _entry(NOW + 1, 1.)) is True
+
+
+def test_state_incremental(tmpdir):
+    path = str(tmpdir.join('state.json'))
+
+    state = DigestState.load(path, source='--table=foo')
+    assert state.fetch_period(NOW, 3600) == 3600
+
+    state.fold(HourlyAggregator().update([_entry(NOW - 7200, 1.), _entry(NOW - 60, 2.)]), NOW)
+    state.save()
+
+    # the next run, an hour later
+    now = NOW + 3600
+    state = DigestState.load(path, source='--table=foo')
+
+    assert state.high_water_mark == NOW - 60
+    assert state.fetch_period(now, 3600) == 3661
+
+    state.fold(HourlyAggregator().update([_entry(now - 10, 4.)]), now)
+
+    last_hour = dict(state.aggregate(now, 3600).results())['Foo::bar-ap']
+    assert last_hour['count'] == 2
+    assert last_hour['time_sum'] == 6.
+
+    last_day = dict(state.aggregate(now, 86400).results())['Foo::bar-ap']
+    assert last_day['count'] == 3
+    assert last_day['time_sum'] == 7.
+
+    # stored buckets are left intact by reports
+    assert state.aggregate(now, 86400).total == 3
+
+
+def test_state_source_mismatch(tmpdir):
+    path = str(tmpdir.join('state.json'))
+    DigestState.load(path, source='--table=foo').save()
+
+    with raises(QueryDigestCommandLineError):
+        DigestState.load(path, source='--table=bar')